@@ -0,0 +1,137 @@
+"""
+Time the main operations of the builder on synthetic trees of growing size, and keep the results per commit so that
+regressions show up when comparing two commits.
+
+    python benchmarks/bench_suite.py --sizes 10 1000 10000 50000 --providers memory=3,ogr=1 --joins 100
+    python benchmarks/bench_suite.py --sizes 10 1000 --compare 46bcea9
+
+Results are appended to benchmarks/results.jsonl, one JSON object per commit, parameters and size.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+# synthetic puts project_builder on the path
+from synthetic import make_tree, write_config, add_generator_arguments
+from config_parser import load_config
+from qgis_session import QgisSession
+from qgis_config_manager import create_project_tree_from_dict, open_project, create_dict_from_project_tree
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, 'results.jsonl')
+STAGES = ('load_config', 'create_project_tree_from_dict', 'project.write', 'open_project',
+          'create_dict_from_project_tree')
+
+
+def git_commit() -> str:
+    """
+    The short hash of the checked out commit, followed by + when the working tree has uncommitted changes.
+    """
+    def git(*args):
+        return subprocess.run(('git',) + args, cwd=BENCH_DIR, capture_output=True, text=True).stdout.strip()
+    commit = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    return commit + ('+' if git('status', '--porcelain', '--untracked-files=no') else '')
+
+
+def bench_size(layer_count, params, work_dir, deferred_validation=False) -> dict:
+    """
+    Time every stage on one synthetic tree.
+    :return: a dictionary mapping each stage of STAGES to its duration in seconds
+    """
+    tree = make_tree(layer_count, params['depth'], params['fan_out'], params['providers'], params['joins'],
+                     os.path.join(work_dir, 'data'), params['seed'])
+    config_path = os.path.join(work_dir, 'tree_{}.yml'.format(layer_count))
+    project_path = os.path.join(work_dir, 'project_{}.qgz'.format(layer_count))
+    write_config(tree, config_path)
+    timings = {}
+
+    start = time.perf_counter()
+    tree = load_config(config_path, cache=None)
+    timings['load_config'] = time.perf_counter() - start
+
+    project = QgisSession.instance().project()
+    start = time.perf_counter()
+    create_project_tree_from_dict(tree, project, deferred_validation)
+    timings['create_project_tree_from_dict'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    project.write(project_path)
+    timings['project.write'] = time.perf_counter() - start
+    project.clear()
+
+    start = time.perf_counter()
+    with open_project(project_path) as project:
+        timings['open_project'] = time.perf_counter() - start
+        start = time.perf_counter()
+        create_dict_from_project_tree(project)
+        timings['create_dict_from_project_tree'] = time.perf_counter() - start
+    return timings
+
+
+def load_results(results_path) -> list:
+    if not os.path.exists(results_path):
+        return []
+    with open(results_path) as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+def find_baseline(records, commit, params, layer_count, ref=None):
+    """
+    Find the record to compare with: the latest one of commit ref, or of the latest other commit by default.
+    """
+    for record in reversed(records):
+        if record['params'] != params or record['layers'] != layer_count:
+            continue
+        if ref is not None and record['commit'].startswith(ref) or ref is None and record['commit'] != commit:
+            return record
+    return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the builder on synthetic trees.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 50000],
+                        help='numbers of layers')
+    add_generator_arguments(parser)
+    parser.add_argument('--deferred-validation', action='store_true')
+    parser.add_argument('--results', default=DEFAULT_RESULTS, help='JSON lines file keeping the results')
+    parser.add_argument('--compare', default=None, metavar='COMMIT',
+                        help='commit to compare with, the latest other commit by default')
+    parser.add_argument('--no-save', action='store_true', help='do not append the results')
+    args = parser.parse_args(argv)
+
+    params = {'depth': args.depth, 'fan_out': args.fan_out, 'providers': args.providers, 'joins': args.joins,
+              'seed': args.seed, 'deferred_validation': args.deferred_validation}
+    commit = git_commit()
+    previous = load_results(args.results)
+    records = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for layer_count in args.sizes:
+            timings = bench_size(layer_count, params, work_dir, args.deferred_validation)
+            record = {'commit': commit, 'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                      'python': platform.python_version(), 'params': params, 'layers': layer_count,
+                      'timings': timings}
+            records.append(record)
+            baseline = find_baseline(previous, commit, params, layer_count, args.compare)
+            print('{} layers{}'.format(layer_count, ', compared with ' + baseline['commit'] if baseline else ''))
+            for stage in STAGES:
+                line = '  {:<32}{:10.3f}s'.format(stage, timings[stage])
+                if baseline and baseline['timings'].get(stage):
+                    line += '  {:+7.1f}%'.format((timings[stage] / baseline['timings'][stage] - 1) * 100)
+                print(line)
+    QgisSession.instance().exit()
+
+    if not args.no_save:
+        with open(args.results, 'a') as results:
+            for record in records:
+                results.write(json.dumps(record) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""
+Time create_project_tree_from_dict on wide synthetic trees of memory layers of several sizes, and fail when the time
+per layer of the largest trees grows beyond the smallest one: a linear builder keeps it flat.
+
+    python benchmarks/bench_tree_builder.py 1000 2000 5000 10000 --max-growth 1.5
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project_builder'))
+
+from qgis_session import QgisSession                            # noqa: E402
+from qgis_config_manager import create_project_tree_from_dict   # noqa: E402
+from synthetic import make_tree                                 # noqa: E402
+
+LAYERS_PER_GROUP = 1000
+# Allowed ratio between the time per layer of a size and of the smallest size, some noise is expected.
+MAX_GROWTH = 1.5
+
+
+def make_wide_tree(layer_count) -> dict:
+    """
+    Create a tree dictionary of memory layers spread over groups of LAYERS_PER_GROUP layers.
+    :param layer_count: number of layers in the tree
+    :return: a layer tree dictionary
+    """
+    return make_tree(layer_count, depth=1, fan_out=max(1, -(-layer_count // LAYERS_PER_GROUP)))
+
+
+def bench(layer_counts) -> list:
+    session = QgisSession.instance()
+    results = []
+    for layer_count in layer_counts:
+        tree = make_wide_tree(layer_count)
+        project = session.project()
+        start = time.perf_counter()
+        create_project_tree_from_dict(tree, project)
+        seconds = time.perf_counter() - start
+        results.append((layer_count, seconds))
+        print('{:>7} layers: {:8.3f}s  {:8.1f}us/layer'.format(layer_count, seconds, seconds / layer_count * 1e6))
+    session.project()
+    return results
+
+
+def scaling_problems(results, max_growth=MAX_GROWTH) -> list:
+    """
+    Compare the time per layer of each size with the one of the smallest size.
+    :param results: the (layer count, seconds) pairs returned by bench
+    :param max_growth: allowed ratio between the time per layer of a size and of the smallest size
+    :return: a message for each size growing more than allowed, empty if the scaling is linear
+    """
+    results = sorted(results)
+    base_count, base_seconds = results[0]
+    base = base_seconds / base_count
+    problems = []
+    for layer_count, seconds in results[1:]:
+        growth = seconds / layer_count / base
+        if growth > max_growth:
+            problems.append('{} layers: {:.2f}x the time per layer of {} layers, more than {:.2f}x'.format(
+                layer_count, growth, base_count, max_growth))
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Check that building the layer tree scales linearly.')
+    parser.add_argument('sizes', type=int, nargs='*', default=[1000, 2000, 5000, 10000], help='numbers of layers')
+    parser.add_argument('--max-growth', type=float, default=MAX_GROWTH,
+                        help='allowed ratio between the time per layer of a size and of the smallest size')
+    args = parser.parse_args(argv)
+    if len(args.sizes) < 2:
+        parser.error('at least two sizes are needed to measure the scaling')
+
+    results = bench(args.sizes)
+    QgisSession.instance().exit()
+    problems = scaling_problems(results, args.max_growth)
+    for problem in problems:
+        print('not linear: ' + problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Generate synthetic layer tree configs and projects of any size, to measure how the builder scales.
+
+    python benchmarks/synthetic.py 10000 --depth 3 --fan-out 8 --providers memory=2,ogr=1 --joins 100 -o big.yml
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project_builder'))
+
+from qgs_writer import layer_id, write_project_file     # noqa: E402
+
+# Uri of the postgres stand-in, a local database that does not need to exist when the validation is deferred.
+POSTGRES_URI = os.environ.get('BENCH_POSTGRES_URI', "dbname='bench' host=localhost port=5432 sslmode=disable")
+MEMORY_URI = 'Point?crs=EPSG:2056&field=id:integer&field=name:string'
+# ogr layers share a pool of files, so that 50k layers do not mean 50k files.
+OGR_FILE_COUNT = 100
+FEATURES_PER_FILE = 10
+
+
+def parse_providers(spec) -> dict:
+    """
+    Parse a provider mix such as 'memory=2,ogr=1,postgres=1' into a dictionary of weights.
+    """
+    providers = {}
+    for part in spec.split(','):
+        provider, _, weight = part.partition('=')
+        providers[provider.strip()] = float(weight or 1)
+    unknown = set(providers) - {'memory', 'ogr', 'postgres'}
+    if unknown:
+        raise ValueError('Unknown providers {}.'.format(', '.join(sorted(unknown))))
+    return providers
+
+
+def write_ogr_files(data_dir, count=OGR_FILE_COUNT) -> list:
+    """
+    Write small GeoJSON point files to use as ogr datasources.
+    :return: the list of file paths
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(data_dir, 'points_{}.geojson'.format(i))
+        features = [{'type': 'Feature', 'properties': {'id': j, 'name': 'point {}'.format(j)},
+                     'geometry': {'type': 'Point', 'coordinates': [2600000 + 100 * j, 1200000 + 100 * i]}}
+                    for j in range(FEATURES_PER_FILE)]
+        with open(path, 'w') as geojson:
+            json.dump({'type': 'FeatureCollection', 'features': features}, geojson)
+        paths.append(path)
+    return paths
+
+
+def make_tree(layer_count, depth=2, fan_out=10, providers=None, join_count=0, data_dir=None, seed=0) -> dict:
+    """
+    Create a synthetic layer tree dictionary. Layers are spread round robin over the leaf groups of a tree of the given
+    depth and fan-out, groups are only created when they hold layers.
+    :param layer_count: number of layers
+    :param depth: number of group levels above the layers, 0 puts every layer at the root
+    :param fan_out: number of sub-groups of each group
+    :param providers: a dictionary of provider weights, e.g. {'memory': 2, 'ogr': 1}, memory layers only by default
+    :param join_count: number of joins, each one between two vector layers of the tree
+    :param data_dir: directory receiving the files of the ogr layers, required when ogr is in the mix
+    :param seed: seed of the provider draw, the same arguments always give the same tree
+    :return: a layer tree dictionary
+    """
+    providers = providers or {'memory': 1}
+    if providers.get('ogr') and data_dir is None:
+        raise ValueError('A data directory is required for ogr layers.')
+    ogr_paths = write_ogr_files(data_dir) if providers.get('ogr') else []
+    draw = random.Random(seed).choices(list(providers), weights=list(providers.values()), k=layer_count)
+    leaf_count = fan_out ** depth
+
+    tree = {}
+    layers = []
+    for i, provider in enumerate(draw):
+        group, path, leaf = tree, (), i % leaf_count
+        for level in range(depth):
+            key = 'group_{}_{}'.format(level, (leaf // fan_out ** (depth - level - 1)) % fan_out)
+            group = group.setdefault(key, {})
+            path += (key,)
+        name = 'layer_{}'.format(i)
+        if provider == 'ogr':
+            uri = ogr_paths[i % len(ogr_paths)]
+        elif provider == 'postgres':
+            uri = POSTGRES_URI + ' key=\'id\' table="bench"."points_{}" (geom)'.format(i % OGR_FILE_COUNT)
+        else:
+            uri = MEMORY_URI
+        group[name] = {'URI': uri, 'NAME': name, 'PROVIDER': provider, 'ISVISIBLE': i % 3 != 0, 'CRS': 'EPSG:2056',
+                       'JOINS': {}}
+        layers.append((path + (name,), group[name]))
+
+    for j in range(min(join_count, layer_count * (layer_count - 1))):
+        source_path, source = layers[j % layer_count]
+        target_path, target = layers[(j + 1 + (j // layer_count) % (layer_count - 1)) % layer_count]
+        source['JOINS'][len(source['JOINS'])] = {
+            'join_layer_id': layer_id(target['NAME'], target_path), 'join_field_name': 'id',
+            'target_field_name': 'id', 'memory_cache': False, 'prefix': '{}_'.format(target['NAME']),
+            'field_subset': None}
+    return tree
+
+
+def write_config(tree_dict, config_path) -> None:
+    """
+    Save a layer tree dictionary as a YAML config.
+    """
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    with open(config_path, 'w') as yml:
+        yaml.dump(tree_dict, yml, Dumper=dumper, sort_keys=False)
+
+
+def write_project(tree_dict, project_path, crs='EPSG:2056') -> None:
+    """
+    Save a layer tree dictionary as a QGIS project, written offline so that huge projects are quick to generate.
+    """
+    write_project_file(tree_dict, project_path, crs=crs, title=os.path.basename(project_path))
+
+
+def add_generator_arguments(parser) -> None:
+    parser.add_argument('--depth', type=int, default=2, help='number of group levels')
+    parser.add_argument('--fan-out', type=int, default=10, help='sub-groups per group')
+    parser.add_argument('--providers', type=parse_providers, default={'memory': 1},
+                        help='provider mix, e.g. memory=2,ogr=1,postgres=1')
+    parser.add_argument('--joins', type=int, default=0, help='number of joins')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Generate a synthetic layer tree config or project.')
+    arg_parser.add_argument('layers', type=int, help='number of layers')
+    arg_parser.add_argument('-o', '--output', required=True, help='.yml config, or .qgs/.qgz project')
+    arg_parser.add_argument('--data-dir', default=None,
+                            help='directory of the ogr files, next to the output by default')
+    add_generator_arguments(arg_parser)
+    args = arg_parser.parse_args()
+    data = args.data_dir or os.path.join(os.path.dirname(os.path.abspath(args.output)), 'synthetic_data')
+    synthetic_tree = make_tree(args.layers, args.depth, args.fan_out, args.providers, args.joins, data, args.seed)
+    if args.output.lower().endswith(('.qgs', '.qgz')):
+        write_project(synthetic_tree, args.output)
+    else:
+        write_config(synthetic_tree, args.output)
@@ -0,0 +1,164 @@
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import yaml
+
+PROJECT_EXTENSIONS = ('.qgs', '.qgz')
+OUTPUT_FORMATS = {'yaml': '.yml', 'json': '.json'}
+SUMMARY_NAME = 'summary'
+
+
+def find_projects(source) -> list:
+    """
+    List the QGIS projects to process.
+    :param source: a directory (searched recursively) or a glob pattern
+    :return: the sorted list of project paths
+    """
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '**', '*')
+    else:
+        pattern = source
+    return sorted(p for p in glob.glob(pattern, recursive=True)
+                  if os.path.isfile(p) and p.lower().endswith(PROJECT_EXTENSIONS))
+
+
+def write_tree(tree_dict, output_path, output_format='yaml') -> None:
+    """
+    Save a layer tree dictionary to a file.
+    :param tree_dict: the layer tree dictionary
+    :param output_path: path of the output file
+    :param output_format: 'yaml' or 'json'
+    """
+    with open(output_path, 'w') as outfile:
+        if output_format == 'json':
+            json.dump(tree_dict, outfile, ensure_ascii=False, indent=2)
+        else:
+            yaml.dump(tree_dict, outfile, allow_unicode=True)
+
+
+def _init_worker() -> None:
+    """
+    Start the QGIS session of a worker process, it is then reused for every project the worker receives.
+    """
+    import atexit
+    from qgis_session import QgisSession
+    atexit.register(QgisSession.instance().exit)
+    QgisSession.instance().start()
+
+
+def output_paths(projects, source, output_dir, output_format='yaml') -> dict:
+    """
+    Choose the output file of each project, mirroring the directory of the project relative to the source under
+    output_dir so that projects with the same name in different directories do not overwrite each other. Projects
+    of the same directory differing only by extension (a.qgs and a.qgz) keep their extension in the output name, and
+    the summary file name is reserved.
+    :param projects: the project paths, as returned by find_projects
+    :param source: the directory or glob pattern the projects were found with
+    :param output_dir: directory receiving the extracted trees
+    :param output_format: 'yaml' or 'json'
+    :return: a dictionary mapping each project path to its output path
+    """
+    if os.path.isdir(source):
+        root = source
+    else:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in projects]) if projects else '.'
+    extension = OUTPUT_FORMATS[output_format]
+    taken = {os.path.join(output_dir, SUMMARY_NAME + extension)}
+    paths = {}
+    for project_path in projects:
+        relative = os.path.relpath(os.path.abspath(project_path), os.path.abspath(root))
+        stem, project_extension = os.path.splitext(relative)
+        output_path = os.path.join(output_dir, stem + extension)
+        if output_path in taken:
+            output_path = os.path.join(output_dir, stem + '_' + project_extension.lstrip('.') + extension)
+        taken.add(output_path)
+        paths[project_path] = output_path
+    return paths
+
+
+def extract_project(project_path, output_path, output_format='yaml') -> dict:
+    """
+    Extract the layer tree of one project and save it. Errors are reported in the result instead of being raised so
+    that one broken project does not stop a batch.
+    :param project_path: path to the QGIS project
+    :param output_path: file receiving the extracted tree, its directory is created if needed
+    :param output_format: 'yaml' or 'json'
+    :return: a dictionary describing the outcome
+    """
+    from qgis_config_manager import open_project, create_dict_from_project_tree
+
+    start = time.perf_counter()
+    result = {'project': project_path, 'output': output_path}
+    try:
+        with open_project(project_path) as qgs_project:
+            tree_dict = create_dict_from_project_tree(qgs_project)
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        write_tree(tree_dict, output_path, output_format)
+        result['status'] = 'success'
+    except Exception as e:
+        result['status'] = 'failure'
+        result['error'] = '{}: {}'.format(type(e).__name__, e)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def extract_projects(source, output_dir, output_format='yaml', workers=None) -> dict:
+    """
+    Extract the layer tree of every project found in a directory or glob, fanning the projects out over a pool of
+    processes. Each worker holds its own QGIS session, threads cannot be used because QgsProject is a singleton.
+    :param source: a directory or a glob pattern
+    :param output_dir: directory receiving one file per project, see output_paths, and the summary
+    :param output_format: 'yaml' or 'json'
+    :param workers: number of worker processes, defaults to the number of cores
+    :return: a summary of the successes, failures and timings
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError('Output format must be one of {}.'.format(', '.join(OUTPUT_FORMATS)))
+    os.makedirs(output_dir, exist_ok=True)
+    projects = find_projects(source)
+    outputs = output_paths(projects, source, output_dir, output_format)
+
+    start = time.perf_counter()
+    results = []
+    if projects:
+        # Spawned workers do not inherit any QGIS state from the parent process
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as executor:
+            futures = [executor.submit(extract_project, p, outputs[p], output_format) for p in projects]
+            for future in as_completed(futures):
+                result = future.result()
+                print('{status}: {project} ({seconds}s)'.format(**result))
+                results.append(result)
+
+    results.sort(key=lambda r: r['project'])
+    summary = {
+        'succeeded': sum(r['status'] == 'success' for r in results),
+        'failed': sum(r['status'] == 'failure' for r in results),
+        'seconds': round(time.perf_counter() - start, 3),
+        'projects': results,
+    }
+    write_tree(summary, os.path.join(output_dir, SUMMARY_NAME + OUTPUT_FORMATS[output_format]), output_format)
+    return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Extract the layer tree of many QGIS projects in parallel.')
+    parser.add_argument('source', help='directory containing the projects, or a glob pattern')
+    parser.add_argument('output_dir', help='directory receiving the extracted trees and the summary')
+    parser.add_argument('-f', '--format', choices=sorted(OUTPUT_FORMATS), default='yaml')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    summary = extract_projects(args.source, args.output_dir, args.format, args.workers)
+    print('{} succeeded, {} failed in {}s'.format(summary['succeeded'], summary['failed'], summary['seconds']))
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import socketserver
+from contextlib import nullcontext
+
+from config_parser import load_config, add_cache_arguments, cache_from_args
+from profiling import phase, profiling
+from style_store import StyleStore
+from config_validator import check_tree
+
+
+class ConfigStore:
+    """
+    Parsed configurations kept in memory, parsed again only when their file changes. A file that fails to load keeps
+    failing with the same error, without being parsed again, until it changes. With a DiskCache, e.g.
+    config_parser.CONFIG_CACHE, the configurations parsed by a previous daemon or build are not parsed again either.
+    """
+    def __init__(self, cache=None):
+        self._configs = {}
+        self._cache = cache
+
+    @staticmethod
+    def _stamp(path) -> tuple:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def get(self, path) -> dict:
+        """
+        Get the parsed content of a configuration file.
+        :param path: path to the configuration file in yaml
+        :return: a dictionary containing the parameters values
+        """
+        path = os.path.abspath(path)
+        stamp = self._stamp(path)
+        cached = self._configs.get(path)
+        if cached is None or cached[0] != stamp:
+            try:
+                cached = (stamp, load_config(path, self._cache), None)
+            except Exception as e:
+                cached = (stamp, None, e)
+            self._configs[path] = cached
+        if cached[2] is not None:
+            raise cached[2]
+        return cached[1]
+
+    def changed(self, path) -> bool:
+        """
+        Tell if a configuration file changed since it was last read with get.
+        """
+        path = os.path.abspath(path)
+        try:
+            stamp = self._stamp(path)
+        except FileNotFoundError:
+            return False
+        return path not in self._configs or self._configs[path][0] != stamp
+
+
+class BuildDaemon:
+    """
+    Long-running build server keeping a QGIS session and the parsed configurations in memory. Requests are JSON
+    objects sent on one line over a Unix domain socket, the response is a JSON object on one line. Requests are
+    handled one at a time in the thread running serve(), as QGIS projects must be.
+
+    {"action": "build", "config": "tree.yml", "output": "project.qgz", "crs": "EPSG:2056", "deferred_validation": true,
+     "styles": "styles"}
+    {"action": "extract", "project": "project.qgz", "output": "tree.yml", "format": "yaml"}
+    {"action": "watch", "config": "tree.yml", "output": "project.qgz"} rebuilds the project when the config changes
+    {"action": "ping"} and {"action": "shutdown"}
+    Any request can add "profile": "timings.json" (and "profile_format": "chrome") to save the timings of its phases.
+    A client has request_timeout seconds to send its request and read the response, so that a stuck client does not
+    block the daemon.
+    """
+    def __init__(self, socket_path, poll_interval=1.0, config_cache=None, request_timeout=10.0):
+        self._socket_path = socket_path
+        self._poll_interval = poll_interval
+        self._request_timeout = request_timeout
+        self._configs = ConfigStore(config_cache)
+        self._watched = {}          # config path -> {output path: build request}
+        self._running = False
+        self._handlers = {'ping': self._ping, 'build': self._build, 'extract': self._extract,
+                          'watch': self._watch, 'shutdown': self._shutdown}
+
+    @property
+    def socket_path(self):
+        return self._socket_path
+
+    def serve(self) -> None:
+        """
+        Serve requests until a shutdown request is received. Watched configurations are checked between requests.
+        A socket file left by a daemon that died is replaced, but not the socket of a running daemon. The socket is
+        only accessible to the user running the daemon.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self._socket_path)
+            except FileNotFoundError:
+                pass
+            except ConnectionRefusedError:                      # nobody listens, the file is stale
+                os.remove(self._socket_path)
+            else:
+                raise OSError('A daemon is already listening on {}.'.format(self._socket_path))
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = self._request_timeout
+
+            def handle(self):
+                try:
+                    line = self.rfile.readline()
+                    response = daemon.handle(line)
+                    self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+                except socket.timeout:
+                    print('Dropped a client that timed out')
+
+        server = socketserver.UnixStreamServer(self._socket_path, Handler)
+        os.chmod(self._socket_path, 0o600)
+        server.timeout = self._poll_interval
+        self._running = True
+        try:
+            while self._running:
+                server.handle_request()
+                self._rebuild_changed()
+        finally:
+            server.server_close()
+            os.remove(self._socket_path)
+            if 'qgis_session' in sys.modules:
+                sys.modules['qgis_session'].QgisSession.instance().exit()
+
+    def handle(self, line) -> dict:
+        """
+        Run one request.
+        :param line: the JSON encoded request
+        :return: the response, with a status of 'ok' or 'error'
+        """
+        start = time.perf_counter()
+        try:
+            request = json.loads(line)
+            handler = self._handlers.get(request.get('action'))
+            if handler is None:
+                raise ValueError('Unknown action {}.'.format(request.get('action')))
+            if request.get('profile'):
+                context = profiling(request['profile'], request.get('profile_format', 'json'))
+            else:
+                context = nullcontext()
+            with context:
+                response = handler(request)
+            response['status'] = 'ok'
+        except Exception as e:
+            response = {'status': 'error', 'error': '{}: {}'.format(type(e).__name__, e)}
+        response['seconds'] = round(time.perf_counter() - start, 3)
+        return response
+
+    def _ping(self, request) -> dict:
+        return {'pid': os.getpid()}
+
+    def _shutdown(self, request) -> dict:
+        self._running = False
+        return {}
+
+    def _build(self, request) -> dict:
+        tree_dict = self._configs.get(request['config'])
+        with phase('validate config'):
+            check_tree(tree_dict)                                   # fail before QGIS gets involved
+        # QGIS is imported on the first build, then stays warm
+        from qgis.core import QgsCoordinateReferenceSystem
+        from qgis_session import QgisSession
+        from qgis_config_manager import create_project_tree_from_dict
+
+        project = QgisSession.instance().project()
+        try:
+            if request.get('crs'):
+                project.setCrs(QgsCoordinateReferenceSystem(request['crs']))
+            style_store = StyleStore(request['styles']) if request.get('styles') else None
+            invalid_layers = create_project_tree_from_dict(tree_dict, project,
+                                                           request.get('deferred_validation', False),
+                                                           style_store=style_store)
+            with phase('QgsProject.write', path=request['output']):
+                written = project.write(request['output'])
+            if not written:
+                raise IOError('Could not write {}.'.format(request['output']))
+            return {'output': request['output'], 'invalid_layers': [layer.name() for layer in invalid_layers]}
+        finally:
+            project.clear()
+
+    def _extract(self, request) -> dict:
+        from qgis_config_manager import open_project, iter_project_tree_items
+        from tree_export import export_tree
+
+        with open_project(request['project']) as qgs_project:
+            export_tree(iter_project_tree_items(qgs_project.layerTreeRoot()), request['output'],
+                        request.get('format', 'yaml'))
+        return {'output': request['output']}
+
+    def _watch(self, request) -> dict:
+        build_request = dict(request, action='build')
+        path = os.path.abspath(request['config'])
+        # Watching the same config and output again replaces the previous request instead of building twice
+        self._watched.setdefault(path, {})[os.path.abspath(request['output'])] = build_request
+        return self._build(build_request)
+
+    def _rebuild_changed(self) -> None:
+        for path, build_requests in self._watched.items():
+            if self._configs.changed(path):
+                for build_request in build_requests.values():
+                    response = self.handle(json.dumps(build_request))
+                    print('Rebuilt {} ({status}, {seconds}s)'.format(build_request['output'], **response))
+
+
+def send_request(socket_path, request, timeout=None) -> dict:
+    """
+    Send a request to a running BuildDaemon and wait for its response.
+    :param socket_path: path of the Unix domain socket of the daemon
+    :param request: the request dictionary
+    :param timeout: seconds to wait for the response, forever by default
+    :return: the response dictionary
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as response:
+            return json.loads(response.readline())
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Warm QGIS project build daemon.')
+    parser.add_argument('socket', help='path of the Unix domain socket')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve = subparsers.add_parser('serve', help='run the daemon')
+    serve.add_argument('--poll-interval', type=float, default=1.0, help='seconds between checks of watched configs')
+    serve.add_argument('--request-timeout', type=float, default=10.0,
+                       help='seconds a client has to send its request and read the response')
+    add_cache_arguments(serve)
+    build = subparsers.add_parser('build', help='build a project from a config')
+    build.add_argument('config')
+    build.add_argument('output')
+    build.add_argument('--crs', default=None)
+    build.add_argument('--deferred-validation', action='store_true')
+    build.add_argument('--watch', action='store_true', help='rebuild the project whenever the config changes')
+    build.add_argument('--profile', default=None, help='file receiving the timings of the build')
+    build.add_argument('--styles', default=None, help='style store directory of the STYLE references')
+    extract = subparsers.add_parser('extract', help='extract the layer tree of a project')
+    extract.add_argument('project')
+    extract.add_argument('output')
+    extract.add_argument('-f', '--format', default='yaml')
+    subparsers.add_parser('ping')
+    subparsers.add_parser('shutdown')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        BuildDaemon(args.socket, args.poll_interval, cache_from_args(args), args.request_timeout).serve()
+        return 0
+    if args.command == 'build':
+        request = {'action': 'watch' if args.watch else 'build', 'config': os.path.abspath(args.config),
+                   'output': os.path.abspath(args.output), 'crs': args.crs,
+                   'deferred_validation': args.deferred_validation,
+                   'profile': os.path.abspath(args.profile) if args.profile else None,
+                   'styles': os.path.abspath(args.styles) if args.styles else None}
+    elif args.command == 'extract':
+        request = {'action': 'extract', 'project': os.path.abspath(args.project),
+                   'output': os.path.abspath(args.output), 'format': args.format}
+    else:
+        request = {'action': args.command}
+    response = send_request(args.socket, request)
+    print(json.dumps(response, indent=2))
+    return 0 if response['status'] == 'ok' else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,65 @@
+import os
+import argparse
+import hashlib
 from pathlib import Path
 from typing import TextIO
 
 import yaml
 
+from disk_cache import DiskCache, DEFAULT_CACHE_DIR
 
-def load_config(conf_file) -> dict:
+# Use the libyaml C loader when PyYAML was built with it.
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# Shared cache of parsed configurations, load_config only uses it when given explicitly. The build entry points
+# use it unless --no-cache is given, see add_cache_arguments.
+CONFIG_CACHE = DiskCache(os.path.join(DEFAULT_CACHE_DIR, 'configs'), max_bytes=64 * 1024 * 1024)
+_MISSING = object()
+
+
+def load_config(conf_file, cache=None) -> dict:
     """
-    Load a configuration file after checking if the file exists.
+    Load a configuration file after checking if the file exists. With a cache, parsed configurations are stored on
+    disk, keyed by path, modification time and content hash, so an unchanged file is never parsed twice.
     :rtype: dict
     :param str conf_file: path to the configuration file in yaml
+    :param cache: the DiskCache of parsed configurations, e.g. CONFIG_CACHE, None to always parse the file
     :return: a dictionary containing the parameters values
     """
     try:
-        with open(conf_file) as yml:
-            conf = yaml.safe_load(yml)
+        with open(conf_file, 'rb') as yml:
+            content = yml.read()
+            mtime = os.fstat(yml.fileno()).st_mtime_ns
     except FileNotFoundError:
         raise FileNotFoundError
+
+    if cache is None:
+        return yaml.load(content, Loader=SafeLoader)
+
+    key = (os.path.abspath(conf_file), mtime, hashlib.sha256(content).hexdigest())
+    conf = cache.get(key, default=_MISSING)
+    if conf is _MISSING:
+        conf = yaml.load(content, Loader=SafeLoader)
+        cache.put(key, conf)
     return conf
 
+
+def add_cache_arguments(parser, default=True) -> None:
+    """
+    Add the --cache/--no-cache option choosing if the parsed configs are kept in CONFIG_CACHE.
+    :param parser: the command line parser
+    :param default: True if the cache is used when neither option is given
+    """
+    parser.add_argument('--cache', action=argparse.BooleanOptionalAction, default=default,
+                        help='keep the parsed configs in the disk cache')
+
+
+def cache_from_args(args):
+    """
+    Get the config cache chosen by the option added by add_cache_arguments.
+    :return: CONFIG_CACHE, or None when the configs are always parsed
+    """
+    return CONFIG_CACHE if args.cache else None
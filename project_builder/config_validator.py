@@ -0,0 +1,195 @@
+"""
+Check layer tree configs against the schema the builder expects, without importing QGIS, so that a malformed config
+is reported with the path of every problem instead of failing in the middle of a build.
+
+    python project_builder/config_validator.py configs/*.yml
+"""
+import re
+import sys
+import argparse
+from collections import namedtuple
+
+import yaml
+
+from config_parser import load_config, add_cache_arguments, cache_from_args
+from tree_dict import LAYER_DICT_KEYS, OPTIONAL_LAYER_KEYS, is_layer_dict, VECTOR_PROVIDERS, RASTER_PROVIDERS
+from join_resolver import LayerIdRemap
+from qgs_writer import layer_id
+
+# Types of the values of a layer dictionary and of a join dictionary.
+LAYER_TYPES = {'URI': str, 'NAME': str, 'PROVIDER': str, 'ISVISIBLE': bool, 'CRS': str, 'JOINS': dict, 'STYLE': str,
+               'METADATA': dict}
+JOIN_TYPES = {'join_layer_id': str, 'join_field_name': str, 'target_field_name': str, 'memory_cache': bool,
+              'prefix': str, 'field_subset': (list, type(None))}
+# Hints of join_resolver.LayerIdRemap a join dictionary may have on top of JOIN_TYPES.
+OPTIONAL_JOIN_TYPES = {'join_layer_uri': str, 'join_layer_name': str}
+# An authority and a code (EPSG:2056, IGNF:LAMB93...), or a PROJ or WKT definition. Empty means no CRS.
+CRS_PATTERN = re.compile(r'[A-Za-z][\w-]*:[\w.-]+|(?:PROJ4?|WKT):.+', re.DOTALL)
+STYLE_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+
+class ConfigProblem(namedtuple('ConfigProblem', ['path', 'message'])):
+    """
+    A problem of a config, path being the tuple of keys leading to the faulty value.
+    """
+    __slots__ = ()
+
+    def __str__(self):
+        return '{}: {}'.format('/'.join(str(key) for key in self.path) or '/', self.message)
+
+
+def validate_tree(tree_dict) -> list:
+    """
+    Check a layer tree dictionary: the keys and value types of the layers and of their joins, the providers, the CRS
+    strings and that every join points to a layer of the tree.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :return: the list of the ConfigProblem found, in tree order, empty if the tree can be built
+    """
+    if not isinstance(tree_dict, dict):
+        return [ConfigProblem((), 'expected a mapping of groups and layers, got {}'.format(_type_name(tree_dict)))]
+    problems = []
+    layers = []
+    joins = []
+    _check_group(tree_dict, (), problems, layers, joins)
+
+    # Joins are resolved the way resolve_layer_joins does, against the ids the layers get in a built project
+    remap = LayerIdRemap((layer_id(layer['NAME'], path), layer['NAME'], layer['URI']) for path, layer in layers)
+    providers = {layer_id(layer['NAME'], path): layer['PROVIDER'] for path, layer in layers}
+    for path, join_dict in joins:
+        join_layer_id = remap.resolve(join_dict)
+        if join_layer_id is None:
+            problems.append(ConfigProblem(path + ('join_layer_id',), 'no layer of the tree matches {}, or several '
+                                          'layers of different sources do'.format(join_dict['join_layer_id'])))
+        elif providers[join_layer_id] not in VECTOR_PROVIDERS:
+            problems.append(ConfigProblem(path + ('join_layer_id',), 'the joined layer must be a vector layer'))
+    return problems
+
+
+def _check_group(group, path, problems, layers, joins) -> None:
+    for key, item in group.items():
+        item_path = path + (key,)
+        if not isinstance(key, str):
+            problems.append(ConfigProblem(item_path, 'names must be strings, got {}'.format(_type_name(key))))
+        if is_layer_dict(item) or isinstance(item, dict) and ('URI' in item or 'PROVIDER' in item):
+            _check_layer(item, item_path, problems, layers, joins)
+        elif isinstance(item, dict):
+            _check_group(item, item_path, problems, layers, joins)
+        elif item is None:
+            problems.append(ConfigProblem(item_path, 'no content, use {} for an empty group'))
+        elif not isinstance(item, str):                 # a deep string item adds two empty groups
+            problems.append(ConfigProblem(item_path, 'expected a group or a layer, got {}'.format(_type_name(item))))
+
+
+def _check_layer(layer, path, problems, layers, joins) -> None:
+    """
+    Check a layer dictionary. The layer is appended to layers, and its well formed joins to joins, as soon as it can
+    be the target of a join.
+    """
+    missing = [k for k in LAYER_DICT_KEYS if k not in layer]
+    if missing:
+        problems.append(ConfigProblem(path, 'missing key(s) {}'.format(', '.join(missing))))
+    unknown = [str(k) for k in layer if k not in LAYER_DICT_KEYS and k not in OPTIONAL_LAYER_KEYS]
+    if unknown:
+        problems.append(ConfigProblem(path, 'unknown key(s) {}'.format(', '.join(unknown))))
+    if not _check_types(layer, LAYER_TYPES, path, problems):
+        return
+    if all(k in layer for k in ('URI', 'NAME', 'PROVIDER')):
+        layers.append((path, layer))
+
+    if 'NAME' in layer and not layer['NAME']:
+        problems.append(ConfigProblem(path + ('NAME',), 'empty layer name'))
+    provider = layer.get('PROVIDER')
+    if provider is not None and provider not in VECTOR_PROVIDERS + RASTER_PROVIDERS:
+        problems.append(ConfigProblem(path + ('PROVIDER',), 'unknown provider {}, expected one of {}'.format(
+            provider, ', '.join(VECTOR_PROVIDERS + RASTER_PROVIDERS))))
+    if layer.get('CRS') and not CRS_PATTERN.fullmatch(layer['CRS']):
+        problems.append(ConfigProblem(path + ('CRS',), 'invalid CRS {}, expected e.g. EPSG:2056'.format(layer['CRS'])))
+    if layer.get('STYLE') is not None and not STYLE_PATTERN.fullmatch(layer['STYLE']):
+        problems.append(ConfigProblem(path + ('STYLE',), 'invalid style reference {}'.format(layer['STYLE'])))
+    if layer.get('JOINS') and provider in RASTER_PROVIDERS:
+        problems.append(ConfigProblem(path + ('JOINS',), 'joins are only supported on vector layers'))
+    for key, join_dict in layer.get('JOINS', {}).items():
+        if _check_join(join_dict, path + ('JOINS', key), problems):
+            joins.append((path + ('JOINS', key), join_dict))
+
+
+def _check_join(join_dict, path, problems) -> bool:
+    if not isinstance(join_dict, dict):
+        problems.append(ConfigProblem(path, 'expected a join, got {}'.format(_type_name(join_dict))))
+        return False
+    count = len(problems)
+    missing = [k for k in JOIN_TYPES if k not in join_dict]
+    if missing:
+        problems.append(ConfigProblem(path, 'missing key(s) {}'.format(', '.join(missing))))
+    unknown = [str(k) for k in join_dict if k not in JOIN_TYPES and k not in OPTIONAL_JOIN_TYPES]
+    if unknown:
+        problems.append(ConfigProblem(path, 'unknown key(s) {}'.format(', '.join(unknown))))
+    if _check_types(join_dict, dict(JOIN_TYPES, **OPTIONAL_JOIN_TYPES), path, problems) and \
+            join_dict.get('field_subset') is not None and \
+            not all(isinstance(field, str) for field in join_dict['field_subset']):
+        problems.append(ConfigProblem(path + ('field_subset',), 'expected a list of field names'))
+    return len(problems) == count
+
+
+def _check_types(values, types, path, problems) -> bool:
+    valid = True
+    for key, expected in types.items():
+        if key in values and not isinstance(values[key], expected):
+            names = ' or '.join(_type_name(t) for t in (expected if isinstance(expected, tuple) else (expected,)))
+            problems.append(ConfigProblem(path + (key,), 'expected {}, got {}'.format(names, _type_name(values[key]))))
+            valid = False
+    return valid
+
+
+def _type_name(value) -> str:
+    value_type = value if isinstance(value, type) else type(value)
+    return {str: 'a string', bool: 'a boolean', dict: 'a mapping', list: 'a list', type(None): 'null',
+            int: 'a number', float: 'a number'}.get(value_type, value_type.__name__)
+
+
+def validate_config(conf_file, cache=None) -> list:
+    """
+    Load and check a layer tree config.
+    :param conf_file: path to the configuration file in yaml
+    :param cache: see config_parser.load_config
+    :return: the list of the ConfigProblem found, a file that cannot be read or parsed giving a single problem
+    """
+    try:
+        tree_dict = load_config(conf_file, cache)
+    except FileNotFoundError:
+        return [ConfigProblem((), 'file not found')]
+    except yaml.YAMLError as e:
+        return [ConfigProblem((), 'invalid YAML: {}'.format(e))]
+    return validate_tree(tree_dict)
+
+
+def check_tree(tree_dict) -> None:
+    """
+    Raise a ValueError listing the problems of a layer tree dictionary, if any.
+    """
+    problems = validate_tree(tree_dict)
+    if problems:
+        raise ValueError('Invalid config:\n' + '\n'.join(str(problem) for problem in problems))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Check layer tree configs without starting QGIS.')
+    parser.add_argument('configs', nargs='+', help='YAML configs to check')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print the problems')
+    add_cache_arguments(parser, default=False)
+    args = parser.parse_args(argv)
+
+    invalid = 0
+    for conf_file in args.configs:
+        problems = validate_config(conf_file, cache_from_args(args))
+        for problem in problems:
+            print('{}: {}'.format(conf_file, problem))
+        if problems:
+            invalid += 1
+        elif not args.quiet:
+            print('{}: ok'.format(conf_file))
+    return 1 if invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+from urllib.parse import urlsplit, unquote
+
+from tree_dict import LayerRecord
+
+# Connection keys indexed by UriIndex.
+INDEXED_KEYS = ('service', 'host', 'port', 'dbname', 'user', 'schema', 'table', 'table_name', 'geometry_column',
+                'path', 'layername', 'url')
+# Start of a key=value datasource, e.g. dbname='gis' or service=x. A file path never starts with a bare key.
+_KEY_VALUE_START = re.compile(r'[A-Za-z_]\w*=')
+
+
+def parse_connection_info(uri, provider=None) -> dict:
+    """
+    Split a datasource uri string into a dictionary, with each key/value pair containing a connexion info. Three
+    forms are understood: key=value lists as written by postgres and most database providers, file paths with |
+    separated options as written by ogr/gdal, and & separated parameters as written by wms.
+    Results are cached, parsing the same uri twice costs a dictionary copy.
+    :param uri: a datasource uri, as returned by dataProvider().dataSourceUri()
+    :param provider: the provider key, used to pick the uri form. Guessed from the uri if not given.
+    :return: dict, geometry_column being a list holding the geometry column if there is one
+    """
+    info = dict(_parse_cached(uri, provider))
+    info['geometry_column'] = list(info.get('geometry_column', ()))
+    return info
+
+
+@lru_cache(maxsize=65536)
+def _parse_cached(uri, provider) -> tuple:
+    form = _uri_form(uri, provider)
+    if form == 'wms':
+        info = _parse_parameters(uri)
+    elif form == 'file':
+        info = _parse_file_uri(uri)
+    else:
+        info = _parse_key_values(uri)
+    return tuple(info.items())
+
+
+def _uri_form(uri, provider) -> str:
+    if provider in ('wms', 'wfs', 'wcs', 'arcgismapserver', 'arcgisfeatureserver'):
+        return 'wms'
+    if provider in ('ogr', 'gdal'):
+        return 'file'
+    if provider is None:
+        if 'url=' in uri and '&' in uri:
+            return 'wms'
+        head = uri.split(' ', 1)[0]
+        if _KEY_VALUE_START.match(head):                  # before the | test, sql filters may contain ||
+            return 'key_values'
+        if '=' not in head or '|' in uri or head.startswith(('/', '.')) or head[1:3] == ':\\':
+            return 'file'
+    return 'key_values'
+
+
+def _parse_key_values(uri) -> dict:
+    """
+    Single pass over a key=value datasource, e.g. postgres:
+    dbname='gis' host=db port=5432 table="cad"."parcels" (geom) sql="name" = 'a b'
+    """
+    info = {}
+    i, n = 0, len(uri)
+    while i < n:
+        if uri[i] == ' ':
+            i += 1
+            continue
+        if uri[i] == '(':                                           # (geometry column)
+            end = uri.find(')', i)
+            end = n if end < 0 else end
+            info['geometry_column'] = (uri[i + 1:end],)
+            i = end + 1
+            continue
+
+        start = i
+        while i < n and uri[i] not in '= ':
+            i += 1
+        key = uri[start:i]
+        if i >= n or uri[i] != '=':                                 # lone word, not a key/value pair
+            continue
+        i += 1
+
+        if key == 'sql':                                            # the filter runs until the end of the uri
+            info[key] = uri[i:].strip()
+            break
+        parts = []
+        while True:
+            value, i = _read_value(uri, i)
+            parts.append(value)
+            if i < n and uri[i] == '.' and key == 'table':          # "schema"."table"
+                i += 1
+                continue
+            break
+        info[key] = '.'.join(parts)
+        if key == 'table' and len(parts) == 2:
+            info['schema'], info['table_name'] = parts
+    return info
+
+
+def _read_value(uri, i) -> tuple:
+    """
+    Read a value starting at index i, quoted with ' or " (with backslash escapes) or bare.
+    :return: a tuple (value, index after the value)
+    """
+    n = len(uri)
+    if i < n and uri[i] in '\'"':
+        quote = uri[i]
+        i += 1
+        chars = []
+        while i < n and uri[i] != quote:
+            if uri[i] == '\\' and i + 1 < n:
+                i += 1
+            chars.append(uri[i])
+            i += 1
+        return ''.join(chars), i + 1
+    start = i
+    while i < n and uri[i] != ' ':
+        i += 1
+    return uri[start:i], i
+
+
+def _parse_file_uri(uri) -> dict:
+    """
+    Split a file datasource, e.g. ogr: /data/my roads.gpkg|layername=roads|subset="class" = 'a'
+    """
+    path, *options = uri.split('|')
+    info = {'path': path}
+    for option in options:
+        key, _, value = option.partition('=')
+        info[key] = value
+    return info
+
+
+def _parse_parameters(uri) -> dict:
+    """
+    Split & separated parameters, e.g. wms: crs=EPSG:2056&format=image/png&layers=a&layers=b&url=https://host/wms
+    Repeated keys are joined with commas, the host of the url is extracted.
+    """
+    info = {}
+    for parameter in uri.split('&'):
+        key, _, value = parameter.partition('=')
+        value = unquote(value)
+        info[key] = info[key] + ',' + value if key in info else value
+    if 'url' in info:
+        url = urlsplit(info['url'])
+        if url.hostname:
+            info['host'] = url.hostname
+            if url.port:
+                info['port'] = str(url.port)
+    return info
+
+
+class UriIndex:
+    """
+    Index of the layers of a tree by connection info, answering queries such as "all the layers on host X, database
+    Y" with dictionary lookups instead of parsing every uri again.
+    """
+    def __init__(self, records=()):
+        self._entries = []
+        self._index = defaultdict(set)
+        for group_path, record in records:
+            if isinstance(record, LayerRecord):
+                self.add(group_path, record)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, group_path, record) -> None:
+        """
+        Index a layer.
+        :param group_path: the names of the groups containing the layer
+        :param record: the LayerRecord of the layer
+        """
+        position = len(self._entries)
+        self._entries.append((group_path, record))
+        self._index[('provider', record.provider)].add(position)
+        for key, value in parse_connection_info(record.uri, record.provider).items():
+            if key in INDEXED_KEYS:
+                for v in (value if isinstance(value, list) else [value]):
+                    self._index[(key, v)].add(position)
+
+    def find(self, **criteria) -> list:
+        """
+        Find the layers matching every given connection info, e.g. find(host='db1', table='cad.parcels').
+        :return: a list of (group_path, LayerRecord) tuples, in tree order
+        """
+        if not criteria:
+            return list(self._entries)
+        matches = sorted((self._index.get((k, str(v)), set()) for k, v in criteria.items()), key=len)
+        positions = set.intersection(*matches) if matches[0] else set()
+        return [self._entries[p] for p in sorted(positions)]
+
+    def values(self, key) -> set:
+        """
+        List the distinct values of a connection info, e.g. values('host').
+        """
+        return {v for (k, v), positions in self._index.items() if k == key and positions}
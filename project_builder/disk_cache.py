@@ -0,0 +1,98 @@
+import os
+import pickle
+import hashlib
+import tempfile
+
+DEFAULT_CACHE_DIR = os.environ.get('QGIS_PROJECT_BUILDER_CACHE',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'qgis-project-builder'))
+
+
+class DiskCache:
+    """
+    Values pickled in one file per key under a root directory. When the files weigh more than max_bytes, the least
+    recently used ones are evicted. Only use it with a directory the current user owns: unpickling runs code.
+    """
+    SUFFIX = '.pickle'
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        self._root = root
+        self._max_bytes = max_bytes
+
+    @property
+    def root(self):
+        return self._root
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def _path(self, key) -> str:
+        return os.path.join(self._root, hashlib.sha256(repr(key).encode()).hexdigest() + self.SUFFIX)
+
+    def get(self, key, default=None):
+        """
+        Get the value stored for a key.
+        :param key: any value with a stable repr, e.g. a tuple of strings and numbers
+        :param default: returned when the key is not in the cache or its file cannot be read
+        :return: the cached value
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                stored_key, value = pickle.load(f)
+            os.utime(path)                                      # mark as recently used
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, AttributeError, ImportError, TypeError,
+                IndexError):                                    # truncated files, or classes moved or renamed since
+            return default
+        return value if stored_key == key else default
+
+    def put(self, key, value) -> None:
+        """
+        Store the value of a key, then evict the least recently used entries if the cache is too big. The cache is
+        only an accelerator, so a failure to write is silently ignored.
+        :param key: any picklable value with a stable repr
+        :param value: any picklable value
+        """
+        try:
+            os.makedirs(self._root, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._root, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))               # atomic, readers never see a partial file
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        with os.scandir(self._root) as it:
+            for entry in it:
+                if entry.name.endswith(self.SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self._max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self) -> None:
+        """
+        Remove every entry of the cache.
+        """
+        if not os.path.isdir(self._root):
+            return
+        for name in os.listdir(self._root):
+            if name.endswith(self.SUFFIX):
+                os.remove(os.path.join(self._root, name))
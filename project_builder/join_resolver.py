@@ -0,0 +1,97 @@
+import re
+from collections import defaultdict
+
+# Layer ids generated by QGIS (and by qgs_writer.layer_id): the sanitized layer name followed by a uuid.
+GENERATED_ID = re.compile(r'(?P<name>.*)_[0-9a-f]{8}(?:_[0-9a-f]{4}){3}_[0-9a-f]{12}')
+# Joins to layers with at most this many features use a memory cache with the 'auto' policy.
+MEMORY_CACHE_THRESHOLD = 10000
+# Values of the memory cache policy of use_memory_cache.
+MEMORY_CACHE_POLICIES = ('keep', 'auto', True, False)
+
+
+def sanitize_layer_name(name) -> str:
+    """
+    Sanitize a layer name the way QGIS does when it generates a layer id.
+    """
+    return re.sub(r'\W', '_', name, flags=re.ASCII)
+
+
+class LayerIdRemap:
+    """
+    Table mapping the layer ids found in join dictionaries, which belong to the project the tree was extracted from,
+    to the ids of the layers of the project being built. An id is resolved, in order:
+    - as is, when a layer of the project has this id;
+    - with the optional join_layer_uri and join_layer_name hints of the join dictionary;
+    - with the layer name QGIS put at the start of the id when generating it.
+    A name or uri shared by layers of different sources is ambiguous and resolves to nothing.
+    """
+    def __init__(self, layers=()):
+        self._ids = set()
+        self._by_name = defaultdict(list)
+        self._by_sanitized_name = defaultdict(list)
+        self._by_uri = defaultdict(list)
+        self._uris = {}
+        for layer_id, name, uri in layers:
+            self.add(layer_id, name, uri)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, layer_id, name, uri) -> None:
+        """
+        Register a layer of the project being built.
+        """
+        self._ids.add(layer_id)
+        self._uris[layer_id] = uri
+        self._by_name[name].append(layer_id)
+        self._by_sanitized_name[sanitize_layer_name(name)].append(layer_id)
+        self._by_uri[uri].append(layer_id)
+
+    def _unique(self, candidates):
+        if candidates and len({self._uris[c] for c in candidates}) == 1:
+            return candidates[0]
+        return None
+
+    def resolve(self, join_dict):
+        """
+        Find the new id of the layer a join points to.
+        :param join_dict: a join dictionary, as created by get_vector_join_info_as_dict
+        :return: the layer id, or None if the layer cannot be found or is ambiguous
+        """
+        old_id = join_dict['join_layer_id']
+        if old_id in self._ids:
+            return old_id
+        if join_dict.get('join_layer_uri'):
+            candidates = self._by_uri.get(join_dict['join_layer_uri'], [])
+            if join_dict.get('join_layer_name') and len(candidates) > 1:
+                candidates = [c for c in candidates if c in self._by_name.get(join_dict['join_layer_name'], ())]
+            if candidates:
+                return candidates[0]
+        if join_dict.get('join_layer_name'):
+            found = self._unique(self._by_name.get(join_dict['join_layer_name']))
+            if found is not None:
+                return found
+        match = GENERATED_ID.fullmatch(old_id or '')
+        if match:
+            return self._unique(self._by_sanitized_name.get(match.group('name')))
+        return None
+
+
+def use_memory_cache(policy, join_dict, feature_count, threshold=MEMORY_CACHE_THRESHOLD) -> bool:
+    """
+    Decide if a join caches the joined layer in memory.
+    :param policy: 'keep' the memory_cache value of the join dictionary, 'auto' to cache the joined layers with at most
+        threshold features, or True/False to force it for every join
+    :param join_dict: the join dictionary
+    :param feature_count: number of features of the joined layer, negative when unknown
+    :param threshold: the feature count limit of the 'auto' policy
+    :return: bool
+    :raise ValueError: when the policy is not one of MEMORY_CACHE_POLICIES
+    """
+    if policy not in MEMORY_CACHE_POLICIES:
+        raise ValueError('Unknown memory cache policy {}.'.format(policy))
+    if policy == 'keep':
+        return bool(join_dict['memory_cache'])
+    if policy == 'auto':
+        return 0 <= feature_count <= threshold
+    return bool(policy)
@@ -0,0 +1,268 @@
+"""
+Collect the extent, feature count, geometry type, fields and spatial index presence of the layers of a tree, querying
+the datasources concurrently and keeping the results on disk so that a repeated audit only queries the sources that
+changed.
+
+    python project_builder/layer_metadata.py project.qgz -o audit.yml --workers 16 --timeout 30
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from config_parser import load_config, add_cache_arguments, cache_from_args
+from datasource_uri import parse_connection_info
+from disk_cache import DiskCache, DEFAULT_CACHE_DIR
+from qgz_reader import read_dict_from_project_file, FILE_PROVIDERS
+from tree_dict import is_layer_dict, iter_layer_dicts
+from tree_export import export_tree, EXPORT_FORMATS
+
+# Seconds the metadata of a source without modification marker (a database, a web service) stays cached.
+DEFAULT_TTL = 24 * 3600
+DEFAULT_TIMEOUT = 60
+# Queries that timed out but may still be running, beyond which the next sources are not queried.
+DEFAULT_MAX_ABANDONED = 8
+
+
+class LayerMetadata(namedtuple('LayerMetadata', ['extent', 'feature_count', 'geometry_type', 'fields',
+                                                 'spatial_index', 'error'],
+                               defaults=(None, -1, None, (), None, None))):
+    """
+    Metadata of a datasource. extent is a (xmin, ymin, xmax, ymax) tuple or None, feature_count is -1 when unknown,
+    fields a tuple of (name, type name) tuples and spatial_index None when the provider cannot tell. error is the
+    reason the source could not be queried, the other values being left to their defaults.
+    """
+    __slots__ = ()
+
+    def to_dict(self) -> dict:
+        """
+        The metadata as plain lists and dictionaries, for the METADATA key of a layer dictionary.
+        """
+        if self.error is not None:
+            return {'error': self.error}
+        return {'extent': list(self.extent) if self.extent is not None else None, 'feature_count': self.feature_count,
+                'geometry_type': self.geometry_type, 'fields': [{'name': n, 'type': t} for n, t in self.fields],
+                'spatial_index': self.spatial_index}
+
+
+def source_marker(provider, uri):
+    """
+    The modification marker of a file datasource: the modification time and size of the file, and for shapefiles
+    the presence of their .qix spatial index.
+    :return: a tuple, or None for sources that are not files or files that cannot be read
+    """
+    if provider not in FILE_PROVIDERS:
+        return None
+    info = parse_connection_info(uri, provider)
+    path = info.get('path') or info.get('dbname')
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    marker = (stat.st_mtime_ns, stat.st_size)
+    if path.lower().endswith('.shp'):
+        marker += (os.path.exists(path[:-4] + '.qix'),)
+    return marker
+
+
+def query_layer_metadata(provider, uri) -> LayerMetadata:
+    """
+    Open a datasource with a provider created and destroyed in the calling thread and read its metadata. QGIS must
+    have been started, e.g. with QgisSession.instance().start().
+    :param provider: the provider key
+    :param uri: the datasource uri
+    :return: a LayerMetadata
+    """
+    from qgis.core import QgsProviderRegistry, QgsDataProvider, QgsVectorDataProvider, QgsFeatureSource, QgsWkbTypes
+
+    data_provider = QgsProviderRegistry.instance().createProvider(provider, uri, QgsDataProvider.ProviderOptions())
+    if data_provider is None or not data_provider.isValid():
+        return LayerMetadata(error='invalid datasource')
+    extent = data_provider.extent()
+    extent = None if extent.isNull() else (extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum())
+    if not isinstance(data_provider, QgsVectorDataProvider):
+        return LayerMetadata(extent)
+    spatial_index = {QgsFeatureSource.SpatialIndexPresent: True,
+                     QgsFeatureSource.SpatialIndexNotPresent: False}.get(data_provider.hasSpatialIndex())
+    return LayerMetadata(extent, data_provider.featureCount(), QgsWkbTypes.displayString(data_provider.wkbType()),
+                         tuple((field.name(), field.typeName()) for field in data_provider.fields()), spatial_index)
+
+
+class MetadataCache:
+    """
+    Metadata of datasources kept on disk, keyed by provider, uri and modification marker. The metadata of a file is
+    reused until the file changes. Sources without a marker are queried again once their metadata is older than ttl
+    seconds. Failed queries are not kept, they are tried again on the next audit. The metadata is stored as a plain
+    tuple, so that entries do not depend on the module LayerMetadata was loaded from.
+    """
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, 'metadata'), ttl=DEFAULT_TTL, timeout=DEFAULT_TIMEOUT,
+                 query=query_layer_metadata, max_bytes=64 * 1024 * 1024, max_abandoned=DEFAULT_MAX_ABANDONED):
+        """
+        :param root: directory of the cache
+        :param ttl: seconds the metadata of a source without modification marker stays valid
+        :param timeout: seconds a source is given to answer
+        :param query: the function reading the metadata of a (provider, uri) source, query_layer_metadata by default
+        :param max_bytes: size of the cache on disk, see DiskCache
+        :param max_abandoned: number of timed out queries that may still be running, the next sources fail without
+            being queried once it is reached
+        """
+        self._store = DiskCache(root, max_bytes)
+        self._ttl = ttl
+        self._timeout = timeout
+        self._query = query
+        self._max_abandoned = max_abandoned
+        self._abandoned = []
+        self._lock = threading.Lock()
+        self.query_count = 0
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def abandoned(self) -> int:
+        """
+        The number of timed out queries still running.
+        """
+        with self._lock:
+            self._abandoned = [thread for thread in self._abandoned if thread.is_alive()]
+            return len(self._abandoned)
+
+    def join_abandoned(self, timeout=None) -> int:
+        """
+        Wait for the timed out queries to end, which must be done before QGIS is exited as they run in its providers.
+        :param timeout: seconds to wait for all of them, forever by default
+        :return: the number of queries still running
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            threads = list(self._abandoned)
+        for thread in threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return self.abandoned
+
+    def _run_query(self, provider, uri) -> LayerMetadata:
+        """
+        Run a query in its own thread and give up after timeout seconds. The thread of a source that never answers is
+        kept in the abandoned ones and the worker calling this method is freed for the next source, unless
+        max_abandoned threads are already stuck.
+        """
+        if self.abandoned >= self._max_abandoned:
+            return LayerMetadata(error='not queried, {} sources are not answering'.format(self._max_abandoned))
+        with self._lock:
+            self.query_count += 1
+        result = []
+
+        def run():
+            try:
+                result.append(self._query(provider, uri))
+            except Exception as e:
+                result.append(LayerMetadata(error='{}: {}'.format(type(e).__name__, e)))
+        thread = threading.Thread(target=run, name='metadata {}'.format(provider), daemon=True)
+        thread.start()
+        thread.join(self._timeout)
+        if not result:
+            with self._lock:
+                self._abandoned.append(thread)
+            return LayerMetadata(error='timed out after {}s'.format(self._timeout))
+        return result[0]
+
+    def get(self, provider, uri) -> LayerMetadata:
+        """
+        Get the metadata of a datasource, from the disk while the source is unchanged.
+        :param provider: the provider key
+        :param uri: the datasource uri
+        :return: a LayerMetadata
+        """
+        marker = source_marker(provider, uri)
+        key = (provider, uri, marker)
+        cached = self._store.get(key)
+        if cached is not None and (marker is not None or time.time() - cached[0] < self._ttl):
+            return LayerMetadata(*cached[1])
+        metadata = self._run_query(provider, uri)
+        if metadata.error is None:
+            self._store.put(key, (time.time(), tuple(metadata)))
+        return metadata
+
+    def collect(self, sources, max_workers=8) -> dict:
+        """
+        Get the metadata of many datasources, each distinct source once and the sources concurrently.
+        :param sources: an iterable of (provider, uri) tuples
+        :param max_workers: maximum number of sources queried at the same time
+        :return: a dictionary mapping each (provider, uri) tuple to its LayerMetadata
+        """
+        sources = list(dict.fromkeys(sources))                                       # unique, order preserved
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return dict(zip(sources, executor.map(lambda source: self.get(*source), sources)))
+
+
+def enrich_tree_dict(tree_dict, cache=None, max_workers=8) -> dict:
+    """
+    Add the metadata of every layer of a tree under the METADATA key of its dictionary.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :param cache: the MetadataCache used to query the sources, one under the default directory if not given
+    :param max_workers: maximum number of sources queried at the same time
+    :return: a copy of the tree, the layer dictionaries being copied with their METADATA added
+    """
+    cache = cache if cache is not None else MetadataCache()
+    metadata = cache.collect(((layer['PROVIDER'], layer['URI']) for _, _, layer in iter_layer_dicts(tree_dict)),
+                             max_workers)
+
+    def copy(node):
+        enriched = {}
+        for key, item in node.items():
+            if is_layer_dict(item):
+                enriched[key] = dict(item, METADATA=metadata[(item['PROVIDER'], item['URI'])].to_dict())
+            elif isinstance(item, dict):
+                enriched[key] = copy(item)
+            else:
+                enriched[key] = item
+        return enriched
+    return copy(tree_dict)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Collect the metadata of the layers of a config or project.')
+    parser.add_argument('source', help='YAML config, or .qgs/.qgz project read without opening it in QGIS')
+    parser.add_argument('-o', '--output', required=True, help='file receiving the tree with the metadata')
+    parser.add_argument('-f', '--format', default='yaml', choices=EXPORT_FORMATS)
+    parser.add_argument('--workers', type=int, default=8, help='sources queried at the same time')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds a source is given to answer')
+    parser.add_argument('--ttl', type=int, default=DEFAULT_TTL,
+                        help='seconds the metadata of databases and web services stays cached')
+    add_cache_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.source.lower().endswith(('.qgs', '.qgz')):
+        tree_dict = read_dict_from_project_file(args.source)
+    else:
+        tree_dict = load_config(args.source, cache_from_args(args))
+    from qgis_session import QgisSession
+    QgisSession.instance().start()
+    cache = MetadataCache(ttl=args.ttl, timeout=args.timeout)
+    try:
+        start = time.perf_counter()
+        enriched = enrich_tree_dict(tree_dict, cache, args.workers)
+    finally:
+        # exitQgis unloads the providers, it must not run under a query that timed out but is still in one
+        if cache.join_abandoned(args.timeout) == 0:
+            QgisSession.instance().exit()
+        else:
+            print('{} source(s) still not answering, QGIS is left running'.format(cache.abandoned))
+    export_tree(enriched.items(), args.output, args.format)
+    failed = [layer for _, _, layer in iter_layer_dicts(enriched) if 'error' in layer['METADATA']]
+    for layer in failed:
+        print('{}: {}'.format(layer['NAME'], layer['METADATA']['error']))
+    print('{} source(s) queried in {:.1f}s'.format(cache.query_count, time.perf_counter() - start))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
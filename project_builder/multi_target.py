@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import argparse
+
+from config_parser import load_config, add_cache_arguments, cache_from_args
+from tree_dict import is_layer_dict
+from wms_cache import CapabilitiesCache, DEFAULT_TTL
+from profiling import phase, add_profile_arguments, profiling_from_args
+from style_store import StyleStore
+
+
+def merge_tree(base, *overrides) -> dict:
+    """
+    Merge override trees into a base layer tree dictionary, without modifying any of them. Dictionaries are merged
+    recursively, so an override only needs the path to the values it changes, e.g.
+    {'group': {'layer': {'ISVISIBLE': False}}}. A None value removes the key from the tree, and a complete layer
+    dictionary replaces the layer as a whole.
+    :param base: the base layer tree dictionary
+    :param overrides: the override dictionaries, applied in order
+    :return: the merged layer tree dictionary
+    """
+    merged = base
+    for override in overrides:
+        merged = _merge(merged, override or {})
+    return merged
+
+
+def _merge(base, override) -> dict:
+    merged = dict(base)
+    for key, value in override.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and not is_layer_dict(value) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def build_targets(base_tree, targets, deferred_validation=False, max_workers=8, capabilities_cache=None,
+                  style_store=None) -> dict:
+    """
+    Build several projects from one base tree in this process. Layers with the same URI, provider and CRS are
+    created and validated once and reused by every target.
+    :param base_tree: the base layer tree dictionary
+    :param targets: an iterable of (output_path, overrides, crs) tuples, overrides being a list of override
+        dictionaries and crs the authid of the project CRS or None
+    :param deferred_validation: see create_project_tree_from_dict
+    :param max_workers: see create_project_tree_from_dict
+    :param capabilities_cache: see create_project_tree_from_dict
+    :param style_store: see create_project_tree_from_dict
+    :return: a dictionary mapping each output path to the names of its invalid layers
+    """
+    from qgis.core import QgsCoordinateReferenceSystem
+    from qgis_session import QgisSession
+    from qgis_config_manager import create_project_tree_from_dict, LayerCache
+
+    layer_cache = LayerCache()
+    results = {}
+    for output_path, overrides, crs in targets:
+        project = QgisSession.instance().project()
+        try:
+            if crs:
+                project.setCrs(QgsCoordinateReferenceSystem(crs))
+            invalid_layers = create_project_tree_from_dict(merge_tree(base_tree, *overrides), project,
+                                                           deferred_validation, max_workers, layer_cache,
+                                                           capabilities_cache, style_store)
+            with phase('QgsProject.write', path=output_path):
+                written = project.write(output_path)
+            if not written:
+                raise IOError('Could not write {}.'.format(output_path))
+            results[output_path] = [layer.name() for layer in invalid_layers]
+        finally:
+            layer_cache.release(project)
+            project.clear()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Build one QGIS project per override file from a base layer tree.')
+    parser.add_argument('base', help='base layer tree YAML')
+    parser.add_argument('overrides', nargs='+', help='override YAML files, one project is built for each')
+    parser.add_argument('-o', '--output-dir', default='.', help='directory receiving the projects')
+    parser.add_argument('--crs', default=None, help='project CRS, e.g. EPSG:2056')
+    parser.add_argument('--deferred-validation', action='store_true', help='check the datasources concurrently')
+    parser.add_argument('--wms-ttl', type=int, default=DEFAULT_TTL, help='seconds wms capabilities stay cached')
+    parser.add_argument('--wms-offline', action='store_true', help='only use the cached wms capabilities')
+    parser.add_argument('--styles', default=None, help='style store directory of the STYLE references')
+    add_cache_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    from qgis_session import QgisSession
+    os.makedirs(args.output_dir, exist_ok=True)
+    config_cache = cache_from_args(args)
+    targets = [(os.path.join(args.output_dir, os.path.splitext(os.path.basename(path))[0] + '.qgz'),
+                [load_config(path, config_cache)], args.crs) for path in args.overrides]
+    start = time.perf_counter()
+    try:
+        with profiling_from_args(args):
+            results = build_targets(load_config(args.base, config_cache), targets, args.deferred_validation,
+                                    capabilities_cache=CapabilitiesCache(ttl=args.wms_ttl, offline=args.wms_offline),
+                                    style_store=StyleStore(args.styles) if args.styles else None)
+    finally:
+        QgisSession.instance().exit()
+    for output_path, invalid_layers in results.items():
+        print('{}: {} invalid layer(s)'.format(output_path, len(invalid_layers)))
+    print('Built {} project(s) in {:.1f}s'.format(len(results), time.perf_counter() - start))
+    return 1 if any(results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import sys
+from collections import defaultdict
+
+from config_parser import load_config, CONFIG_CACHE
+from datasource_uri import parse_connection_info
+from tree_dict import iter_layer_dicts
+
+# Uri keys identifying a postgres connection, passed as is to the driver.
+CONNECTION_KEYS = ('service', 'host', 'port', 'dbname', 'user', 'password', 'sslmode')
+
+COLUMNS_QUERY = """SELECT table_schema, table_name, column_name
+FROM information_schema.columns
+WHERE (table_schema, table_name) IN ({})"""
+
+
+def group_postgres_layers(tree_dict) -> dict:
+    """
+    Group the postgres layers of a layer tree dictionary by connection.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :return: a dictionary mapping a tuple of (key, value) connection parameters to the list of layer checks, each
+        check being a dictionary with the layer NAME, URI, schema, table and geometry column.
+    """
+    groups = defaultdict(list)
+    for _, _, layer in iter_layer_dicts(tree_dict):
+        if layer['PROVIDER'] != 'postgres':
+            continue
+        info = parse_connection_info(layer['URI'], 'postgres')
+        connection = tuple((k, info[k]) for k in CONNECTION_KEYS if k in info)
+        geometry_column = info['geometry_column'][0] if info['geometry_column'] else None
+        groups[connection].append({'NAME': layer['NAME'], 'URI': layer['URI'],
+                                   'schema': info.get('schema', 'public'),
+                                   'table': info.get('table_name', info.get('table', '')),
+                                   'geometry_column': geometry_column})
+    return dict(groups)
+
+
+def check_postgres_layers(tree_dict, connect=None) -> list:
+    """
+    Check that the table and geometry column of every postgres layer exist, before building a project with
+    create_project_tree_from_dict. A single connection and a single catalog query are used per database, whatever
+    the number of layers it serves.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :param connect: a DB-API connect function called with the connection parameters as keywords, psycopg2.connect
+        by default
+    :return: the list of problems found, each one a dictionary with the layer NAME, URI and an error message
+    :raise ImportError: when no connect function is given and psycopg2 is not installed
+    """
+    if connect is None:
+        try:
+            import psycopg2
+        except ImportError as e:
+            raise ImportError('psycopg2 is needed to check postgres layers, install it with '
+                              'pip install psycopg2-binary or pass a connect function.') from e
+        connect = psycopg2.connect
+
+    problems = []
+    for connection, checks in group_postgres_layers(tree_dict).items():
+        try:
+            columns = _fetch_columns(connect, dict(connection), {(c['schema'], c['table']) for c in checks})
+        except Exception as e:
+            problems.extend({'NAME': c['NAME'], 'URI': c['URI'], 'error': 'connection failed: {}'.format(e)}
+                            for c in checks)
+            continue
+
+        for c in checks:
+            table_columns = columns.get((c['schema'], c['table']))
+            if table_columns is None:
+                error = 'missing table {}.{}'.format(c['schema'], c['table'])
+            elif c['geometry_column'] and c['geometry_column'] not in table_columns:
+                error = 'missing geometry column {} in {}.{}'.format(c['geometry_column'], c['schema'], c['table'])
+            else:
+                continue
+            problems.append({'NAME': c['NAME'], 'URI': c['URI'], 'error': error})
+    return problems
+
+
+def _fetch_columns(connect, connection_params, tables) -> dict:
+    """
+    Query the columns of a set of tables in one round trip.
+    :return: a dictionary mapping (schema, table) to the set of its column names
+    """
+    tables = sorted(tables)
+    query = COLUMNS_QUERY.format(', '.join(['(%s, %s)'] * len(tables)))
+    conn = connect(**connection_params)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, [value for table in tables for value in table])
+        columns = defaultdict(set)
+        for schema, table, column in cursor.fetchall():
+            columns[(schema, table)].add(column)
+        return dict(columns)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        raise IndexError('One argument is required.')
+    try:
+        found = check_postgres_layers(load_config(sys.argv[1], CONFIG_CACHE))
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    for problem in found:
+        print('{NAME}: {error}'.format(**problem))
+    sys.exit(1 if found else 0)
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager, nullcontext
+
+from datasource_uri import parse_connection_info
+
+PROFILE_FORMATS = ('json', 'chrome')
+
+_active = None
+
+
+class Profiler:
+    """
+    Collect the timings of the phases of a build or an extraction. Phases are nested context managers, each one
+    recorded with its category (phase or layer), thread and arguments, e.g. the provider and host of a layer.
+    """
+    def __init__(self, cprofile=False):
+        self._origin = time.perf_counter()
+        self._events = []
+        self._lock = threading.Lock()
+        self._cprofile = cProfile.Profile() if cprofile else None
+
+    @property
+    def events(self):
+        return list(self._events)
+
+    @property
+    def cprofile(self):
+        return self._cprofile
+
+    @contextmanager
+    def phase(self, name, category='phase', **args):
+        """
+        Time the code of a with block.
+        :param name: the name of the phase, e.g. 'QgsProject.read'
+        :param category: 'phase' or 'layer'
+        :param args: values describing the phase, the with block can add some to the yielded dictionary
+        """
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._events.append({'name': name, 'category': category, 'start': start - self._origin,
+                                     'duration': end - start, 'thread': threading.get_ident(), 'args': args})
+
+    def summary(self) -> dict:
+        """
+        Sum the durations of the phases by name.
+        :return: a dictionary mapping each phase name to its count and total duration in seconds
+        """
+        totals = {}
+        for event in self._events:
+            if event['category'] == 'phase':
+                total = totals.setdefault(event['name'], {'count': 0, 'duration': 0.0})
+                total['count'] += 1
+                total['duration'] += event['duration']
+        return totals
+
+    def to_json(self) -> dict:
+        return {'summary': self.summary(), 'events': sorted(self._events, key=lambda e: e['start'])}
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Convert the events to the Trace Event Format read by chrome://tracing and Perfetto.
+        """
+        pid = os.getpid()
+        return {'traceEvents': [{'name': e['name'], 'cat': e['category'], 'ph': 'X', 'pid': pid, 'tid': e['thread'],
+                                 'ts': round(e['start'] * 1e6, 1), 'dur': round(e['duration'] * 1e6, 1),
+                                 'args': e['args']} for e in sorted(self._events, key=lambda e: e['start'])],
+                'displayTimeUnit': 'ms'}
+
+    def write(self, output_path, output_format='json') -> None:
+        """
+        Save the timings to a file.
+        :param output_path: path of the output file
+        :param output_format: 'json' or 'chrome'
+        """
+        if output_format not in PROFILE_FORMATS:
+            raise ValueError('Unknown profile format {}.'.format(output_format))
+        document = self.to_chrome_trace() if output_format == 'chrome' else self.to_json()
+        with open(output_path, 'w') as outfile:
+            json.dump(document, outfile, default=str)
+
+
+def active_profiler():
+    """
+    Get the profiler enabled with profiling(), or None when profiling is off.
+    """
+    return _active
+
+
+def phase(name, category='phase', **args):
+    """
+    Time the code of a with block if profiling is on, do nothing otherwise. The block receives the dictionary of
+    arguments to complete, or None when profiling is off.
+    """
+    if _active is None:
+        return nullcontext()
+    return _active.phase(name, category, **args)
+
+
+def layer_phase(name, provider, uri):
+    """
+    Time the creation or the reading of a layer, with its provider and the host (or file) of its datasource.
+    """
+    if _active is None:
+        return nullcontext()
+    return _active.phase(name, 'layer', provider=provider, host=source_host(uri, provider))
+
+
+def source_host(uri, provider=None) -> str:
+    """
+    The server or the file a datasource reads from, to group slow layers by source.
+    """
+    try:
+        info = parse_connection_info(uri, provider)
+    except (ValueError, KeyError):
+        return ''
+    return info.get('host') or info.get('service') or info.get('path', '')
+
+
+@contextmanager
+def profiling(output_path=None, output_format='json', cprofile_path=None):
+    """
+    Turn profiling on for the code of a with block, then save the timings.
+    :param output_path: file receiving the timings, not saved if None
+    :param output_format: 'json' or 'chrome'
+    :param cprofile_path: file receiving the cProfile statistics of the block, cProfile is not run if None
+    :return: the Profiler
+    """
+    global _active
+    previous, profiler = _active, Profiler(cprofile=cprofile_path is not None)
+    _active = profiler
+    if profiler.cprofile is not None:
+        profiler.cprofile.enable()
+    try:
+        yield profiler
+    finally:
+        if profiler.cprofile is not None:
+            profiler.cprofile.disable()
+            profiler.cprofile.dump_stats(cprofile_path)
+        _active = previous
+        if output_path is not None:
+            profiler.write(output_path, output_format)
+
+
+def add_profile_arguments(parser) -> None:
+    """
+    Add the --profile, --profile-format and --cprofile options to a command line parser.
+    """
+    parser.add_argument('--profile', default=None, help='file receiving the timings of the phases and layers')
+    parser.add_argument('--profile-format', choices=PROFILE_FORMATS, default='json',
+                        help='json, or chrome for chrome://tracing and Perfetto')
+    parser.add_argument('--cprofile', default=None, help='file receiving cProfile statistics')
+
+
+def profiling_from_args(args):
+    """
+    Profile according to the options added by add_profile_arguments, a no-op context when none is given.
+    """
+    if args.profile is None and args.cprofile is None:
+        return nullcontext()
+    return profiling(args.profile, args.profile_format, args.cprofile)
@@ -1,16 +1,21 @@
-from qgis.core import QgsApplication, QgsProject, QgsLayerTreeLayer, QgsLayerTreeGroup
-from qgis.gui import QgsMapCanvas
-from typing import Dict, Union, Any
-import yaml
 import sys
+from qgis_session import QgisSession
+from config_parser import load_config, CONFIG_CACHE
+from tree_export import export_tree
+from tree_dict import tree_dict_from_records, LayerRecord
+from tree_filter import filter_tree_dict
+from qgis_config_manager import iter_layer_tree, layer_record_from_node
+from profiling import phase
+from layer_metadata import MetadataCache
 
 
 class QgisProject:
     def __init__(self, qgs_project_path):
         self.__qgs_app = self.__init_app__()
         self._project_path = qgs_project_path
-        self._project = QgsProject().instance()
-        self._project.read(qgs_project_path)
+        self._project = QgisSession.instance().project()
+        with phase('QgsProject.read', path=qgs_project_path):
+            self._project.read(qgs_project_path)
         self._root = self._project.layerTreeRoot()
         self._crs = self._project.crs()
 
@@ -28,34 +33,36 @@ class QgisProject:
 
     @staticmethod
     def __init_app__():
-        qgs = QgsApplication([], False)
-        qgs.setPrefixPath('/usr', True)
-        qgs.initQgis()
-        return qgs
+        return QgisSession.instance().start()
 
 
 class Info:
     def __init__(self, **kwargs):
         self._source_project = kwargs.get('project', None)
         self._source_yaml = kwargs.get('source_yaml', '')
+        self._tree_filter = kwargs.get('tree_filter', None)
+        self._config_cache = kwargs.get('config_cache', CONFIG_CACHE)
 
     @classmethod
-    def from_yaml(cls, yml_path):
+    def from_yaml(cls, yml_path, tree_filter=None, config_cache=CONFIG_CACHE):
         """
         Initialize a QgisLayerTree object from a YAML configuration file.
         :param yml_path: a YAML configuration file
+        :param tree_filter: a tree_filter.TreeFilter keeping a part of the tree only
+        :param config_cache: the DiskCache of parsed configurations, None to always parse the file
         :return: a QgisLayerTree
         """
-        return cls(source_yaml=yml_path)
+        return cls(source_yaml=yml_path, tree_filter=tree_filter, config_cache=config_cache)
 
     @classmethod
-    def from_project(cls, project):
+    def from_project(cls, project, tree_filter=None):
         """
         Initialize a QgisLayerTree object from a QGIS project
         :param project: a QGIS project
+        :param tree_filter: a tree_filter.TreeFilter keeping a part of the tree only
         :return: a QgisLayerTree
         """
-        return cls(project=project)
+        return cls(project=project, tree_filter=tree_filter)
 
 
 class QgisLayerTreeInfo(Info):
@@ -86,8 +93,11 @@ class QgisLayerTreeInfo(Info):
         :rtype: dict
         :return: a dictionary containing the groups and layers specified in the YAML file.
         """
-        with open(self._source_yaml) as yml:
-            return yaml.safe_load(yml)
+        with phase('QgisLayerTreeInfo.from_yaml', path=self._source_yaml):
+            tree_dict = load_config(self._source_yaml, self._config_cache)
+            if self._tree_filter is not None:
+                tree_dict = filter_tree_dict(tree_dict, self._tree_filter)
+            return tree_dict
 
     def _create_dict_from_project(self) -> dict:
         """
@@ -95,84 +105,101 @@ class QgisLayerTreeInfo(Info):
         :rtype: dict
         :return: a dictionary containing the groups and layers present in the project.
         """
-        # Recursive function that saves each tree element into a dictionary.
-        def recursive(parent):
-            layer_tree: Dict[str, Union[Dict[str, str], Any]] = {}  # Initiate the receiving dictionary
-            for child in parent.children():  # Loop through children
-                if isinstance(child, QgsLayerTreeLayer):  # If child is a layer, save layer info
-                    info = LayerInfo(child)
-                    layer_tree[child.name()] = info.info_dict
-                elif isinstance(child, QgsLayerTreeGroup):  # If child is a group, enters a deeper level in the dict
-                    layer_tree[child.name()] = recursive(child)  # Child becomes a parent and repeat
-            return layer_tree
-        return recursive(self._root)
+        with phase('QgisLayerTreeInfo.from_project'):
+            return tree_dict_from_records(iter_layer_tree(self._root, tree_filter=self._tree_filter),
+                                          keys=LayerInfo.INFO_KEYS)
+
+    def iter_layers(self):
+        """
+        Lazily walk the layer tree, from the project or from the YAML dictionary.
+        :return: a generator of (group_path, record) tuples
+        """
+        if self._source_project:
+            return iter_layer_tree(self._root, tree_filter=self._tree_filter)
+        return iter_layer_tree(self._tree_dict)                 # already filtered
+
+    def layer_metadata(self, cache=None, max_workers=8) -> dict:
+        """
+        Query the extent, feature count, geometry type, fields and spatial index of the layers concurrently.
+        :param cache: a layer_metadata.MetadataCache, one under the default directory if not given
+        :param max_workers: maximum number of sources queried at the same time
+        :return: a dictionary mapping the (provider, uri) of each layer to its LayerMetadata
+        """
+        cache = cache if cache is not None else MetadataCache()
+        return cache.collect(((record.provider, record.uri) for _, record in self.iter_layers()
+                              if isinstance(record, LayerRecord)), max_workers)
 
     def write_dict_to_yaml(self, yml_path):
         """
         Save the layer tree dictionary to a specified YAML path.
         :param yml_path:
         """
-        with open(yml_path, 'w') as outfile:
-            yaml.dump(self._tree_dict, outfile, allow_unicode=True)
+        export_tree(self._tree_dict.items(), yml_path)
 
 
 class LayerInfo:
-    def __init__(self, child=None):
-        self.__layer = child.layer()
-        self._uri = self.__layer.dataProvider().dataSourceUri()
-        self._name = self.__layer.name()
-        self._provider = self.__layer.dataProvider().name()
-        self._crs = self.__layer.crs().authid()
-        self._isvisible = child.isVisible()
+    __slots__ = ('_record',)
+    INFO_KEYS = ('URI', 'NAME', 'PROVIDER', 'CRS', 'ISVISIBLE')
+
+    def __init__(self, child=None, record=None):
+        self._record = record if record is not None else layer_record_from_node(child)
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Initialize a LayerInfo from a LayerRecord, as yielded by iter_layer_tree.
+        :param record: a LayerRecord
+        :return: a LayerInfo
+        """
+        return cls(record=record)
+
+    @property
+    def record(self):
+        return self._record
 
     @property
     def uri(self):
-        return self._uri
+        return self._record.uri
 
     @uri.setter
     def uri(self, new_uri):
-        self._uri = new_uri
+        self._record = self._record._replace(uri=new_uri)
 
     @property
     def name(self):
-        return self._name
+        return self._record.name
 
     @name.setter
     def name(self, new_name):
-        self._name = new_name
+        self._record = self._record._replace(name=new_name)
 
     @property
     def provider(self):
-        return self._provider
+        return self._record.provider
 
     @provider.setter
     def provider(self, new_provider):
-        self._provider = new_provider
+        self._record = self._record._replace(provider=new_provider)
 
     @property
     def crs(self):
-        return self._crs
+        return self._record.crs
 
     @crs.setter
     def crs(self, new_crs):
-        self._crs = new_crs
+        self._record = self._record._replace(crs=new_crs)
 
     @property
     def isvisible(self):
-        return self._isvisible
+        return self._record.isvisible
 
     @isvisible.setter
     def isvisible(self, new_isvisible):
-        self._crs = new_isvisible
+        self._record = self._record._replace(isvisible=new_isvisible)
 
     @property
     def info_dict(self):
-        return {'URI': self._uri,
-                'NAME': self._name,
-                'PROVIDER': self._provider,
-                'CRS': self._crs,
-                'ISVISIBLE': self._isvisible
-                }
+        return self._record.to_dict(self.INFO_KEYS)
 
 
 if __name__ == '__main__':
@@ -1,13 +1,20 @@
-import sys
-import os
-import yaml
-import re
+import argparse
 from pathlib import Path
 from contextlib import contextmanager
-from typing import Dict, Union, Any
-from collections import Counter
-from qgis.core import QgsLayerTreeLayer, QgsLayerTreeGroup, QgsProject, QgsApplication, QgsVectorLayer, \
-    QgsRasterLayer, QgsCoordinateReferenceSystem, QgsVectorLayerJoinInfo
+from concurrent.futures import ThreadPoolExecutor
+from qgis.core import QgsLayerTreeLayer, QgsLayerTreeGroup, QgsProject, QgsVectorLayer, QgsRasterLayer, \
+    QgsCoordinateReferenceSystem, QgsVectorLayerJoinInfo, QgsDataProvider, QgsProviderRegistry
+from qgis.PyQt.QtXml import QDomDocument
+from qgis_session import QgisSession
+from datasource_uri import parse_connection_info
+from tree_dict import is_layer_dict, iter_tree_dict, tree_dict_from_records, LayerRecord, GroupRecord, \
+    VECTOR_PROVIDERS, RASTER_PROVIDERS
+from tree_diff import diff_trees, LAYER_FIELDS
+from tree_export import export_tree
+from profiling import phase, layer_phase, source_host, add_profile_arguments, profiling_from_args
+from style_store import StyleStore, default_style_dir
+from join_resolver import LayerIdRemap, use_memory_cache, MEMORY_CACHE_THRESHOLD, MEMORY_CACHE_POLICIES
+from tree_filter import filter_tree_dict, add_filter_arguments, filter_from_args
 
 
 @contextmanager
@@ -22,17 +29,13 @@ def open_project(projects_path):
     except FileNotFoundError as fe:
         raise fe
 
-    # Link to the QGIS application
-    qgs = QgsApplication([], False)
-    # Supply path to qgis install location
-    qgs.setPrefixPath('/usr', True)
-    # Load providers
-    qgs.initQgis()
-    project = QgsProject.instance()
+    # Get a cleared project from the process-wide QGIS session
+    project = QgisSession.instance().project()
 
     try:
         print("Opening project: " + projects_path)
-        project.read(projects_path)
+        with phase('QgsProject.read', path=projects_path):
+            project.read(projects_path)
         yield project
     except Exception as e:
         raise e
@@ -41,35 +44,115 @@ def open_project(projects_path):
         project.clear()
 
 
-def create_dict_from_project_tree(qgs_project) -> dict:
+def create_dict_from_project_tree(qgs_project, style_store=None, tree_filter=None) -> dict:
     """
     Create a dictionary of the layer tree from a QGIS project. Contains some metadata about each layer in the tree.
     :param qgs_project: A QGIS project to extract the layer tree from.
+    :param style_store: a StyleStore receiving the style of every layer, referenced by the STYLE key of the layers
+    :param tree_filter: a tree_filter.TreeFilter selecting the part of the tree to extract, the other branches are not
+        visited
     :return: A dictionary that contains the layer tree.
     """
     if type(qgs_project) != QgsProject:
         raise TypeError('Input must be a QgsProject.')
-    # Access the root of the project tree
-    root = qgs_project.layerTreeRoot()
+    with phase('create_dict_from_project_tree'):
+        items = _iter_layer_nodes(qgs_project.layerTreeRoot(), (), tree_filter, [])
+        if style_store is None:
+            records = ((path, record) for path, record, _ in items)
+        else:
+            items = list(items)
+            styles = iter(export_layer_styles([node.layer() for _, record, node in items
+                                               if isinstance(record, LayerRecord)], style_store))
+            records = ((path, record._replace(style=next(styles)) if isinstance(record, LayerRecord) else record)
+                       for path, record, _ in items)
+        return tree_dict_from_records(records)
+
+
+def iter_layer_tree(source, group_path=(), tree_filter=None):
+    """
+    Lazily walk a layer tree depth first, from a QGIS project, a group of its tree or a layer tree dictionary.
+    :param source: a QgsProject, a QgsLayerTreeGroup or a layer tree dictionary
+    :param group_path: path of the groups leading to source
+    :param tree_filter: a tree_filter.TreeFilter, the nodes it rules out are skipped and its pruned branches are not
+        visited
+    :return: a generator of (group_path, record) tuples, the record being a GroupRecord or a LayerRecord and
+        group_path the tuple of the names of the groups containing it
+    """
+    if isinstance(source, dict):
+        if tree_filter is not None:
+            source = filter_tree_dict(source, tree_filter, group_path)
+        yield from iter_tree_dict(source, group_path)
+        return
+    if isinstance(source, QgsProject):
+        source = source.layerTreeRoot()
+    for path, record, _ in _iter_layer_nodes(source, group_path, tree_filter, []):
+        yield path, record
+
+
+def _iter_layer_nodes(group, group_path, tree_filter, pending):
+    """
+    Walk a layer tree group depth first, yielding (group_path, record, node) tuples. With a filter, a group is held in
+    pending until a node it contains is kept, unless the filter keeps it empty.
+    """
+    for child in group.children():                              # Loop through children
+        path = group_path + (child.name(),)
+        if isinstance(child, QgsLayerTreeLayer):                # If child is a layer, yield its record
+            if tree_filter is None:
+                yield group_path, layer_record_from_node(child), child
+            elif tree_filter.accepts_path(path):
+                record = layer_record_from_node(child)
+                if tree_filter.accepts_layer(record):
+                    yield from pending
+                    pending.clear()
+                    yield group_path, record, child
+        elif isinstance(child, QgsLayerTreeGroup):              # If child is a group, yield it then its content
+            entry = (group_path, GroupRecord(child.name(), child.isVisible()), child)
+            if tree_filter is None:
+                yield entry
+            elif not tree_filter.visit_group(path):
+                continue
+            else:
+                pending.append(entry)
+                if tree_filter.keeps_empty_group(path):
+                    yield from pending
+                    pending.clear()
+            yield from _iter_layer_nodes(child, path, tree_filter, pending)
+            if pending and pending[-1] is entry:                # nothing kept in the group
+                pending.pop()
+
 
-    # Recursive function that saves each tree element into a dictionary.
-    def recursive(parent):
-        layer_tree: Dict[str, Union[Dict[str, str], Any]] = {}  # Initiate the receiving dictionary
-        for child in parent.children():                         # Loop through children
-            if isinstance(child, QgsLayerTreeLayer):            # If child is a layer, save layer info
-                layer = child.layer()
-                layer_tree[child.name()] = {
-                    'URI': layer.dataProvider().dataSourceUri(),
-                    'NAME': layer.name(),
-                    'PROVIDER': layer.dataProvider().name(),
-                    'ISVISIBLE': child.isVisible(),
-                    'CRS': layer.crs().authid(),
-                    'JOINS': get_vector_join_info_as_dict(layer),
-                }
-            elif isinstance(child, QgsLayerTreeGroup):          # If child is a group, enters a deeper level in the dict
-                layer_tree[child.name()] = recursive(child)     # Child becomes a parent and repeat
-        return layer_tree
-    return recursive(root)
+def iter_project_tree_items(parent):
+    """
+    Lazily walk a layer tree, yielding (name, value) items where the value is the layer dictionary of a layer, or the
+    items of a group as another generator. Used to stream a project tree to tree_export.export_tree.
+    :param parent: a QgsLayerTreeGroup, e.g. the layerTreeRoot() of a project
+    :return: a generator of (name, value) tuples
+    """
+    for child in parent.children():
+        if isinstance(child, QgsLayerTreeLayer):
+            yield child.name(), layer_record_from_node(child).to_dict()
+        elif isinstance(child, QgsLayerTreeGroup):
+            yield child.name(), iter_project_tree_items(child)
+
+
+def layer_record_from_node(layer_node) -> LayerRecord:
+    """
+    Create the record describing a layer of the tree.
+    :param layer_node: a QgsLayerTreeLayer
+    :return: a LayerRecord
+    """
+    with phase(layer_node.name(), 'layer') as timing:
+        layer = layer_node.layer()
+        record = LayerRecord(key=layer_node.name(),
+                             uri=layer.dataProvider().dataSourceUri(),
+                             name=layer.name(),
+                             provider=layer.dataProvider().name(),
+                             isvisible=layer_node.isVisible(),
+                             crs=layer.crs().authid(),
+                             joins=get_vector_join_info_as_dict(layer) if isinstance(layer, QgsVectorLayer) else {})
+        if timing is not None:
+            timing.update(provider=record.provider, host=source_host(record.uri, record.provider))
+    return record
 
 
 def extract_vector_layer_connection_info(qgs_vector_layer) -> dict:
@@ -78,23 +161,80 @@ def extract_vector_layer_connection_info(qgs_vector_layer) -> dict:
     :param qgs_vector_layer: a QGIS vector layer object
     :return: dict
     """
-    uri = qgs_vector_layer.dataProvider().dataSourceUri()                               # Get the uri string
-    uri_list = uri.replace("'", "").replace('"', '').replace('(', '').replace(')', '')  # Remove special characters
-    geometry_col = re.findall(r"(\w+)$", uri_list)                                      # Extract the geometry column
-    k = re.findall(r"(\w+)=", uri_list)                                                 # Find keys
-    v = re.findall(r"=([\w.]+)", uri_list)                                              # Find values
-
-    connection_info = dict(zip(k, v))                                                   # Zip into a dictionary
-    connection_info['geometry_column'] = geometry_col                                   # Add the geometry column pair
-    return connection_info
+    provider = qgs_vector_layer.dataProvider()
+    return parse_connection_info(provider.dataSourceUri(), provider.name())
 
 
-def save_project_layers_style(qgs_project) -> None:
+def save_project_layers_style(qgs_project, style_store=None, max_workers=8) -> dict:
+    """
+    Save the style of every layer of a project to a style store.
+    :param qgs_project: the QGIS project
+    :param style_store: the StyleStore, by default one in the default_style_dir of the project file
+    :param max_workers: maximum number of style files written at the same time
+    :return: a dictionary mapping each layer id to the reference of its style
+    """
     if type(qgs_project) != QgsProject:
         raise TypeError('Input must be a QgsProject.')
+    if style_store is None:
+        if not qgs_project.fileName():
+            raise ValueError('A style store must be given for a project that was never saved.')
+        style_store = StyleStore(default_style_dir(qgs_project.fileName()))
+
+    layers = list(qgs_project.mapLayers().values())
+    return dict(zip((layer.id() for layer in layers), export_layer_styles(layers, style_store, max_workers)))
 
-    for layer in qgs_project.mapLayers().values():
-        layer.saveNamedStyle(os.path.join('/home/julien/Documents/qgis-project-builder/DATA/symbology', layer.name()+'.qml'))
+
+def export_layer_styles(layers, style_store, max_workers=8) -> list:
+    """
+    Store the styles of layers. The QML documents are exported one by one, QGIS objects being bound to the main
+    thread, then hashed and written concurrently, each distinct document once.
+    :param layers: the map layers
+    :param style_store: the StyleStore
+    :param max_workers: maximum number of style files written at the same time
+    :return: the list of the style references, in the order of the layers
+    """
+    return style_store.put_many(export_style_documents(layers), max_workers)
+
+
+def export_style_documents(layers) -> list:
+    """
+    Export the styles of layers, one by one as QGIS objects are bound to the main thread.
+    :param layers: the map layers
+    :return: the list of the QML documents, in the order of the layers
+    """
+    documents = []
+    for layer in layers:
+        document = QDomDocument('qgis')
+        layer.exportNamedStyle(document)
+        documents.append(document.toString())
+    return documents
+
+
+def apply_layer_styles(layer_styles, style_store, max_workers=8) -> list:
+    """
+    Apply stored styles to layers. Each distinct style is read and parsed once, whatever the number of layers using it.
+    :param layer_styles: an iterable of (layer, style reference) tuples
+    :param style_store: the StyleStore holding the styles
+    :param max_workers: maximum number of style files read at the same time
+    :return: the list of the layers whose style could not be applied, or is missing from the store
+    """
+    layer_styles = list(layer_styles)
+    documents = {}
+    qmls = style_store.get_many((reference for _, reference in layer_styles), max_workers, missing_ok=True)
+    for reference, qml in qmls.items():
+        documents[reference] = QDomDocument('qgis')
+        documents[reference].setContent(qml)
+    failed = []
+    for layer, reference in layer_styles:
+        if reference not in documents:
+            print('Style {} of layer {} is not in {}'.format(reference, layer.name(), style_store.root))
+            failed.append(layer)
+            continue
+        applied, error = layer.importNamedStyle(documents[reference])
+        if not applied:
+            print('Style {} of layer {} was not applied ({})'.format(reference, layer.name(), error))
+            failed.append(layer)
+    return failed
 
 
 def get_vector_join_info_as_dict(qgs_vector_layer) -> dict:
@@ -106,6 +246,9 @@ def get_vector_join_info_as_dict(qgs_vector_layer) -> dict:
             joins[it] = {'join_layer_id': j.joinLayerId(), 'join_field_name': j.joinFieldName(),
                          'target_field_name': j.targetFieldName(), 'memory_cache': j.isUsingMemoryCache(),
                          'prefix': j.prefix(), 'field_subset': j.joinFieldNamesSubset()}
+            if j.joinLayer() is not None:       # hints of join_resolver.LayerIdRemap, the id changes between projects
+                joins[it]['join_layer_uri'] = j.joinLayer().dataProvider().dataSourceUri()
+                joins[it]['join_layer_name'] = j.joinLayer().name()
             it += 1
     except AttributeError:
         print('Ignoring layer {} ({})'.format(qgs_vector_layer.name(), qgs_vector_layer.dataProvider().name()))
@@ -127,47 +270,359 @@ def make_join_from_dict(join_dict) -> QgsVectorLayerJoinInfo:
     return join_object
 
 
-def create_project_tree_from_dict(tree_dict, qgs_project):
+def resolve_layer_joins(joined_layers, qgs_project, memory_cache='keep', threshold=MEMORY_CACHE_THRESHOLD) -> list:
+    """
+    Attach the joins of layers in one pass, once every layer is in the project. The join_layer_id of the join
+    dictionaries, which belong to the project the tree was extracted from, are mapped to the layers of qgs_project
+    with a LayerIdRemap, and each join is given its layer directly so QGIS never looks it up lazily.
+    :param joined_layers: an iterable of (QgsVectorLayer, layer dictionary) tuples
+    :param qgs_project: the project holding the layers and the layers they join
+    :param memory_cache: 'keep' the memory_cache value of the joins, 'auto' to cache the joined layers having at most
+        threshold features, or True/False to force it
+    :param threshold: the feature count limit of the 'auto' policy
+    :return: the list of (layer, join dictionary) tuples whose joined layer was not found
+    """
+    remap = LayerIdRemap((layer.id(), layer.name(), _layer_uri(layer)) for layer in qgs_project.mapLayers().values())
+    feature_counts = {}
+    unresolved = []
+    for layer, layer_dict in joined_layers:
+        for join_dict in layer_dict['JOINS'].values():
+            join_layer_id = remap.resolve(join_dict)
+            join_layer = qgs_project.mapLayer(join_layer_id) if join_layer_id is not None else None
+            if not isinstance(join_layer, QgsVectorLayer):
+                print('Join of layer {} to {} not resolved'.format(layer.name(), join_dict['join_layer_id']))
+                unresolved.append((layer, join_dict))
+                continue
+            if memory_cache == 'auto' and join_layer_id not in feature_counts:
+                feature_counts[join_layer_id] = join_layer.featureCount()
+            cached = use_memory_cache(memory_cache, join_dict, feature_counts.get(join_layer_id, -1), threshold)
+            join_object = make_join_from_dict(dict(join_dict, join_layer_id=join_layer_id, memory_cache=cached))
+            join_object.setJoinLayer(join_layer)
+            layer.addJoin(join_object)
+    return unresolved
+
+
+def _layer_uri(layer) -> str:
+    provider = layer.dataProvider()
+    return provider.dataSourceUri() if provider is not None else layer.source()
+
+
+def create_layer_from_dict(layer_dict, deferred_validation=False):
+    """
+    Create a map layer from a layer dictionary of a tree.
+    :param layer_dict: a dictionary with the URI, NAME, PROVIDER and CRS of the layer
+    :param deferred_validation: when True the provider trusts the datasource and skips its metadata queries, the
+        default style lookup and the extent computation. The source must then be checked with check_layer_sources.
+    :return: a QgsVectorLayer or a QgsRasterLayer
+    """
+    if layer_dict['PROVIDER'] in VECTOR_PROVIDERS:
+        layer_class = QgsVectorLayer
+    elif layer_dict['PROVIDER'] in RASTER_PROVIDERS:
+        layer_class = QgsRasterLayer
+    else:
+        raise ValueError('Unknown provider {} for layer {}.'.format(layer_dict['PROVIDER'], layer_dict['NAME']))
+
+    if deferred_validation:
+        layer = layer_class()                                                       # no datasource, nothing opened
+        flags = QgsDataProvider.ReadFlags() | QgsDataProvider.FlagTrustDataSource
+        layer.setDataSource(layer_dict['URI'], layer_dict['NAME'], layer_dict['PROVIDER'],
+                            QgsDataProvider.ProviderOptions(), flags)
+    else:
+        layer = layer_class(layer_dict['URI'], layer_dict['NAME'], layer_dict['PROVIDER'])
+    layer.setCrs(QgsCoordinateReferenceSystem(layer_dict['CRS']))                   # assign layer crs
+    return layer
+
+
+def check_layer_sources(sources, max_workers=8) -> dict:
+    """
+    Check that datasources are reachable, opening them concurrently on a bounded pool of threads. Each source is
+    opened once by a provider created and destroyed in its worker thread.
+    :param sources: an iterable of (provider, uri) tuples
+    :param max_workers: maximum number of sources opened at the same time
+    :return: a dictionary mapping each (provider, uri) tuple to True if the source could be opened
+    """
+    def check(source):
+        provider = QgsProviderRegistry.instance().createProvider(source[0], source[1],
+                                                                 QgsDataProvider.ProviderOptions())
+        valid = provider is not None and provider.isValid()
+        del provider
+        return valid
+
+    sources = list(dict.fromkeys(sources))                                           # unique, order preserved
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(sources, executor.map(check, sources)))
+
+
+class LayerCache:
+    """
+    Map layers shared by successive builds in one process, keyed by (URI, PROVIDER, CRS, STYLE), so that a layer
+    styled by one build is never handed out with that style to a build wanting another one. A cached layer is taken
+    back from its project with release() before the project is cleared, so the next build reuses the instance, and
+    the validity of its datasource, instead of opening the source again.
+    """
+    def __init__(self):
+        self._layers = {}
+        self._in_use = {}
+        self._valid_sources = {}
+
+    def __len__(self):
+        return len(self._layers)
+
+    @staticmethod
+    def _key(layer_dict) -> tuple:
+        return layer_dict['URI'], layer_dict['PROVIDER'], layer_dict['CRS'], layer_dict.get('STYLE')
+
+    def layer(self, layer_dict, deferred_validation=False):
+        """
+        Get the cached layer of a layer dictionary, or create it with create_layer_from_dict. A layer already used in
+        the current build is not shared, a second instance is created instead.
+        :return: a QgsVectorLayer or a QgsRasterLayer, renamed and without joins
+        """
+        key = self._key(layer_dict)
+        layer = self._layers.get(key)
+        if layer is None or key in self._in_use:
+            layer = create_layer_from_dict(layer_dict, deferred_validation)
+            self._layers.setdefault(key, layer)
+        else:
+            layer.setName(layer_dict['NAME'])
+            if isinstance(layer, QgsVectorLayer):
+                for join in layer.vectorJoins():
+                    layer.removeJoin(join.joinLayerId())
+        if self._layers[key] is layer:
+            self._in_use[key] = layer
+        return layer
+
+    def check_sources(self, sources, max_workers=8) -> dict:
+        """
+        Same as check_layer_sources, sources checked by a previous build are not opened again.
+        """
+        unknown = [source for source in sources if source not in self._valid_sources]
+        self._valid_sources.update(check_layer_sources(unknown, max_workers))
+        return self._valid_sources
+
+    def release(self, qgs_project) -> None:
+        """
+        Take the cached layers used by the last build back from the project, before it is cleared.
+        """
+        for layer in self._in_use.values():
+            qgs_project.takeMapLayer(layer)
+        self._in_use.clear()
+
+
+def create_project_tree_from_dict(tree_dict, qgs_project, deferred_validation=False, max_workers=8,
+                                  layer_cache=None, capabilities_cache=None, style_store=None,
+                                  memory_cache='keep', tree_filter=None) -> list:
     """
     Create a QGIS tree in a project from a dictionary of a tree.
     :param tree_dict: a dictionary container the layer tree including groups, sources, visibility
     :param qgs_project: the qgis within which the tree will be created
+    :param deferred_validation: create the layers without validating their datasource, then check all the sources
+        concurrently once the tree is built
+    :param max_workers: maximum number of sources checked at the same time when the validation is deferred
+    :param layer_cache: a LayerCache reusing the layers of previous builds, release it before clearing the project
+    :param capabilities_cache: a wms_cache.CapabilitiesCache, the capabilities of the wms layers are then fetched
+        once per server before the layers are created
+    :param style_store: the StyleStore holding the styles referenced by the STYLE key of the layers, applied in bulk
+        once every layer is created. Without a store the STYLE keys are ignored.
+    :param memory_cache: the memory cache policy of the joins, see resolve_layer_joins
+    :param tree_filter: a tree_filter.TreeFilter selecting the part of the tree to build, the layers of the other
+        branches are never created
+    :return: the list of layers whose datasource is not valid
     """
     if type(qgs_project) != QgsProject:
         raise TypeError('Input must be a QgsProject.')
+    if memory_cache not in MEMORY_CACHE_POLICIES:                   # fail before any layer is created
+        raise ValueError('Unknown memory cache policy {}.'.format(memory_cache))
+
+    if tree_filter is not None:
+        with phase('filter tree'):
+            tree_dict = filter_tree_dict(tree_dict, tree_filter)
 
+    if capabilities_cache is not None:
+        with phase('prime wms capabilities'):
+            capabilities_cache.prime_tree(tree_dict, max_workers)
     root = qgs_project.layerTreeRoot()
+    layers = []
+    styled_layers = []
+    joined_layers = []
 
-    # Recursive function that saves each dict element into a tree group or layer.
+    # Recursive function that saves each dict element into a tree group or layer. Nodes are created and kept by
+    # reference, nothing is searched in the tree, and the layers are added to the project in one call at the end,
+    # before the joins are resolved.
     def walk(node, tree):
         for key, item in node.items():
-            if isinstance(item, dict):                                                         # if node is a dict
-                if Counter(item.keys()) == Counter(['URI', 'PROVIDER', 'NAME',
-                                                    'ISVISIBLE', 'CRS', 'JOINS']):             # if keys list is
-                    if item['PROVIDER'] in ['postgres', 'ogr']:                                # if vector data
-                        vlayer = QgsVectorLayer(item['URI'], item['NAME'], item['PROVIDER'])
-                        for k, v in item['JOINS'].items():
-                            join_object = make_join_from_dict(v)
-                            vlayer.addJoin(join_object)
-                    if item['PROVIDER'] == 'wms':                                              # if wms
-                        vlayer = QgsRasterLayer(item['URI'], item['NAME'], item['PROVIDER'])
-                    vlayer.setCrs(QgsCoordinateReferenceSystem(item['CRS']))                   # assign layer crs
-                    qgs_project.addMapLayer(vlayer, False)                                      # add layer to the proj
-                    tree.addLayer(vlayer)                                                      # add layer to the tree
-                    tree.findLayer(vlayer).setItemVisibilityChecked(item['ISVISIBLE'])         # set visibility
-                else:                                   # if dict but not layer
-                    tree.addGroup(key)                  # add the group to the tree
-                    walk(item, tree.findGroup(key))     # recurse
+            if is_layer_dict(item):                                                            # if node is a layer
+                with layer_phase(item['NAME'], item['PROVIDER'], item['URI']):
+                    if layer_cache is None:
+                        vlayer = create_layer_from_dict(item, deferred_validation)
+                    else:
+                        vlayer = layer_cache.layer(item, deferred_validation)
+                if isinstance(vlayer, QgsVectorLayer) and item['JOINS']:                      # joins come last
+                    joined_layers.append((vlayer, item))
+                layer_node = QgsLayerTreeLayer(vlayer)                                         # create the tree node
+                layer_node.setItemVisibilityChecked(item['ISVISIBLE'])                         # set visibility
+                tree.addChildNode(layer_node)                                                  # add layer to the tree
+                layers.append((vlayer, item))
+                if style_store is not None and item.get('STYLE'):
+                    styled_layers.append((vlayer, item['STYLE']))
+            elif isinstance(item, dict):                # if dict but not layer
+                walk(item, tree.addGroup(key))          # add the group to the tree and recurse
             else:                       # if not dict
                 tree.addGroup(key)      # add the key group
                 tree.addGroup(item)     # and the item group (assuming a deep string item is an empty group)
-    walk(tree_dict, root)
+    with phase('build tree'):
+        walk(tree_dict, root)
+    with phase('addMapLayers', count=len(layers)):
+        qgs_project.addMapLayers([layer for layer, _ in layers], False)                       # add layers to the proj
+    if styled_layers:
+        with phase('apply styles', count=len(styled_layers)):
+            apply_layer_styles(styled_layers, style_store, max_workers)
+    if joined_layers:
+        with phase('resolve joins', count=len(joined_layers)):
+            resolve_layer_joins(joined_layers, qgs_project, memory_cache)
+
+    if deferred_validation:
+        sources = [(item['PROVIDER'], item['URI']) for _, item in layers]
+        with phase('check_layer_sources', count=len(sources)):
+            if layer_cache is None:
+                valid_sources = check_layer_sources(sources, max_workers)
+            else:
+                valid_sources = layer_cache.check_sources(sources, max_workers)
+        invalid_layers = [layer for layer, item in layers if not valid_sources[(item['PROVIDER'], item['URI'])]]
+    else:
+        invalid_layers = [layer for layer, _ in layers if not layer.isValid()]
+    for layer in invalid_layers:
+        print('Layer {} did not load ({})'.format(layer.name(), layer.source()))
+    return invalid_layers
+
+
+def update_project_tree_from_dict(tree_dict, qgs_project, style_store=None):
+    """
+    Update the tree of a project so that it matches a dictionary of a tree, applying only the differences with the
+    current tree. Layers that did not change, or only moved, keep their instance and are never validated again.
+    :param tree_dict: a dictionary container the layer tree including groups, sources, visibility
+    :param qgs_project: the qgis project to update, e.g. opened with open_project
+    :param style_store: the StyleStore of the STYLE references, the styles of the project are then compared with them
+        and the changed ones applied. Without a store the STYLE keys are ignored.
+    :return: the TreeDiff that was applied
+    """
+    if type(qgs_project) != QgsProject:
+        raise TypeError('Input must be a QgsProject.')
+
+    root = qgs_project.layerTreeRoot()
+    items = list(_iter_layer_nodes(root, (), None, []))
+    layer_items = [(path, record, node) for path, record, node in items if isinstance(record, LayerRecord)]
+    old_ids = {path + (record.key,): node.layerId() for path, record, node in layer_items}
+    fields = LAYER_FIELDS
+    if style_store is None:
+        fields = tuple(f for f in LAYER_FIELDS if f != 'STYLE')
+    else:
+        # The styles of the project are only hashed to be compared, the store is left untouched
+        references = iter([StyleStore.reference(qml)
+                           for qml in export_style_documents([node.layer() for _, _, node in layer_items])])
+        items = [(path, record._replace(style=next(references)) if isinstance(record, LayerRecord) else record, node)
+                 for path, record, node in items]
+    old_tree = tree_dict_from_records((path, record) for path, record, _ in items)
+    diff = diff_trees(old_tree, tree_dict, fields, old_ids)
+    changed = dict(diff.changed_layers)
+    moved = {new_path: _find_tree_node(root, old_path) for old_path, new_path in diff.moved_layers}
+    moved = {path: (node.layer(), node.parent()) for path, node in moved.items()}
+    added = set(diff.added_layers) | set(diff.added_groups)
+
+    # Drop what is gone: removed layers, the old nodes of moved layers, then the removed groups
+    qgs_project.removeMapLayers([_find_tree_node(root, path).layerId() for path in diff.removed_layers])
+    bridge = qgs_project.layerTreeRegistryBridge()
+    bridge.setEnabled(False)            # otherwise the bridge removes the moved layers from the project with their node
+    try:
+        for layer, parent in moved.values():
+            parent.removeLayer(layer)
+    finally:
+        bridge.setEnabled(True)
+    for path in reversed(diff.removed_groups):
+        node = _find_tree_node(root, path)
+        node.parent().removeChildNode(node)
+
+    joined_layers = []
+    styled_layers = []
+
+    # Recursive function that inserts the new groups and layers and updates the changed ones.
+    def walk(node, tree, path):
+        for index, (key, item) in enumerate(node.items()):
+            item_path = path + (key,)
+            index = min(index, len(tree.children()))
+            if is_layer_dict(item):
+                if item_path in moved:
+                    tree.insertLayer(index, moved[item_path][0]).setItemVisibilityChecked(item['ISVISIBLE'])
+                elif item_path in added:
+                    layer = create_layer_from_dict(item)
+                    if isinstance(layer, QgsVectorLayer) and item['JOINS']:
+                        joined_layers.append((layer, item))
+                    qgs_project.addMapLayer(layer, False)
+                    tree.insertLayer(index, layer).setItemVisibilityChecked(item['ISVISIBLE'])
+                    if style_store is not None and item.get('STYLE'):
+                        styled_layers.append((layer, item['STYLE']))
+                if item_path in changed:
+                    layer_node = _find_tree_node(root, item_path)
+                    _update_layer_node(layer_node, item, changed[item_path])
+                    if 'JOINS' in changed[item_path] and isinstance(layer_node.layer(), QgsVectorLayer):
+                        joined_layers.append((layer_node.layer(), item))
+                    if 'STYLE' in changed[item_path] and item.get('STYLE'):
+                        styled_layers.append((layer_node.layer(), item['STYLE']))
+            elif isinstance(item, dict):
+                walk(item, tree.insertGroup(index, key) if item_path in added else _find_tree_node(tree, (key,)),
+                     item_path)
+            else:
+                if item_path in added:
+                    tree.insertGroup(index, key)
+                if path + (item,) in added:
+                    tree.addGroup(item)
+    walk(tree_dict, root, ())
+    if styled_layers:
+        apply_layer_styles(styled_layers, style_store)
+    resolve_layer_joins(joined_layers, qgs_project)
+    return diff
+
+
+def _find_tree_node(root, path):
+    """
+    Find a group or a layer node of a layer tree from its path of names.
+    """
+    node = root
+    for name in path:
+        node = next(child for child in node.children() if child.name() == name)
+    return node
+
+
+def _update_layer_node(node, layer_dict, fields) -> None:
+    """
+    Apply the changed fields of a layer dictionary to an existing layer node and its layer.
+    """
+    layer = node.layer()
+    if 'URI' in fields or 'PROVIDER' in fields:
+        layer.setDataSource(layer_dict['URI'], layer_dict['NAME'], layer_dict['PROVIDER'],
+                            QgsDataProvider.ProviderOptions())
+    if 'NAME' in fields:
+        layer.setName(layer_dict['NAME'])
+    if 'CRS' in fields:
+        layer.setCrs(QgsCoordinateReferenceSystem(layer_dict['CRS']))
+    if 'ISVISIBLE' in fields:
+        node.setItemVisibilityChecked(layer_dict['ISVISIBLE'])
+    if 'JOINS' in fields and isinstance(layer, QgsVectorLayer):       # the new joins are resolved by the caller
+        for join in layer.vectorJoins():
+            layer.removeJoin(join.joinLayerId())
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        raise IndexError('One argument is required.')
-    with open_project(sys.argv[1]) as qgs_project:
-        dict_tree = create_dict_from_project_tree(qgs_project)
-        with open('data2.yml', 'w') as outfile:
-            yaml.dump(dict_tree, outfile, allow_unicode=True)
+    parser = argparse.ArgumentParser(description='Extract the layer tree of a QGIS project to data2.yml.')
+    parser.add_argument('project', help='QGIS project to extract')
+    add_filter_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    extract_filter = filter_from_args(args)
+    with profiling_from_args(args):
+        with open_project(args.project) as qgs_project:
+            if extract_filter is None:
+                export_tree(iter_project_tree_items(qgs_project.layerTreeRoot()), 'data2.yml')
+            else:
+                export_tree(create_dict_from_project_tree(qgs_project, tree_filter=extract_filter).items(),
+                            'data2.yml')
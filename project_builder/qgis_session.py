@@ -0,0 +1,77 @@
+from qgis.core import QgsApplication, QgsProject
+from profiling import phase
+
+
+class QgisSession:
+    """
+    Process-wide QGIS application. The application is started (and the provider plugins loaded) only once, every
+    caller then shares the warm session and gets a cleared project from it. QGIS cannot be restarted once exitQgis has
+    been called, so the teardown must be done explicitly at the very end of the process.
+    """
+    _instance = None
+
+    def __init__(self, prefix_path='/usr'):
+        self._prefix_path = prefix_path
+        self._app = None
+        self._owns_app = False
+
+    @classmethod
+    def instance(cls):
+        """
+        Get the session of the current process, created on first use.
+        :return: a QgisSession
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @property
+    def app(self):
+        return self.start()
+
+    @property
+    def is_running(self):
+        return self._app is not None
+
+    def start(self) -> QgsApplication:
+        """
+        Start the QGIS application if it is not running yet. An application already created by the host process
+        (QGIS desktop, a test runner...) is reused and will not be exited by this session.
+        :return: the running QgsApplication
+        """
+        if self._app is None:
+            existing = QgsApplication.instance()
+            if existing is not None:
+                self._app = existing
+            else:
+                with phase('initQgis'):
+                    # Link to the QGIS application
+                    self._app = QgsApplication([], False)
+                    # Supply path to qgis install location
+                    self._app.setPrefixPath(self._prefix_path, True)
+                    # Load providers
+                    self._app.initQgis()
+                self._owns_app = True
+        return self._app
+
+    def project(self) -> QgsProject:
+        """
+        Get the project of the session, cleared from whatever a previous caller left in it.
+        :return: an empty QgsProject
+        """
+        self.start()
+        project = QgsProject.instance()
+        project.clear()
+        return project
+
+    def exit(self) -> None:
+        """
+        Clear the project and call exitQgis on the application started by this session.
+        """
+        if self._app is None:
+            return
+        QgsProject.instance().clear()
+        if self._owns_app:
+            self._app.exitQgis()
+        self._app = None
+        self._owns_app = False
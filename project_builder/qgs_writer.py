@@ -0,0 +1,159 @@
+import os
+import re
+import uuid
+import zipfile
+import argparse
+import xml.etree.ElementTree as ElementTree
+
+from config_parser import load_config, add_cache_arguments, cache_from_args
+from tree_dict import is_layer_dict, RASTER_PROVIDERS
+from join_resolver import LayerIdRemap
+from style_store import StyleStore
+
+QGIS_VERSION = '3.22.0'
+DOCTYPE = "<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>\n"
+
+
+def layer_id(name, path) -> str:
+    """
+    Create a layer id the way QGIS does (name followed by a uuid), but derived from the path of the layer in the tree
+    so that building the same tree twice gives the same ids.
+    :param name: the layer name
+    :param path: the tuple of keys leading to the layer in the tree dictionary
+    :return: a layer id
+    """
+    uid = uuid.uuid5(uuid.NAMESPACE_URL, '/'.join(str(p) for p in path))
+    return re.sub(r'\W', '_', name, flags=re.ASCII) + '_' + str(uid).replace('-', '_')
+
+
+def build_project_document(tree_dict, crs=None, title='', style_store=None) -> ElementTree.Element:
+    """
+    Create the XML document of a QGIS project from a dictionary of a tree, without instantiating any layer. The
+    join_layer_id of the joins is remapped, with a join_resolver.LayerIdRemap, to the ids the layers get here.
+    :param tree_dict: a dictionary container the layer tree including groups, sources, visibility
+    :param crs: the authid of the project CRS, e.g. 'EPSG:2056'
+    :param title: the project title
+    :param style_store: the StyleStore of the STYLE references, whose QML is then written in the layers. Without a
+        store the STYLE keys are dropped and the layers get the default style of QGIS.
+    :return: the <qgis> root element
+    """
+    qgis = ElementTree.Element('qgis', {'version': QGIS_VERSION, 'projectname': title})
+    ElementTree.SubElement(qgis, 'title').text = title
+    if crs:
+        _add_srs(ElementTree.SubElement(qgis, 'projectCrs'), crs)
+    root_group = ElementTree.SubElement(qgis, 'layer-tree-group')
+    ElementTree.SubElement(root_group, 'customproperties')
+    project_layers = ElementTree.SubElement(qgis, 'projectlayers')
+    maplayers = []
+
+    # Recursive function that saves each dict element into a tree group or layer element.
+    def walk(node, group, path):
+        for key, item in node.items():
+            if is_layer_dict(item):
+                item_id = layer_id(item['NAME'], path + (key,))
+                ElementTree.SubElement(group, 'layer-tree-layer', {
+                    'name': str(key), 'id': item_id, 'source': item['URI'], 'providerKey': item['PROVIDER'],
+                    'checked': 'Qt::Checked' if item['ISVISIBLE'] else 'Qt::Unchecked', 'expanded': '1'})
+                maplayer = _maplayer_element(item, item_id)
+                project_layers.append(maplayer)
+                maplayers.append((item, item_id, maplayer))
+            elif isinstance(item, dict):
+                walk(item, _group_element(group, key), path + (key,))
+            else:                       # a deep string item adds two empty groups
+                _group_element(group, key)
+                _group_element(group, item)
+    walk(tree_dict, root_group, ())
+
+    # Joins are written once every layer has its id, a join to a layer of the tree pointing to its new id. The id of
+    # a join that cannot be resolved is kept, QGIS then ignores the join when reading the project.
+    remap = LayerIdRemap((item_id, item['NAME'], item['URI']) for item, item_id, _ in maplayers)
+    for item, _, maplayer in maplayers:
+        joins = maplayer.find('vectorjoins')
+        if joins is not None:
+            for _, join_dict in sorted(item['JOINS'].items()):
+                joins.append(_join_element(join_dict, remap.resolve(join_dict) or join_dict['join_layer_id']))
+    if style_store is not None:
+        styles = style_store.get_many(item['STYLE'] for item, _, _ in maplayers if item.get('STYLE'))
+        for item, _, maplayer in maplayers:
+            if item.get('STYLE'):
+                maplayer.extend(ElementTree.fromstring(styles[item['STYLE']].encode('utf-8')))
+
+    properties = ElementTree.SubElement(ElementTree.SubElement(qgis, 'properties'), 'Paths')
+    ElementTree.SubElement(properties, 'Absolute', {'type': 'bool'}).text = 'true'
+    return qgis
+
+
+def _group_element(parent, name) -> ElementTree.Element:
+    group = ElementTree.SubElement(parent, 'layer-tree-group',
+                                   {'name': str(name), 'checked': 'Qt::Checked', 'expanded': '1'})
+    ElementTree.SubElement(group, 'customproperties')
+    return group
+
+
+def _maplayer_element(layer_dict, item_id) -> ElementTree.Element:
+    is_raster = layer_dict['PROVIDER'] in RASTER_PROVIDERS
+    maplayer = ElementTree.Element('maplayer', {'type': 'raster' if is_raster else 'vector'})
+    ElementTree.SubElement(maplayer, 'id').text = item_id
+    ElementTree.SubElement(maplayer, 'datasource').text = layer_dict['URI']
+    ElementTree.SubElement(maplayer, 'layername').text = layer_dict['NAME']
+    if layer_dict['CRS']:
+        _add_srs(ElementTree.SubElement(maplayer, 'srs'), layer_dict['CRS'])
+    ElementTree.SubElement(maplayer, 'provider', {'encoding': ''}).text = layer_dict['PROVIDER']
+    if not is_raster:
+        ElementTree.SubElement(maplayer, 'vectorjoins')         # filled by build_project_document
+    return maplayer
+
+
+def _join_element(join_dict, join_layer_id) -> ElementTree.Element:
+    """
+    Write a join dictionary, as created by get_vector_join_info_as_dict, the way QgsVectorLayerJoinBuffer does.
+    """
+    join = ElementTree.Element('join', {
+        'joinLayerId': join_layer_id, 'joinFieldName': join_dict['join_field_name'],
+        'targetFieldName': join_dict['target_field_name'], 'memoryCache': '1' if join_dict['memory_cache'] else '0',
+        'dynamicForm': '0', 'editable': '0', 'upsertOnEdit': '0', 'cascadedDelete': '0',
+        'hasCustomPrefix': '1' if join_dict['prefix'] else '0'})
+    if join_dict['prefix']:
+        join.set('customPrefix', join_dict['prefix'])
+    if join_dict['field_subset'] is not None:
+        subset = ElementTree.SubElement(join, 'joinFieldsSubset')
+        for field in join_dict['field_subset']:
+            ElementTree.SubElement(subset, 'field', {'name': field})
+    return join
+
+
+def _add_srs(parent, authid) -> None:
+    ElementTree.SubElement(ElementTree.SubElement(parent, 'spatialrefsys'), 'authid').text = authid
+
+
+def write_project_file(tree_dict, project_path, crs=None, title='', style_store=None) -> None:
+    """
+    Write a .qgs or .qgz project from a dictionary of a tree. No datasource is opened and QGIS is not needed.
+    :param tree_dict: a dictionary container the layer tree including groups, sources, visibility
+    :param project_path: path of the project to write, zipped if it ends with .qgz
+    :param crs: the authid of the project CRS, e.g. 'EPSG:2056'
+    :param title: the project title
+    :param style_store: see build_project_document, the STYLE keys are dropped without it
+    """
+    document = DOCTYPE + ElementTree.tostring(build_project_document(tree_dict, crs, title, style_store),
+                                              encoding='unicode')
+    if project_path.lower().endswith('.qgz'):
+        qgs_name = os.path.splitext(os.path.basename(project_path))[0] + '.qgs'
+        with zipfile.ZipFile(project_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr(qgs_name, document.encode('utf-8'))
+    else:
+        with open(project_path, 'w', encoding='utf-8') as qgs:
+            qgs.write(document)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a QGIS project from a layer tree YAML, offline.')
+    parser.add_argument('config', help='layer tree YAML')
+    parser.add_argument('project', help='.qgs or .qgz project to write')
+    parser.add_argument('--crs', default=None, help='project CRS, e.g. EPSG:2056')
+    parser.add_argument('--title', default='', help='project title')
+    parser.add_argument('--styles', default=None, help='style store directory, the STYLE keys are dropped without it')
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+    write_project_file(load_config(args.config, cache_from_args(args)), args.project, args.crs, args.title,
+                       StyleStore(args.styles) if args.styles else None)
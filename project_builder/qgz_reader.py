@@ -0,0 +1,185 @@
+import os
+import sys
+import zipfile
+import argparse
+import xml.etree.ElementTree as ElementTree
+from contextlib import contextmanager
+from typing import Dict, Union, Any
+
+import yaml
+
+from tree_filter import filter_tree_dict, add_filter_arguments, filter_from_args
+
+# Providers whose datasource starts with a (possibly relative) file path.
+FILE_PROVIDERS = ('ogr', 'gdal', 'spatialite')
+
+
+@contextmanager
+def open_qgs_document(project_path):
+    """
+    Open the XML document of a QGIS project as a binary stream, reading it straight out of the archive for .qgz files.
+    :param project_path: path to a .qgs or .qgz project file
+    """
+    # Check if file exists
+    try:
+        project_path = str(project_path)
+        os.stat(project_path)
+    except FileNotFoundError as fe:
+        raise fe
+
+    if zipfile.is_zipfile(project_path):
+        with zipfile.ZipFile(project_path) as archive:
+            members = [m for m in archive.namelist() if m.lower().endswith('.qgs')]
+            if not members:
+                raise ValueError('No .qgs document found in {}.'.format(project_path))
+            with archive.open(members[0]) as qgs:
+                yield qgs
+    else:
+        with open(project_path, 'rb') as qgs:
+            yield qgs
+
+
+def read_dict_from_project_file(project_path, tree_filter=None) -> dict:
+    """
+    Create a dictionary of the layer tree of a QGIS project file without starting QGIS. The XML is streamed with an
+    incremental parser and no datasource is ever opened, the returned dictionary has the same shape as the one of
+    qgis_config_manager.create_dict_from_project_tree.
+    :param project_path: path to a .qgs or .qgz project file
+    :param tree_filter: a tree_filter.TreeFilter selecting the part of the tree to read, the <maplayer> elements of the
+        other layers are skipped
+    :return: A dictionary that contains the layer tree.
+    """
+    project_dir = os.path.dirname(os.path.abspath(str(project_path)))
+    with open_qgs_document(project_path) as qgs:
+        return _parse_layer_tree(qgs, project_dir, tree_filter)
+
+
+def _parse_layer_tree(stream, project_dir, tree_filter=None) -> dict:
+    """
+    Walk the start/end events of a project document and fill the layer tree dictionary. Groups and layers are taken
+    from the root <layer-tree-group>, layer details from the <maplayer> elements of <projectlayers>. Parsing stops as
+    soon as <projectlayers> is closed, the rest of the document (layouts, properties...) is never read.
+    :param stream: binary stream of the .qgs XML document
+    :param project_dir: directory used to resolve relative file datasources
+    :param tree_filter: a tree_filter.TreeFilter, the groups and layers it rules out by path are not added. The layer
+        predicates need the <maplayer> details and are applied once the document is read.
+    :return: A dictionary that contains the layer tree.
+    """
+    layer_tree: Dict[str, Union[Dict[str, str], Any]] = {}
+    groups = []             # Stack of (dictionary, visibility, path) for the groups being read, None for pruned groups
+    layers_by_id = {}       # Layer id -> layer dictionary, filled in when the <maplayer> element is reached
+    sources = {}            # Layer id -> (datasource, name) of every <maplayer>, the hints of the joins to the layer
+    depth = 0
+    in_tree = False
+
+    for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if depth == 2 and elem.tag == 'layer-tree-group':          # Root of the layer tree
+                in_tree = True
+                groups.append((layer_tree, True, ()))
+            elif in_tree and elem.tag == 'layer-tree-group':           # Nested group
+                parent, parent_visible, parent_path = groups[-1]
+                path = parent_path + (elem.get('name', ''),)
+                if parent is None or tree_filter is not None and not tree_filter.visit_group(path):
+                    groups.append((None, False, path))
+                    continue
+                group = parent[elem.get('name', '')] = {}
+                groups.append((group, parent_visible and _is_checked(elem), path))
+            elif in_tree and elem.tag == 'layer-tree-layer':           # Layer, provisional values from the tree node
+                parent, parent_visible, parent_path = groups[-1]
+                if parent is None or tree_filter is not None and \
+                        not tree_filter.accepts_path(parent_path + (elem.get('name', ''),)):
+                    continue
+                layer = parent[elem.get('name', '')] = {
+                    'URI': elem.get('source', ''),
+                    'NAME': elem.get('name', ''),
+                    'PROVIDER': elem.get('providerKey', ''),
+                    'ISVISIBLE': parent_visible and _is_checked(elem),
+                    'CRS': '',
+                    'JOINS': {},
+                }
+                layers_by_id[elem.get('id')] = layer
+            continue
+
+        depth -= 1
+        if in_tree and elem.tag == 'layer-tree-group':
+            groups.pop()
+            if not groups:
+                in_tree = False
+                elem.clear()
+        elif depth == 2 and elem.tag == 'maplayer':
+            layer_id = elem.findtext('id')
+            layer = layers_by_id.get(layer_id)
+            if layer is not None:
+                _update_layer_from_element(layer, elem, project_dir)
+                sources[layer_id] = (layer['URI'], layer['NAME'])
+            else:
+                sources[layer_id] = (_absolute_datasource(elem.findtext('datasource') or '',
+                                                          elem.findtext('provider'), project_dir),
+                                     elem.findtext('layername') or '')
+            elem.clear()                                                # Keep memory flat on large projects
+        elif depth == 1 and elem.tag == 'projectlayers':
+            break
+    # The joined layer may come after the joining one, the join hints are added once every <maplayer> is read
+    for layer in layers_by_id.values():
+        for join_dict in layer['JOINS'].values():
+            if join_dict['join_layer_id'] in sources:
+                join_dict['join_layer_uri'], join_dict['join_layer_name'] = sources[join_dict['join_layer_id']]
+    if tree_filter is not None:                                         # Layer predicates and emptied groups
+        return filter_tree_dict(layer_tree, tree_filter)
+    return layer_tree
+
+
+def _is_checked(elem) -> bool:
+    return elem.get('checked', 'Qt::Checked') != 'Qt::Unchecked'
+
+
+def _update_layer_from_element(layer, elem, project_dir) -> None:
+    """
+    Complete a layer dictionary with the content of its <maplayer> element.
+    :param layer: the layer dictionary created from the layer tree node
+    :param elem: the <maplayer> element
+    :param project_dir: directory used to resolve relative file datasources
+    """
+    provider = elem.findtext('provider') or layer['PROVIDER']
+    layer['URI'] = _absolute_datasource(elem.findtext('datasource') or layer['URI'], provider, project_dir)
+    layer['NAME'] = elem.findtext('layername') or layer['NAME']
+    layer['PROVIDER'] = provider
+    layer['CRS'] = elem.findtext('srs/spatialrefsys/authid') or ''
+    layer['JOINS'] = get_vector_join_info_from_element(elem)
+
+
+def _absolute_datasource(uri, provider, project_dir) -> str:
+    """
+    Resolve the relative path that QGIS writes for file based datasources against the project directory.
+    """
+    if provider in FILE_PROVIDERS and uri.startswith(('./', '../')):
+        path, sep, options = uri.partition('|')
+        return os.path.normpath(os.path.join(project_dir, path)) + sep + options
+    return uri
+
+
+def get_vector_join_info_from_element(maplayer_elem) -> dict:
+    """
+    Read the <vectorjoins> of a <maplayer> element as a dictionary, following
+    qgis_config_manager.get_vector_join_info_as_dict.
+    :param maplayer_elem: a <maplayer> element
+    :return: dict
+    """
+    joins = {}
+    for it, j in enumerate(maplayer_elem.iterfind('vectorjoins/join')):
+        subset = j.find('joinFieldsSubset')
+        joins[it] = {'join_layer_id': j.get('joinLayerId', ''), 'join_field_name': j.get('joinFieldName', ''),
+                     'target_field_name': j.get('targetFieldName', ''), 'memory_cache': j.get('memoryCache') == '1',
+                     'prefix': j.get('customPrefix', '') if j.get('hasCustomPrefix') == '1' else '',
+                     'field_subset': [f.get('name') for f in subset.iter('field')] if subset is not None else None}
+    return joins
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the layer tree of a QGIS project file as YAML.')
+    parser.add_argument('project', help='.qgs or .qgz project file')
+    add_filter_arguments(parser)
+    args = parser.parse_args()
+    yaml.dump(read_dict_from_project_file(args.project, filter_from_args(args)), sys.stdout, allow_unicode=True)
@@ -0,0 +1,128 @@
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Name of the style directory next to a config or project, unless QGIS_PROJECT_BUILDER_STYLES gives another one.
+STYLE_DIR_NAME = 'styles'
+STYLE_EXTENSION = '.qml'
+
+
+def default_style_dir(path) -> str:
+    """
+    The style directory of a config or project: QGIS_PROJECT_BUILDER_STYLES when it is set, else a styles directory
+    next to the file, so that it does not depend on the working directory.
+    :param path: path of the config or project file
+    :return: the style directory
+    """
+    return os.environ.get('QGIS_PROJECT_BUILDER_STYLES') or \
+        os.path.join(os.path.dirname(os.path.abspath(path)), STYLE_DIR_NAME)
+
+
+class StyleStore:
+    """
+    QML styles stored under a root directory by the sha256 of their content. Layers sharing a symbology share one
+    file, and storing a style that did not change writes nothing. The reference of a style, its hash, is what the
+    STYLE key of a layer dictionary holds.
+    """
+    def __init__(self, root):
+        self._root = root
+        self._lock = threading.Lock()
+        self.written = 0
+        self.skipped = 0
+
+    @property
+    def root(self):
+        return self._root
+
+    @staticmethod
+    def reference(qml) -> str:
+        """
+        Compute the reference of a style.
+        :param qml: the QML document, as str or bytes
+        :return: the sha256 of the document in hexadecimal
+        """
+        return hashlib.sha256(qml.encode('utf-8') if isinstance(qml, str) else qml).hexdigest()
+
+    def path(self, reference) -> str:
+        """
+        The file of a style, in a sub-directory named after the first two characters of its reference.
+        """
+        return os.path.join(self._root, reference[:2], reference + STYLE_EXTENSION)
+
+    def __contains__(self, reference):
+        return os.path.exists(self.path(reference))
+
+    def put(self, qml) -> str:
+        """
+        Store a style, unless the same document is already stored.
+        :param qml: the QML document, as str or bytes
+        :return: the reference of the style
+        :raise OSError: when the style cannot be written, no temporary file is then left in the store
+        """
+        data = qml.encode('utf-8') if isinstance(qml, str) else qml
+        reference = self.reference(data)
+        path = self.path(reference)
+        if os.path.exists(path):
+            with self._lock:
+                self.skipped += 1
+            return reference
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)                          # atomic, concurrent writers of one style agree
+        except OSError:
+            try:
+                os.remove(tmp_path)                             # no partial file left behind a failed write
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            self.written += 1
+        return reference
+
+    def get(self, reference) -> str:
+        """
+        Read a style.
+        :param reference: the reference returned by put
+        :return: the QML document
+        """
+        with open(self.path(reference), encoding='utf-8') as f:
+            return f.read()
+
+    def put_many(self, documents, max_workers=8) -> list:
+        """
+        Store styles concurrently, each distinct document being hashed and written once.
+        :param documents: an iterable of QML documents
+        :param max_workers: maximum number of files written at the same time
+        :return: the list of the references, in the order of the documents
+        """
+        documents = list(documents)
+        distinct = list(dict.fromkeys(documents))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            references = dict(zip(distinct, executor.map(self.put, distinct)))
+        return [references[document] for document in documents]
+
+    def get_many(self, references, max_workers=8, missing_ok=False) -> dict:
+        """
+        Read styles concurrently, each distinct style once.
+        :param references: an iterable of style references
+        :param max_workers: maximum number of files read at the same time
+        :param missing_ok: leave the styles that are not in the store out of the result instead of raising a
+            FileNotFoundError
+        :return: a dictionary mapping each reference to its QML document
+        """
+        def get(reference):
+            try:
+                return self.get(reference)
+            except FileNotFoundError:
+                if not missing_ok:
+                    raise
+                return None
+
+        distinct = list(dict.fromkeys(references))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return {reference: qml for reference, qml in zip(distinct, executor.map(get, distinct)) if qml is not None}
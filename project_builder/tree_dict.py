@@ -0,0 +1,112 @@
+from collections import namedtuple
+
+LAYER_DICT_KEYS = ('URI', 'NAME', 'PROVIDER', 'ISVISIBLE', 'CRS', 'JOINS')
+LAYER_KEYS = frozenset(LAYER_DICT_KEYS)
+# Keys a layer dictionary may have on top of LAYER_DICT_KEYS: STYLE references a style of a style_store.StyleStore,
+# METADATA holds what layer_metadata.enrich_tree_dict found about the datasource and is ignored by the builder.
+OPTIONAL_LAYER_KEYS = ('STYLE', 'METADATA')
+ALL_LAYER_KEYS = LAYER_KEYS | frozenset(OPTIONAL_LAYER_KEYS)
+# Providers the builder creates layers for.
+VECTOR_PROVIDERS = ('postgres', 'ogr', 'memory')
+RASTER_PROVIDERS = ('wms',)
+
+
+def is_layer_dict(item) -> bool:
+    """
+    Tell if a node of a layer tree dictionary describes a layer rather than a group.
+    :param item: a value of the layer tree dictionary
+    :return: True if the node is a layer
+    """
+    if not isinstance(item, dict):
+        return False
+    keys = item.keys()
+    return keys == LAYER_KEYS or LAYER_KEYS < keys <= ALL_LAYER_KEYS
+
+
+def iter_layer_dicts(tree_dict, group_path=()):
+    """
+    Walk a layer tree dictionary depth first and yield its layers.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :param group_path: path of the groups leading to tree_dict
+    :return: a generator of (group_path, key, layer_dict) tuples
+    """
+    for key, item in tree_dict.items():
+        if is_layer_dict(item):
+            yield group_path, key, item
+        elif isinstance(item, dict):
+            yield from iter_layer_dicts(item, group_path + (key,))
+
+
+class LayerRecord(namedtuple('LayerRecord', ['key', 'uri', 'name', 'provider', 'isvisible', 'crs', 'joins', 'style'],
+                             defaults=(None,))):
+    """
+    Compact and immutable description of a layer of the tree, key being the name of its node in the tree. style is
+    None unless the layer references a stored style.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_dict(cls, key, layer_dict):
+        """
+        Create a record from a layer dictionary of a tree.
+        :param key: the key of the layer in the tree dictionary
+        :param layer_dict: the layer dictionary
+        :return: a LayerRecord
+        """
+        return cls(key, *(layer_dict[k] for k in LAYER_DICT_KEYS), layer_dict.get('STYLE'))
+
+    def to_dict(self, keys=None) -> dict:
+        """
+        Create the layer dictionary of a tree from the record.
+        :param keys: the dictionary keys to keep, all of LAYER_DICT_KEYS (and STYLE when set) by default
+        :return: dict
+        """
+        layer_dict = dict(zip(LAYER_DICT_KEYS, self[1:7]))
+        if self.style is not None:
+            layer_dict['STYLE'] = self.style
+        return layer_dict if keys is None else {k: layer_dict[k] for k in keys if k in layer_dict}
+
+
+class GroupRecord(namedtuple('GroupRecord', ['key', 'isvisible'])):
+    """
+    Description of a group of the tree, its content follows it in the iteration.
+    """
+    __slots__ = ()
+
+
+def iter_tree_dict(tree_dict, group_path=()):
+    """
+    Lazily walk a layer tree dictionary depth first.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :param group_path: path of the groups leading to tree_dict
+    :return: a generator of (group_path, record) tuples, the record being a GroupRecord or a LayerRecord and
+        group_path the tuple of the names of the groups containing it
+    """
+    for key, item in tree_dict.items():
+        if is_layer_dict(item):
+            yield group_path, LayerRecord.from_dict(key, item)
+        elif isinstance(item, dict):
+            yield group_path, GroupRecord(key, True)
+            yield from iter_tree_dict(item, group_path + (key,))
+        else:                                           # a deep string item adds two empty groups
+            yield group_path, GroupRecord(key, True)
+            yield group_path, GroupRecord(item, True)
+
+
+def tree_dict_from_records(records, keys=None) -> dict:
+    """
+    Build the nested layer tree dictionary from (group_path, record) tuples, as yielded by iter_tree_dict or
+    qgis_config_manager.iter_layer_tree.
+    :param records: an iterable of (group_path, record) tuples, groups coming before their content
+    :param keys: the keys of the layer dictionaries, all of LAYER_DICT_KEYS by default
+    :return: a layer tree dictionary
+    """
+    tree_dict = {}
+    groups = {(): tree_dict}
+    for group_path, record in records:
+        parent = groups[group_path]
+        if isinstance(record, GroupRecord):
+            groups[group_path + (record.key,)] = parent[record.key] = {}
+        else:
+            parent[record.key] = record.to_dict(keys)
+    return tree_dict
@@ -0,0 +1,148 @@
+from tree_dict import is_layer_dict
+from join_resolver import LayerIdRemap
+
+# Layer fields that can be updated in place, without creating the layer again.
+LAYER_FIELDS = ('URI', 'PROVIDER', 'NAME', 'CRS', 'ISVISIBLE', 'JOINS', 'STYLE')
+# Keys of a join dictionary only used to find the joined layer, see join_resolver.LayerIdRemap.
+JOIN_HINTS = ('join_layer_uri', 'join_layer_name')
+
+
+class TreeDiff:
+    """
+    Keyed differences between two layer tree dictionaries. Groups and layers are keyed by their path, the tuple of
+    the group names leading to them followed by their own key.
+    """
+    def __init__(self):
+        self.added_groups = []      # paths
+        self.removed_groups = []    # paths
+        self.moved_groups = []      # (old path, new path)
+        self.added_layers = []      # paths
+        self.removed_layers = []    # paths
+        self.moved_layers = []      # (old path, new path)
+        self.changed_layers = []    # (path, list of changed fields)
+
+    @property
+    def is_empty(self):
+        return not any((self.added_groups, self.removed_groups, self.moved_groups, self.added_layers,
+                        self.removed_layers, self.moved_layers, self.changed_layers))
+
+    def __repr__(self):
+        return 'TreeDiff(+{} -{} ~{} groups, +{} -{} ~{} layers, {} changed)'.format(
+            len(self.added_groups), len(self.removed_groups), len(self.moved_groups), len(self.added_layers),
+            len(self.removed_layers), len(self.moved_layers), len(self.changed_layers))
+
+
+def flatten_tree_dict(tree_dict, path=()):
+    """
+    Flatten a layer tree dictionary into its group paths and its layers.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :param path: path of the groups leading to tree_dict
+    :return: a tuple (group dictionary {path: subtree}, layer dictionary {path: layer_dict}), both in tree order
+    """
+    groups, layers = {}, {}
+    for key, item in tree_dict.items():
+        if is_layer_dict(item):
+            layers[path + (key,)] = item
+        elif isinstance(item, dict):
+            groups[path + (key,)] = item
+            sub_groups, sub_layers = flatten_tree_dict(item, path + (key,))
+            groups.update(sub_groups)
+            layers.update(sub_layers)
+        else:                                               # a deep string item adds two empty groups
+            groups[path + (key,)] = {}
+            groups[path + (item,)] = {}
+    return groups, layers
+
+
+def diff_trees(old_tree, new_tree, fields=LAYER_FIELDS, old_ids=None) -> TreeDiff:
+    """
+    Compute the changes turning a layer tree dictionary into another one. A layer whose URI, PROVIDER and NAME are
+    found at another path is reported as moved, a removed group whose content is found unchanged under the same name
+    elsewhere as a moved group. Joins are compared by the path of the layer they join, see resolve_join_targets.
+    :param old_tree: the current layer tree dictionary, e.g. from create_dict_from_project_tree
+    :param new_tree: the wanted layer tree dictionary
+    :param fields: the layer fields compared to find the changed layers
+    :param old_ids: the layer ids of old_tree by path, e.g. the ids of the project it was extracted from
+    :return: a TreeDiff
+    """
+    old_groups, old_layers = flatten_tree_dict(old_tree)
+    new_groups, new_layers = flatten_tree_dict(new_tree)
+    diff = TreeDiff()
+    if 'JOINS' in fields:
+        old_ids = old_ids or {}
+        old_joins = resolve_join_targets(old_layers, old_ids)
+        new_joins = resolve_join_targets(new_layers, {path: old_ids[path] for path in new_layers if path in old_ids})
+
+    def changed_fields(old_path, new_path):
+        return [f for f in fields if (old_joins[old_path] != new_joins[new_path] if f == 'JOINS' else
+                                      old_layers[old_path].get(f) != new_layers[new_path].get(f))]
+
+    removed_groups = [p for p in old_groups if p not in new_groups]
+    added_groups = [p for p in new_groups if p not in old_groups]
+    for old_path in _top_most(removed_groups):
+        for new_path in _top_most(added_groups):
+            if new_path[-1] == old_path[-1] and new_groups[new_path] == old_groups[old_path] and \
+                    new_path not in (n for _, n in diff.moved_groups):
+                diff.moved_groups.append((old_path, new_path))
+                break
+    diff.removed_groups = removed_groups
+    diff.added_groups = added_groups
+
+    # Layers that disappeared from a path, indexed by identity to detect the ones that only moved
+    removed = {}
+    for path, layer in old_layers.items():
+        if path not in new_layers:
+            removed.setdefault(_identity(layer), []).append(path)
+    for path, layer in new_layers.items():
+        if path in old_layers:
+            changed = changed_fields(path, path)
+            if changed:
+                diff.changed_layers.append((path, changed))
+        elif removed.get(_identity(layer)):
+            old_path = removed[_identity(layer)].pop(0)
+            diff.moved_layers.append((old_path, path))
+            changed = changed_fields(old_path, path)
+            if changed:
+                diff.changed_layers.append((path, changed))
+        else:
+            diff.added_layers.append(path)
+    order = {path: i for i, path in enumerate(old_layers)}
+    diff.removed_layers = sorted((p for paths in removed.values() for p in paths), key=order.get)
+    return diff
+
+
+def resolve_join_targets(layers, layer_ids=None) -> dict:
+    """
+    Describe the joins of layers independently of the layer ids and of the resolution hints: the join_layer_id of each
+    join is replaced by the path of the layer it resolves to with a join_resolver.LayerIdRemap, and the hints dropped.
+    The id of a join that does not resolve is kept.
+    :param layers: a dictionary {path: layer_dict}, as returned by flatten_tree_dict
+    :param layer_ids: the ids the layers have by path, e.g. in a project. The layers without id can only be found by
+        the hints and by the name prefix of the join ids.
+    :return: a dictionary {path: {key: join_dict}} of the joins of every layer
+    """
+    layer_ids = layer_ids or {}
+    ids = {path: layer_ids.get(path, path) for path in layers}
+    paths = {layer_id: path for path, layer_id in ids.items()}
+    remap = LayerIdRemap((ids[path], layer['NAME'], layer['URI']) for path, layer in layers.items())
+    targets = {}
+    for path, layer in layers.items():
+        joins = targets[path] = {}
+        for key, join_dict in (layer.get('JOINS') or {}).items():
+            joins[key] = {k: v for k, v in join_dict.items() if k not in JOIN_HINTS}
+            target = remap.resolve(join_dict)
+            if target is not None:
+                joins[key]['join_layer_id'] = paths[target]
+    return targets
+
+
+def _identity(layer) -> tuple:
+    return layer['URI'], layer['PROVIDER'], layer['NAME']
+
+
+def _top_most(paths) -> list:
+    """
+    Keep only the paths that are not below another path of the list.
+    """
+    path_set = set(paths)
+    return [p for p in paths if not any(p[:i] in path_set for i in range(1, len(p)))]
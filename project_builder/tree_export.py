@@ -0,0 +1,175 @@
+import json
+
+import yaml
+from yaml.events import StreamStartEvent, StreamEndEvent, DocumentStartEvent, DocumentEndEvent, \
+    MappingStartEvent, MappingEndEvent, SequenceStartEvent, SequenceEndEvent, ScalarEvent
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
+from yaml.representer import SafeRepresenter
+from yaml.resolver import Resolver
+
+from tree_dict import is_layer_dict
+
+# Use the libyaml C emitter when PyYAML was built with it.
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+EXPORT_FORMATS = ('yaml', 'jsonl', 'msgpack')
+_RESOLVER = Resolver()
+
+# Layer tree items, as accepted by the exporters, are (key, value) pairs where the value is either a layer dictionary,
+# a group given as a dictionary or as a lazy iterable of items, or a scalar (a deep string item of a YAML tree).
+
+
+def export_tree(items, output_path, output_format='yaml') -> None:
+    """
+    Write a layer tree to a file while it is being walked, without building the nested dictionary in memory.
+    :param items: the (key, value) items of the root of the tree, e.g. tree_dict.items() or
+        qgis_config_manager.iter_project_tree_items(root)
+    :param output_path: path of the output file
+    :param output_format: 'yaml' for the nested tree dictionary, 'jsonl' or 'msgpack' for a stream of entries
+    """
+    if output_format == 'yaml':
+        with open(output_path, 'w', encoding='utf-8') as outfile:
+            yaml.emit(iter_yaml_events(items), outfile, Dumper=SafeDumper, allow_unicode=True)
+    elif output_format == 'jsonl':
+        with open(output_path, 'w', encoding='utf-8') as outfile:
+            for entry in iter_tree_entries(items):
+                outfile.write(json.dumps(entry, ensure_ascii=False))
+                outfile.write('\n')
+    elif output_format == 'msgpack':
+        import msgpack
+        packer = msgpack.Packer()
+        with open(output_path, 'wb') as outfile:
+            for entry in iter_tree_entries(items):
+                outfile.write(packer.pack(entry))
+    else:
+        raise ValueError('Output format must be one of {}.'.format(', '.join(EXPORT_FORMATS)))
+
+
+def iter_tree_entries(items, path=()):
+    """
+    Walk layer tree items depth first and yield one flat entry per node.
+    :param items: (key, value) items of a layer tree
+    :param path: keys of the groups leading to the items
+    :return: a generator of dictionaries, {'type': 'group', 'path': [...]} for groups,
+        {'type': 'layer', 'path': [...], 'layer': {...}} for layers and {'type': 'value', 'path': [...], 'value': ...}
+        for scalar items. The path ends with the key of the node. The JOINS keys of the layers are strings.
+    """
+    for key, value in items:
+        node_path = path + (key,)
+        if is_layer_dict(value):
+            if value.get('JOINS'):                  # JSON and strict msgpack readers only accept string keys
+                value = dict(value, JOINS={str(k): join for k, join in value['JOINS'].items()})
+            yield {'type': 'layer', 'path': list(node_path), 'layer': value}
+        elif _is_group(value):
+            yield {'type': 'group', 'path': list(node_path)}
+            yield from iter_tree_entries(_group_items(value), node_path)
+        else:
+            yield {'type': 'value', 'path': list(node_path), 'value': value}
+
+
+def tree_dict_from_entries(entries) -> dict:
+    """
+    Rebuild the nested layer tree dictionary from flat entries.
+    :param entries: an iterable of entries, as yielded by iter_tree_entries or read_tree_entries
+    :return: a layer tree dictionary, the JOINS keys of the layers being integers again
+    """
+    tree_dict = {}
+    for entry in entries:
+        parent = tree_dict
+        for key in entry['path'][:-1]:
+            parent = parent[key]
+        if entry['type'] == 'group':
+            parent[entry['path'][-1]] = {}
+        elif entry['type'] == 'layer' and entry['layer'].get('JOINS'):
+            joins = {int(k) if isinstance(k, str) and k.isdigit() else k: join
+                     for k, join in entry['layer']['JOINS'].items()}
+            parent[entry['path'][-1]] = dict(entry['layer'], JOINS=joins)
+        else:
+            parent[entry['path'][-1]] = entry[entry['type']]
+    return tree_dict
+
+
+def read_tree_entries(input_path, input_format='jsonl'):
+    """
+    Read the entries of a layer tree exported by export_tree.
+    :param input_path: path of the exported file
+    :param input_format: 'jsonl' or 'msgpack'
+    :return: a generator of entries, see iter_tree_entries
+    """
+    if input_format == 'jsonl':
+        with open(input_path, encoding='utf-8') as infile:
+            for line in infile:
+                yield json.loads(line)
+    elif input_format == 'msgpack':
+        import msgpack
+        with open(input_path, 'rb') as infile:
+            yield from msgpack.Unpacker(infile, raw=False)
+    else:
+        raise ValueError('Input format must be jsonl or msgpack.')
+
+
+def iter_yaml_events(items):
+    """
+    Generate the YAML events of a layer tree, group by group, so that the emitter can write them as they come.
+    :param items: (key, value) items of a layer tree
+    :return: a generator of yaml events
+    """
+    representer = SafeRepresenter(default_flow_style=False)
+    yield StreamStartEvent()
+    yield DocumentStartEvent(explicit=False)
+    yield from _mapping_events(items, representer)
+    yield DocumentEndEvent(explicit=False)
+    yield StreamEndEvent()
+
+
+def _mapping_events(items, representer):
+    yield MappingStartEvent(None, None, True, flow_style=False)
+    for key, value in items:
+        yield from _node_events(_represent(representer, key))
+        if _is_group(value) and not is_layer_dict(value):
+            yield from _mapping_events(_group_items(value), representer)
+        else:
+            yield from _node_events(_represent(representer, value))
+    yield MappingEndEvent()
+
+
+def _represent(representer, data):
+    node = representer.represent_data(data)
+    representer.represented_objects = {}            # No anchors/aliases between independent values
+    representer.object_keeper = []
+    representer.alias_key = None
+    return node
+
+
+def _node_events(node):
+    """
+    Turn a represented node into events, resolving the implicit tags the same way yaml.serializer does.
+    """
+    if isinstance(node, ScalarNode):
+        implicit = (node.tag == _RESOLVER.resolve(ScalarNode, node.value, (True, False)),
+                    node.tag == _RESOLVER.resolve(ScalarNode, node.value, (False, True)))
+        yield ScalarEvent(None, node.tag, implicit, node.value, style=node.style)
+    elif isinstance(node, SequenceNode):
+        implicit = node.tag == _RESOLVER.resolve(SequenceNode, node.value, True)
+        yield SequenceStartEvent(None, node.tag, implicit, flow_style=node.flow_style)
+        for item in node.value:
+            yield from _node_events(item)
+        yield SequenceEndEvent()
+    elif isinstance(node, MappingNode):
+        implicit = node.tag == _RESOLVER.resolve(MappingNode, node.value, True)
+        yield MappingStartEvent(None, node.tag, implicit, flow_style=node.flow_style)
+        for key, value in node.value:
+            yield from _node_events(key)
+            yield from _node_events(value)
+        yield MappingEndEvent()
+
+
+def _is_group(value) -> bool:
+    return isinstance(value, dict) or (hasattr(value, '__iter__') and not isinstance(value, (str, bytes, list)))
+
+
+def _group_items(value):
+    return value.items() if isinstance(value, dict) else value
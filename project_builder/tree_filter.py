@@ -0,0 +1,159 @@
+from fnmatch import fnmatchcase
+
+from tree_dict import is_layer_dict
+
+
+def _split(pattern) -> tuple:
+    return tuple(part for part in pattern.strip('/').split('/') if part)
+
+
+def _match(pattern, path) -> bool:
+    """
+    Tell if a path matches a glob pattern segment by segment, ** matching any number of segments.
+    """
+    if not pattern:
+        return not path
+    if pattern[0] == '**':
+        return any(_match(pattern[1:], path[i:]) for i in range(len(path) + 1))
+    return bool(path) and fnmatchcase(str(path[0]), pattern[0]) and _match(pattern[1:], path[1:])
+
+
+def _may_match_below(pattern, path) -> bool:
+    """
+    Tell if a path deeper than the given one could match a glob pattern.
+    """
+    if not path:
+        return bool(pattern)
+    if not pattern:
+        return False
+    if pattern[0] == '**':
+        return True
+    return fnmatchcase(str(path[0]), pattern[0]) and _may_match_below(pattern[1:], path[1:])
+
+
+class TreeFilter:
+    """
+    Select a part of a layer tree with group path globs and layer predicates, e.g.
+    TreeFilter(include=['Cadastre/*'], exclude=['Cadastre/archive'], providers=['postgres']).
+
+    A path is the names of the groups leading to a node followed by its own name, a pattern matches it segment by
+    segment with fnmatch, ** matching any number of segments. A node is included when its path or the path of one of
+    its groups matches an include pattern (everything is included without include patterns), and excluded the same
+    way with the exclude patterns. A layer is kept when it is included, not excluded and passes the layer predicates.
+    A group is kept when it contains a kept node, or when it is included and there is no layer predicate.
+    Walkers call visit_group before entering a group, so that the branches that cannot hold any kept node are never
+    visited.
+    """
+    def __init__(self, include=(), exclude=(), providers=None, crs=None, visible=None, predicate=None):
+        """
+        :param include: group path globs of the nodes to keep
+        :param exclude: group path globs of the nodes to leave out
+        :param providers: the provider keys of the layers to keep
+        :param crs: the CRS authids of the layers to keep
+        :param visible: True or False to keep only the visible or the hidden layers
+        :param predicate: a callable receiving a layer (dictionary or LayerRecord) and returning True to keep it
+        """
+        self._include = [_split(pattern) for pattern in include]
+        self._exclude = [_split(pattern) for pattern in exclude]
+        self._providers = frozenset(providers) if providers is not None else None
+        self._crs = frozenset(crs) if crs is not None else None
+        self._visible = visible
+        self._predicate = predicate
+
+    @property
+    def has_layer_predicates(self):
+        return any(p is not None for p in (self._providers, self._crs, self._visible, self._predicate))
+
+    def _matches(self, patterns, path) -> bool:
+        return any(_match(pattern, path[:i]) for pattern in patterns for i in range(1, len(path) + 1))
+
+    def _included(self, path) -> bool:
+        return not self._include or self._matches(self._include, path)
+
+    def accepts_path(self, path) -> bool:
+        """
+        Tell if a node can be kept according to its path only.
+        :param path: the names of the groups leading to the node followed by its own name
+        """
+        return self._included(path) and not self._matches(self._exclude, path)
+
+    def visit_group(self, path) -> bool:
+        """
+        Tell if a group may contain kept nodes, walkers skip the group and its content otherwise.
+        """
+        if self._matches(self._exclude, path):
+            return False
+        return self._included(path) or any(_may_match_below(pattern, path) for pattern in self._include)
+
+    def keeps_empty_group(self, path) -> bool:
+        """
+        Tell if a group is kept even when none of its content is.
+        """
+        return not self.has_layer_predicates and self.accepts_path(path)
+
+    def accepts_layer(self, layer) -> bool:
+        """
+        Tell if a layer passes the layer predicates, whatever its path.
+        :param layer: a layer dictionary or a LayerRecord
+        """
+        if isinstance(layer, dict):
+            provider, crs, visible = layer['PROVIDER'], layer['CRS'], layer['ISVISIBLE']
+        else:
+            provider, crs, visible = layer.provider, layer.crs, layer.isvisible
+        return (self._providers is None or provider in self._providers) and \
+            (self._crs is None or crs in self._crs) and \
+            (self._visible is None or bool(visible) == self._visible) and \
+            (self._predicate is None or self._predicate(layer))
+
+
+def filter_tree_dict(tree_dict, tree_filter, group_path=()) -> dict:
+    """
+    Keep the part of a layer tree dictionary selected by a filter. The branches the filter rules out are not visited.
+    :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+    :param tree_filter: a TreeFilter
+    :param group_path: path of the groups leading to tree_dict
+    :return: the filtered layer tree dictionary, sharing its layer dictionaries with tree_dict
+    """
+    filtered = {}
+    for key, item in tree_dict.items():
+        path = group_path + (key,)
+        if is_layer_dict(item):
+            if tree_filter.accepts_path(path) and tree_filter.accepts_layer(item):
+                filtered[key] = item
+        elif isinstance(item, dict):
+            if tree_filter.visit_group(path):
+                content = filter_tree_dict(item, tree_filter, path)
+                if content or tree_filter.keeps_empty_group(path):
+                    filtered[key] = content
+        else:                                           # a deep string item adds two empty groups
+            keep_key = tree_filter.keeps_empty_group(path)
+            keep_item = tree_filter.keeps_empty_group(group_path + (item,))
+            if keep_key and keep_item:
+                filtered[key] = item
+            elif keep_key or keep_item:
+                filtered[key if keep_key else item] = {}
+    return filtered
+
+
+def add_filter_arguments(parser) -> None:
+    """
+    Add the --include, --exclude, --provider, --crs and --visible/--hidden options to a command line parser.
+    """
+    parser.add_argument('--include', action='append', default=[], help='group path glob to keep, e.g. "Cadastre/*"')
+    parser.add_argument('--exclude', action='append', default=[], help='group path glob to leave out')
+    parser.add_argument('--provider', action='append', default=None, help='provider of the layers to keep')
+    parser.add_argument('--crs', dest='filter_crs', action='append', default=None, help='CRS of the layers to keep')
+    visibility = parser.add_mutually_exclusive_group()
+    visibility.add_argument('--visible', dest='visible', action='store_const', const=True, default=None,
+                            help='keep only the visible layers')
+    visibility.add_argument('--hidden', dest='visible', action='store_const', const=False,
+                            help='keep only the hidden layers')
+
+
+def filter_from_args(args):
+    """
+    Create the TreeFilter of the options added by add_filter_arguments, None when no option is given.
+    """
+    if not (args.include or args.exclude or args.provider or args.filter_crs or args.visible is not None):
+        return None
+    return TreeFilter(args.include, args.exclude, args.provider, args.filter_crs, args.visible)
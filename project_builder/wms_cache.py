@@ -0,0 +1,167 @@
+import os
+import time
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from datasource_uri import parse_connection_info
+from disk_cache import DiskCache, DEFAULT_CACHE_DIR
+from tree_dict import iter_layer_dicts
+
+DEFAULT_TTL = 24 * 3600
+# Uri parameters changing the capabilities document a server returns, on top of its url.
+KEY_PARAMETERS = ('authcfg', 'username', 'referer', 'tilePixelRatio')
+# Values of the type parameter of wms provider uris that are not served by a WMS server.
+TILE_TYPES = ('xyz', 'wmts')
+
+
+def is_wms_source(uri) -> bool:
+    """
+    Tell if a datasource of the wms provider is a layer of a WMS server. XYZ tiles and WMTS layers, also read by the
+    wms provider, have no WMS capabilities.
+    :param uri: a wms provider datasource uri
+    :return: True for a WMS layer
+    """
+    info = parse_connection_info(uri, 'wms')
+    return info.get('type') not in TILE_TYPES and 'tileMatrixSet' not in info
+
+
+def capabilities_url(uri):
+    """
+    Build the GetCapabilities url of a wms datasource the way the QGIS wms provider does.
+    :param uri: a wms datasource uri, e.g. crs=EPSG:2056&format=image/png&layers=a&url=https://host/wms
+    :return: the capabilities url, None when the uri has no url and so no capabilities to fetch
+    """
+    url = parse_connection_info(uri, 'wms').get('url')
+    if not url:
+        return None
+    if not url.endswith(('?', '&')):
+        url += '&' if '?' in url else '?'
+    return url + 'SERVICE=WMS&REQUEST=GetCapabilities'
+
+
+def capabilities_key(uri):
+    """
+    The cache key of a wms datasource: its capabilities url and the parameters changing the response. None when
+    the uri has no url.
+    """
+    url = capabilities_url(uri)
+    if url is None:
+        return None
+    info = parse_connection_info(uri, 'wms')
+    return (url,) + tuple((k, info[k]) for k in KEY_PARAMETERS if info.get(k))
+
+
+class CapabilitiesCache:
+    """
+    WMS GetCapabilities documents kept on disk between builds. A document younger than ttl seconds is used without
+    contacting the server. An older one is fetched again, and replayed if the server cannot be reached. In offline
+    mode the server is never contacted and whatever is on disk is replayed.
+    """
+    def __init__(self, root=os.path.join(DEFAULT_CACHE_DIR, 'wms'), ttl=DEFAULT_TTL, offline=False, timeout=30,
+                 max_bytes=64 * 1024 * 1024):
+        self._store = DiskCache(root, max_bytes)
+        self._ttl = ttl
+        self._offline = offline
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self.fetch_count = 0
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @property
+    def offline(self):
+        return self._offline
+
+    def _fetch(self, key) -> bytes:
+        referer = dict(key[1:]).get('referer')
+        request = urllib.request.Request(key[0], headers={'Referer': referer} if referer else {})
+        with self._lock:
+            self.fetch_count += 1
+        with urllib.request.urlopen(request, timeout=self._timeout) as response:
+            return response.read()
+
+    def get(self, uri):
+        """
+        Get the capabilities document of a wms datasource, from the disk when it is fresh enough.
+        :param uri: a wms datasource uri
+        :return: the document as bytes, or None if the uri has no url or the document could neither be fetched nor
+            replayed
+        """
+        key = capabilities_key(uri)
+        if key is None:
+            return None
+        cached = self._store.get(key)
+        if cached is not None and (self._offline or time.time() - cached[0] < self._ttl):
+            return cached[1]
+        if self._offline:
+            return None
+        try:
+            content = self._fetch(key)
+        except OSError as e:
+            if cached is None:
+                print('Capabilities of {} could not be fetched ({})'.format(key[0], e))
+                return None
+            print('Capabilities of {} could not be fetched ({}), replaying the cached ones'.format(key[0], e))
+            return cached[1]
+        self._store.put(key, (time.time(), content))
+        return content
+
+    def prefetch(self, uris, max_workers=8) -> dict:
+        """
+        Get the capabilities documents of many wms datasources, fetching each distinct endpoint once and the
+        endpoints concurrently.
+        :param uris: an iterable of wms datasource uris, the ones without url are ignored
+        :param max_workers: maximum number of servers contacted at the same time
+        :return: a dictionary mapping each capabilities url to its document, urls that failed are left out
+        """
+        keys = ((capabilities_key(uri), uri) for uri in uris)
+        uris = {key: uri for key, uri in keys if key is not None}           # one uri per endpoint
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            documents = dict(zip((key[0] for key in uris), executor.map(self.get, uris.values())))
+        return {url: content for url, content in documents.items() if content is not None}
+
+    def prime_tree(self, tree_dict, max_workers=8) -> dict:
+        """
+        Load the capabilities of every wms layer of a tree into the network cache of QGIS, so that creating the
+        layers reads them from there instead of asking every server once per layer. XYZ and WMTS layers are skipped.
+        :param tree_dict: a dictionary of the layer tree including groups, sources, visibility
+        :param max_workers: maximum number of servers contacted at the same time
+        :return: the documents loaded, as returned by prefetch
+        """
+        documents = self.prefetch((layer['URI'] for _, _, layer in iter_layer_dicts(tree_dict)
+                                   if layer['PROVIDER'] == 'wms' and is_wms_source(layer['URI'])), max_workers)
+        seed_network_cache(documents, self._ttl)
+        return documents
+
+
+def seed_network_cache(documents, ttl=DEFAULT_TTL) -> None:
+    """
+    Insert documents in the network disk cache of QGIS, valid for ttl seconds. Requests made with the PreferCache
+    load control, as the wms provider does for capabilities, are then answered without any network access.
+    :param documents: a dictionary mapping urls to their content
+    :param ttl: seconds before QGIS considers the documents expired
+    """
+    from qgis.PyQt.QtCore import QUrl, QDateTime
+    from qgis.PyQt.QtNetwork import QNetworkCacheMetaData, QNetworkRequest
+    from qgis.core import QgsNetworkAccessManager
+
+    network_cache = QgsNetworkAccessManager.instance().cache()
+    if network_cache is None:
+        return
+    now = QDateTime.currentDateTimeUtc()
+    for url, content in documents.items():
+        metadata = QNetworkCacheMetaData()
+        metadata.setUrl(QUrl(url))
+        metadata.setSaveToDisk(True)
+        metadata.setLastModified(now)
+        metadata.setExpirationDate(now.addSecs(max(int(ttl), 1)))
+        metadata.setRawHeaders([(b'Content-Type', b'text/xml')])
+        metadata.setAttributes({QNetworkRequest.HttpStatusCodeAttribute: 200})
+        device = network_cache.prepare(metadata)
+        if device is None:
+            continue
+        device.write(content)
+        network_cache.insert(device)
@@ -0,0 +1,79 @@
+import unittest
+import os
+import json
+import shutil
+import tempfile
+import importlib.util
+import yaml
+from batch_extract import find_projects, write_tree, output_paths, extract_projects
+
+TEST_PROJECT_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'test_project.qgz')
+
+
+class TestBatchExtract(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, 'sub'))
+        for name in ('a.qgz', 'b.qgs', 'notes.txt', os.path.join('sub', 'c.qgz')):
+            open(os.path.join(self.tmp_dir.name, name), 'w').close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_find_projects_in_directory(self):
+        found = [os.path.relpath(p, self.tmp_dir.name) for p in find_projects(self.tmp_dir.name)]
+        self.assertEqual(found, ['a.qgz', 'b.qgs', os.path.join('sub', 'c.qgz')])
+
+    def test_find_projects_with_glob(self):
+        found = find_projects(os.path.join(self.tmp_dir.name, '*.qgz'))
+        self.assertEqual([os.path.basename(p) for p in found], ['a.qgz'])
+
+    def test_output_paths(self):
+        for name in ('a.qgs', os.path.join('sub', 'a.qgz'), 'summary.qgz'):
+            open(os.path.join(self.tmp_dir.name, name), 'w').close()
+        projects = find_projects(self.tmp_dir.name)
+        out = os.path.join(self.tmp_dir.name, 'out')
+        paths = output_paths(projects, self.tmp_dir.name, out)
+        self.assertEqual(sorted(os.path.relpath(p, out) for p in paths.values()),
+                         ['a.yml', 'a_qgz.yml', 'b.yml', os.path.join('sub', 'a.yml'), os.path.join('sub', 'c.yml'),
+                          'summary_qgz.yml'])
+        globbed = output_paths(find_projects(os.path.join(self.tmp_dir.name, 'sub', '*.qgz')),
+                               os.path.join(self.tmp_dir.name, 'sub', '*.qgz'), out, 'json')
+        self.assertEqual(sorted(globbed.values()), [os.path.join(out, 'a.json'), os.path.join(out, 'c.json')])
+
+    def test_extract_projects_without_projects(self):
+        out = os.path.join(self.tmp_dir.name, 'out')
+        summary = extract_projects(os.path.join(self.tmp_dir.name, '*.none'), out)
+        self.assertEqual((summary['succeeded'], summary['failed'], summary['projects']), (0, 0, []))
+        with open(os.path.join(out, 'summary.yml')) as yml:
+            self.assertEqual(yaml.safe_load(yml)['projects'], [])
+
+    @unittest.skipUnless(importlib.util.find_spec('qgis'), 'QGIS is not installed')
+    def test_extract_projects(self):
+        source = os.path.join(self.tmp_dir.name, 'projects')
+        for name in (os.path.join('x', 'p.qgz'), os.path.join('y', 'p.qgz'), 'summary.qgz'):
+            os.makedirs(os.path.dirname(os.path.join(source, name)), exist_ok=True)
+            shutil.copy(TEST_PROJECT_PATH, os.path.join(source, name))
+        out = os.path.join(self.tmp_dir.name, 'out')
+        summary = extract_projects(source, out, workers=2)
+        self.assertEqual((summary['succeeded'], summary['failed']), (3, 0))
+        for name in (os.path.join('x', 'p.yml'), os.path.join('y', 'p.yml'), 'summary_qgz.yml'):
+            with open(os.path.join(out, name)) as yml:
+                self.assertIn('group1', yaml.safe_load(yml))
+        with open(os.path.join(out, 'summary.yml')) as yml:
+            self.assertEqual(len(yaml.safe_load(yml)['projects']), 3)
+
+    def test_write_tree(self):
+        tree = {'group': {'layer': {'URI': 'uri', 'ISVISIBLE': True}}}
+        yml_path = os.path.join(self.tmp_dir.name, 'tree.yml')
+        json_path = os.path.join(self.tmp_dir.name, 'tree.json')
+        write_tree(tree, yml_path)
+        write_tree(tree, json_path, 'json')
+        with open(yml_path) as yml:
+            self.assertEqual(yaml.safe_load(yml), tree)
+        with open(json_path) as js:
+            self.assertEqual(json.load(js), tree)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import unittest
+import os
+import json
+import time
+import socket
+import tempfile
+import threading
+from unittest import mock
+import yaml
+from build_daemon import BuildDaemon, ConfigStore, send_request
+from disk_cache import DiskCache
+
+
+class TestConfigStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.conf_path = os.path.join(self.tmp_dir.name, 'conf.yml')
+        with open(self.conf_path, 'w') as yml:
+            yml.write('a: 1\n')
+        self.store = ConfigStore()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_keeps_parsed_config(self):
+        self.assertEqual(self.store.get(self.conf_path), {'a': 1})
+        self.assertIs(self.store.get(self.conf_path), self.store.get(self.conf_path))
+
+    def test_changed(self):
+        self.assertTrue(self.store.changed(self.conf_path))
+        self.store.get(self.conf_path)
+        self.assertFalse(self.store.changed(self.conf_path))
+        with open(self.conf_path, 'w') as yml:
+            yml.write('a: 22\n')
+        self.assertTrue(self.store.changed(self.conf_path))
+        self.assertEqual(self.store.get(self.conf_path), {'a': 22})
+
+    def test_invalid_config_is_not_parsed_again(self):
+        with open(self.conf_path, 'w') as yml:
+            yml.write('a: [\n')
+        with self.assertRaises(yaml.YAMLError):
+            self.store.get(self.conf_path)
+        self.assertFalse(self.store.changed(self.conf_path))
+        with mock.patch('build_daemon.load_config') as load:
+            with self.assertRaises(yaml.YAMLError):
+                self.store.get(self.conf_path)
+            load.assert_not_called()
+
+    def test_second_build_does_not_parse_again(self):
+        cache = DiskCache(os.path.join(self.tmp_dir.name, 'cache'))
+        self.assertEqual(ConfigStore(cache).get(self.conf_path), {'a': 1})
+        with mock.patch('config_parser.yaml.load') as yaml_load:
+            self.assertEqual(ConfigStore(cache).get(self.conf_path), {'a': 1})
+            yaml_load.assert_not_called()
+
+    def test_missing_file_is_not_changed(self):
+        self.assertFalse(self.store.changed(os.path.join(self.tmp_dir.name, 'missing.yml')))
+
+
+class TestBuildDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmp_dir.name, 'daemon.sock')
+        self.daemon = BuildDaemon(self.socket_path, poll_interval=0.05, request_timeout=0.5)
+        self.thread = threading.Thread(target=self.daemon.serve)
+        self.thread.start()
+        while not os.path.exists(self.socket_path):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            send_request(self.socket_path, {'action': 'shutdown'}, timeout=5)
+        self.thread.join(5)
+        self.tmp_dir.cleanup()
+
+    def test_ping(self):
+        response = send_request(self.socket_path, {'action': 'ping'}, timeout=5)
+        self.assertEqual(response['status'], 'ok')
+        self.assertEqual(response['pid'], os.getpid())
+
+    def test_unknown_action(self):
+        response = send_request(self.socket_path, {'action': 'explode'}, timeout=5)
+        self.assertEqual(response['status'], 'error')
+        self.assertIn('explode', response['error'])
+
+    def test_invalid_config_fails_before_qgis(self):
+        config_path = os.path.join(self.tmp_dir.name, 'tree.yml')
+        with open(config_path, 'w') as yml:
+            yml.write('layer: {URI: a, NAME: a, PROVIDER: shapefile, ISVISIBLE: true, CRS: EPSG:2056, JOINS: {}}\n')
+        response = send_request(self.socket_path, {'action': 'build', 'config': config_path,
+                                                   'output': os.path.join(self.tmp_dir.name, 'p.qgz')}, timeout=5)
+        self.assertEqual(response['status'], 'error')
+        self.assertIn('layer/PROVIDER: unknown provider shapefile', response['error'])
+
+    def test_running_daemon_socket_is_kept(self):
+        with self.assertRaises(OSError):
+            BuildDaemon(self.socket_path).serve()
+        self.assertEqual(send_request(self.socket_path, {'action': 'ping'}, timeout=5)['status'], 'ok')
+
+    def test_stale_socket_is_replaced(self):
+        stale_path = os.path.join(self.tmp_dir.name, 'stale.sock')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+            stale.bind(stale_path)
+        daemon = BuildDaemon(stale_path, poll_interval=0.05)
+        thread = threading.Thread(target=daemon.serve)
+        thread.start()
+        try:
+            for _ in range(500):
+                try:
+                    response = send_request(stale_path, {'action': 'shutdown'}, timeout=5)
+                    break
+                except ConnectionRefusedError:
+                    time.sleep(0.01)
+            self.assertEqual(response['status'], 'ok')
+        finally:
+            thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_socket_is_private(self):
+        self.assertEqual(send_request(self.socket_path, {'action': 'ping'}, timeout=5)['status'], 'ok')
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_silent_client_does_not_block(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as silent:
+            silent.connect(self.socket_path)
+            self.assertEqual(send_request(self.socket_path, {'action': 'ping'}, timeout=5)['status'], 'ok')
+
+    def test_repeated_watch_is_built_once(self):
+        config_path = os.path.join(self.tmp_dir.name, 'tree.yml')
+        with open(config_path, 'w') as yml:
+            yml.write('a: 1\n')
+        daemon = BuildDaemon(os.path.join(self.tmp_dir.name, 'other.sock'))
+        request = json.dumps({'action': 'watch', 'config': config_path, 'output': 'p.qgz'})
+        with mock.patch('build_daemon.check_tree', side_effect=ValueError('invalid')) as check:
+            daemon.handle(request)
+            daemon.handle(request)
+            with open(config_path, 'w') as yml:
+                yml.write('a: 22\n')
+            check.reset_mock()
+            daemon._rebuild_changed()
+            self.assertEqual(check.call_count, 1)
+
+    def test_shutdown_removes_socket(self):
+        self.assertEqual(send_request(self.socket_path, {'action': 'shutdown'}, timeout=5)['status'], 'ok')
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,10 @@
 import unittest
-from config_parser import load_config
+import os
+import argparse
+import tempfile
+from unittest import mock
+from config_parser import load_config, add_cache_arguments, cache_from_args, CONFIG_CACHE
+from disk_cache import DiskCache
 
 
 class TestLoading(unittest.TestCase):
@@ -17,5 +22,49 @@ class TestLoading(unittest.TestCase):
             load_config('a-very_b@d-path/conf.conf')
 
 
+class TestCachedLoading(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp_dir.name, 'cache'))
+        self.conf_path = os.path.join(self.tmp_dir.name, 'conf.yml')
+        with open(self.conf_path, 'w') as yml:
+            yml.write('group:\n  layer: 1\n')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_unchanged_config_is_not_parsed_again(self):
+        self.assertEqual(load_config(self.conf_path, self.cache), {'group': {'layer': 1}})
+        with mock.patch('config_parser.yaml.load') as yaml_load:
+            self.assertEqual(load_config(self.conf_path, self.cache), {'group': {'layer': 1}})
+            yaml_load.assert_not_called()
+
+    def test_changed_config_is_parsed(self):
+        load_config(self.conf_path, self.cache)
+        with open(self.conf_path, 'w') as yml:
+            yml.write('group:\n  layer: 2\n')
+        os.utime(self.conf_path, ns=(0, 0))
+        self.assertEqual(load_config(self.conf_path, self.cache), {'group': {'layer': 2}})
+
+    def test_without_cache(self):
+        self.assertEqual(load_config(self.conf_path, None), {'group': {'layer': 1}})
+        self.assertEqual(os.path.exists(self.cache.root), False)
+
+
+class TestCacheArguments(unittest.TestCase):
+    def parse(self, argv, default=True):
+        parser = argparse.ArgumentParser()
+        add_cache_arguments(parser, default)
+        return cache_from_args(parser.parse_args(argv))
+
+    def test_cache_by_default(self):
+        self.assertIs(self.parse([]), CONFIG_CACHE)
+        self.assertIsNone(self.parse(['--no-cache']))
+
+    def test_opt_in(self):
+        self.assertIsNone(self.parse([], default=False))
+        self.assertIs(self.parse(['--cache'], default=False), CONFIG_CACHE)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import unittest
+import tempfile
+import subprocess
+from config_validator import validate_tree, validate_config, check_tree, ConfigProblem
+from tree_fixtures import layer
+
+
+def join(join_layer_id, **values):
+    return dict({'join_layer_id': join_layer_id, 'join_field_name': 'id', 'target_field_name': 'road_id',
+                 'memory_cache': False, 'prefix': '', 'field_subset': None}, **values)
+
+
+class TestConfigValidation(unittest.TestCase):
+    def assertProblems(self, tree, expected):
+        self.assertEqual([str(problem) for problem in validate_tree(tree)], expected)
+
+    def test_valid_tree(self):
+        tree = {'network': {'roads': layer('roads'), 'empty': {}, 'deep': 'item'},
+                'parcels': layer('parcels', 'postgres', CRS='', JOINS={0: join('roads_1', join_layer_name='roads')}),
+                'background': layer('background', 'wms', STYLE='0' * 64)}
+        self.assertEqual(validate_tree(tree), [])
+
+    def test_root(self):
+        self.assertEqual(validate_tree(None), [ConfigProblem((), 'expected a mapping of groups and layers, got null')])
+
+    def test_layer_keys_and_types(self):
+        self.assertProblems({'g': {'a': {'URI': 'x', 'NAME': 'a', 'PROVIDER': 'ogr', 'COLOR': 'red'}}},
+                            ['g/a: missing key(s) ISVISIBLE, CRS, JOINS', 'g/a: unknown key(s) COLOR'])
+        self.assertProblems({'a': layer('a', ISVISIBLE='yes')}, ['a/ISVISIBLE: expected a boolean, got a string'])
+        self.assertProblems({'a': layer('')}, ['a/NAME: empty layer name'])
+
+    def test_provider_crs_and_style(self):
+        self.assertProblems({'a': layer('a', 'shapefile', CRS='2056', STYLE='abc')},
+                            ['a/PROVIDER: unknown provider shapefile, expected one of postgres, ogr, memory, wms',
+                             'a/CRS: invalid CRS 2056, expected e.g. EPSG:2056',
+                             'a/STYLE: invalid style reference abc'])
+        self.assertEqual(validate_tree({'a': layer('a', CRS='IGNF:LAMB93'), 'b': layer('b', CRS='PROJ:+proj=longlat')}),
+                         [])
+
+    def test_groups(self):
+        self.assertProblems({'g': None, 1: {}, 'h': ['a']}, ['g: no content, use {} for an empty group',
+                                                            '1: names must be strings, got a number',
+                                                            'h: expected a group or a layer, got a list'])
+
+    def test_joins(self):
+        tree = {'roads': layer('roads'),
+                'bg': layer('bg', 'wms'),
+                'parcels': layer('parcels', JOINS={0: join('roads_0b6ad0fd_34b4_4ab8_8a0e_7f0d4a9d2c11'),
+                                                   1: join('unknown_layer'),
+                                                   2: join('bg', join_layer_name='bg'),
+                                                   3: {'join_layer_id': 'roads', 'memory_cache': 'no'},
+                                                   4: join('roads', field_subset=[1])})}
+        self.assertProblems(tree, [
+            'parcels/JOINS/3: missing key(s) join_field_name, target_field_name, prefix, field_subset',
+            'parcels/JOINS/3/memory_cache: expected a boolean, got a string',
+            'parcels/JOINS/4/field_subset: expected a list of field names',
+            'parcels/JOINS/1/join_layer_id: no layer of the tree matches unknown_layer, or several layers of '
+            'different sources do',
+            'parcels/JOINS/2/join_layer_id: the joined layer must be a vector layer'])
+        self.assertProblems({'bg': layer('bg', 'wms', JOINS={0: join('bg', join_layer_name='bg')})},
+                            ['bg/JOINS: joins are only supported on vector layers',
+                             'bg/JOINS/0/join_layer_id: the joined layer must be a vector layer'])
+
+    def test_check_tree(self):
+        check_tree({'a': layer('a')})
+        with self.assertRaises(ValueError):
+            check_tree({'a': layer('a', 'shapefile')})
+
+
+class TestConfigFiles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, 'w') as yml:
+            yml.write(content)
+        return path
+
+    def test_validate_config(self):
+        self.assertEqual(validate_config(self.write('ok.yml', 'empty: {}\n'), cache=None), [])
+        self.assertEqual(validate_config(os.path.join(self.tmp_dir.name, 'missing.yml'), cache=None),
+                         [ConfigProblem((), 'file not found')])
+        problems = validate_config(self.write('bad.yml', 'a: [\n'), cache=None)
+        self.assertTrue(problems[0].message.startswith('invalid YAML'))
+
+    def test_command_does_not_import_qgis(self):
+        path = self.write('tree.yml', 'a: {URI: x, NAME: a, PROVIDER: ogr, ISVISIBLE: true, CRS: EPSG:2056}\n')
+        script = os.path.join(os.path.dirname(__file__), '..', 'project_builder', 'config_validator.py')
+        code = ('import sys, runpy; sys.argv = {!r}\n'
+                'try:\n    runpy.run_path({!r}, run_name="__main__")\n'
+                'except SystemExit as e:\n    print(e.code, "qgis" in sys.modules)').format([script, path], script)
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                                cwd=os.path.dirname(script))
+        self.assertIn('a: missing key(s) JOINS', result.stdout)
+        self.assertTrue(result.stdout.strip().endswith('1 False'))
+
+
+if __name__ == '__main__':
+    unittest.main()
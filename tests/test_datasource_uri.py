@@ -0,0 +1,89 @@
+import unittest
+from datasource_uri import parse_connection_info, UriIndex
+from tree_dict import iter_tree_dict
+from tree_fixtures import layer
+
+POSTGRES_URI = "service='qgaz_local' sslmode=disable key='id' srid=21781 type=MultiPolygon " \
+               "checkPrimaryKeyUnicity='0' table=\"gaz\".\"installation_chamber_polygon\" (geometry)"
+
+
+class TestParseConnectionInfo(unittest.TestCase):
+    def test_postgres(self):
+        info = parse_connection_info(POSTGRES_URI)
+        self.assertEqual(info['service'], 'qgaz_local')
+        self.assertEqual(info['srid'], '21781')
+        self.assertEqual(info['key'], 'id')
+        self.assertEqual(info['table'], 'gaz.installation_chamber_polygon')
+        self.assertEqual((info['schema'], info['table_name']), ('gaz', 'installation_chamber_polygon'))
+        self.assertEqual(info['geometry_column'], ['geometry'])
+
+    def test_quoted_values_with_spaces_and_dots(self):
+        info = parse_connection_info("dbname='my db' user='o\\'neil' table=\"public\".\"v1.2\" (geom) "
+                                     "sql=\"name\" = 'a b.c'", 'postgres')
+        self.assertEqual(info['dbname'], 'my db')
+        self.assertEqual(info['user'], "o'neil")
+        self.assertEqual(info['table_name'], 'v1.2')
+        self.assertEqual(info['sql'], "\"name\" = 'a b.c'")
+
+    def test_aspatial_table(self):
+        self.assertEqual(parse_connection_info('dbname=gis table="public"."owners"')['geometry_column'], [])
+
+    def test_postgres_with_pipes(self):
+        info = parse_connection_info("dbname='gis' table=\"public\".\"roads\" (geom) sql=\"a\" || \"b\" = 'ab'")
+        self.assertEqual(info['dbname'], 'gis')
+        self.assertEqual(info['table_name'], 'roads')
+        self.assertEqual(info['sql'], '"a" || "b" = \'ab\'')
+        self.assertEqual(parse_connection_info('roads.gpkg|layername=roads')['path'], 'roads.gpkg')
+
+    def test_ogr(self):
+        info = parse_connection_info('/data/my roads.gpkg|layername=roads|subset="class" = 1', 'ogr')
+        self.assertEqual(info['path'], '/data/my roads.gpkg')
+        self.assertEqual(info['layername'], 'roads')
+        self.assertEqual(info['subset'], '"class" = 1')
+        self.assertEqual(parse_connection_info('/data/roads.shp')['path'], '/data/roads.shp')
+
+    def test_wms(self):
+        info = parse_connection_info('crs=EPSG:2056&format=image/png&layers=a&layers=b&styles&'
+                                     'url=https://wms.example.org:8080/service?map=x')
+        self.assertEqual(info['layers'], 'a,b')
+        self.assertEqual(info['url'], 'https://wms.example.org:8080/service?map=x')
+        self.assertEqual((info['host'], info['port']), ('wms.example.org', '8080'))
+
+    def test_result_is_a_copy(self):
+        parse_connection_info(POSTGRES_URI)['service'] = 'changed'
+        parse_connection_info(POSTGRES_URI)['geometry_column'].append('changed')
+        self.assertEqual(parse_connection_info(POSTGRES_URI)['service'], 'qgaz_local')
+        self.assertEqual(parse_connection_info(POSTGRES_URI)['geometry_column'], ['geometry'])
+
+
+class TestUriIndex(unittest.TestCase):
+    def setUp(self):
+        self.tree_dict = {
+            'cadastre': {
+                'parcels': layer('parcels', 'postgres', 'host=db1 dbname=gis table="cad"."parcels" (geom)'),
+                'owners': layer('owners', 'postgres', 'host=db1 dbname=registry table="cad"."owners"'),
+            },
+            'pipes': layer('pipes', 'postgres', 'host=db2 dbname=gis table="net"."pipes" (geom)'),
+            'roads': layer('roads', 'ogr', '/data/roads.gpkg|layername=roads'),
+            'ortho': layer('ortho', 'wms', 'crs=EPSG:2056&layers=ortho&url=https://wms.example.org/wms'),
+        }
+        self.index = UriIndex(iter_tree_dict(self.tree_dict))
+
+    def test_find(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual([r.name for _, r in self.index.find(host='db1')], ['parcels', 'owners'])
+        self.assertEqual([r.name for _, r in self.index.find(host='db1', dbname='gis')], ['parcels'])
+        self.assertEqual([r.name for _, r in self.index.find(dbname='gis', table_name='pipes')], ['pipes'])
+        self.assertEqual([r.name for _, r in self.index.find(path='/data/roads.gpkg')], ['roads'])
+        self.assertEqual([r.name for _, r in self.index.find(host='wms.example.org')], ['ortho'])
+        self.assertEqual(self.index.find(host='db3'), [])
+
+    def test_group_path(self):
+        self.assertEqual(self.index.find(table='cad.owners')[0][0], ('cadastre',))
+
+    def test_values(self):
+        self.assertEqual(self.index.values('host'), {'db1', 'db2', 'wms.example.org'})
+
+
+if __name__ == '__main__':
+    unittest.main()
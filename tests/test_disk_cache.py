@@ -0,0 +1,55 @@
+import unittest
+import os
+import pickle
+import tempfile
+from disk_cache import DiskCache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(os.path.join(self.tmp_dir.name, 'cache'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_missing_key(self):
+        self.assertIsNone(self.cache.get(('missing',)))
+        self.assertEqual(self.cache.get(('missing',), 'default'), 'default')
+
+    def test_put_and_get(self):
+        self.cache.put(('path', 1), {'group': {'layer': [1, 2]}})
+        self.assertEqual(self.cache.get(('path', 1)), {'group': {'layer': [1, 2]}})
+        self.assertIsNone(self.cache.get(('path', 2)))
+
+    def test_eviction_keeps_recent_entries(self):
+        cache = DiskCache(self.cache.root, max_bytes=2500)
+        for i in range(3):
+            cache.put(i, 'x' * 1000)
+            os.utime(cache._path(i), ns=(i * 10 ** 9, i * 10 ** 9))
+        cache.put(3, 'x' * 1000)
+        self.assertIsNone(cache.get(0))
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(3), 'x' * 1000)
+
+    def test_get_unreadable_entry(self):
+        self.cache.put('key', 'value')
+        for content in (b'', b'\x80\x04\x95', pickle.dumps(1),
+                        b'\x80\x04cmissing_module\nValue\n.', b'\x80\x04c__main__\nMissingValue\n.'):
+            with open(self.cache._path('key'), 'wb') as f:
+                f.write(content)
+            self.assertEqual(self.cache.get('key', 'default'), 'default')
+
+    def test_failed_put_leaves_no_file(self):
+        self.cache.put('key', lambda: None)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.cache.root), [])
+
+    def test_clear(self):
+        self.cache.put('key', 'value')
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+
+if __name__ == '__main__':
+    unittest.main()
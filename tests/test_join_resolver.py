@@ -0,0 +1,67 @@
+import unittest
+from join_resolver import LayerIdRemap, use_memory_cache, sanitize_layer_name
+
+ROADS_ID = 'roads_2021_5c5a9847_4e4c_57ba_a376_b94078d80b8c'
+
+
+def join(join_layer_id, **hints):
+    return dict({'join_layer_id': join_layer_id, 'join_field_name': 'id', 'target_field_name': 'id',
+                 'memory_cache': False, 'prefix': '', 'field_subset': None}, **hints)
+
+
+class TestLayerIdRemap(unittest.TestCase):
+    def setUp(self):
+        self.remap = LayerIdRemap([
+            ('roads_2021_new', 'roads 2021', '/data/roads.gpkg'),
+            ('parcels_a', 'parcels', "dbname='gis' host=db1 table=\"cad\".\"parcels\""),
+            ('parcels_b', 'parcels', "dbname='gis' host=db2 table=\"cad\".\"parcels\""),
+            ('pipes_a', 'pipes', '/data/pipes.gpkg'),
+            ('pipes_b', 'pipes', '/data/pipes.gpkg'),
+        ])
+
+    def test_sanitize_layer_name(self):
+        self.assertEqual(sanitize_layer_name('roads 2021-v2'), 'roads_2021_v2')
+        self.assertEqual(sanitize_layer_name('Gewässer Zürich'), 'Gew_sser_Z_rich')
+
+    def test_existing_id(self):
+        self.assertEqual(self.remap.resolve(join('parcels_b')), 'parcels_b')
+
+    def test_generated_id_prefix(self):
+        self.assertEqual(self.remap.resolve(join(ROADS_ID)), 'roads_2021_new')
+
+    def test_same_source_is_not_ambiguous(self):
+        self.assertEqual(self.remap.resolve(join('pipes_' + ROADS_ID[len('roads_2021_'):])), 'pipes_a')
+
+    def test_ambiguous_name(self):
+        self.assertIsNone(self.remap.resolve(join('parcels_' + ROADS_ID[len('roads_2021_'):])))
+        self.assertIsNone(self.remap.resolve(join('parcels', join_layer_name='parcels')))
+
+    def test_hints(self):
+        uri = "dbname='gis' host=db2 table=\"cad\".\"parcels\""
+        self.assertEqual(self.remap.resolve(join('old', join_layer_uri=uri)), 'parcels_b')
+        self.assertEqual(self.remap.resolve(join('old', join_layer_name='roads 2021')), 'roads_2021_new')
+
+    def test_unknown(self):
+        self.assertIsNone(self.remap.resolve(join('unknown')))
+        self.assertIsNone(self.remap.resolve(join('unknown_' + ROADS_ID[len('roads_2021_'):])))
+
+
+class TestMemoryCachePolicy(unittest.TestCase):
+    def test_keep(self):
+        self.assertTrue(use_memory_cache('keep', join('a', memory_cache=True), 10 ** 9))
+        self.assertFalse(use_memory_cache('keep', join('a'), 1))
+
+    def test_auto(self):
+        self.assertTrue(use_memory_cache('auto', join('a'), 100, threshold=100))
+        self.assertFalse(use_memory_cache('auto', join('a', memory_cache=True), 101, threshold=100))
+        self.assertFalse(use_memory_cache('auto', join('a'), -1))
+
+    def test_forced(self):
+        self.assertTrue(use_memory_cache(True, join('a'), 10 ** 9))
+        self.assertFalse(use_memory_cache(False, join('a', memory_cache=True), 1))
+        with self.assertRaises(ValueError):
+            use_memory_cache('sometimes', join('a'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
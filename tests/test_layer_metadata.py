@@ -0,0 +1,143 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from layer_metadata import LayerMetadata, MetadataCache, source_marker, enrich_tree_dict
+from config_validator import validate_tree
+from tree_dict import is_layer_dict
+
+
+class FakeQuery:
+    """
+    Stand-in for query_layer_metadata recording the sources it is asked for, sources listed in hang never answer.
+    """
+    def __init__(self, hang=()):
+        self.calls = []
+        self.hang = hang
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+
+    def __call__(self, provider, uri):
+        with self.lock:
+            self.calls.append((provider, uri))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        try:
+            if uri in self.hang:
+                self.release.wait(5)
+            else:
+                time.sleep(0.02)
+            if uri.endswith('broken'):
+                raise RuntimeError('cannot open')
+            return LayerMetadata((0.0, 0.0, 1.0, 1.0), 3, 'Point', (('id', 'Integer'),), True)
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_path = os.path.join(self.tmp_dir.name, 'points.geojson')
+        with open(self.data_path, 'w') as data:
+            data.write('{}')
+        self.query = FakeQuery()
+        self.cache = MetadataCache(os.path.join(self.tmp_dir.name, 'cache'), query=self.query, timeout=1)
+
+    def tearDown(self):
+        self.query.release.set()
+        self.tmp_dir.cleanup()
+
+    def test_file_source_is_cached_until_changed(self):
+        self.assertEqual(self.cache.get('ogr', self.data_path).feature_count, 3)
+        self.assertEqual(self.cache.get('ogr', self.data_path).geometry_type, 'Point')
+        self.assertEqual(len(self.query.calls), 1)
+        with open(self.data_path, 'w') as data:
+            data.write('{"type": "FeatureCollection"}')
+        self.cache.get('ogr', self.data_path)
+        self.assertEqual(len(self.query.calls), 2)
+
+    def test_source_marker(self):
+        self.assertIsNone(source_marker('postgres', "dbname='gis' table=\"a\".\"b\" (geom)"))
+        self.assertIsNone(source_marker('ogr', os.path.join(self.tmp_dir.name, 'missing.gpkg')))
+        stat = os.stat(self.data_path)
+        self.assertEqual(source_marker('ogr', self.data_path + '|layername=points'), (stat.st_mtime_ns, stat.st_size))
+        shp_path = os.path.join(self.tmp_dir.name, 'roads.shp')
+        shutil.copy(self.data_path, shp_path)
+        self.assertFalse(source_marker('ogr', shp_path)[-1])
+        shutil.copy(self.data_path, os.path.join(self.tmp_dir.name, 'roads.qix'))
+        self.assertTrue(source_marker('ogr', shp_path)[-1])
+
+    def test_sources_without_marker_expire(self):
+        uri = "dbname='gis' table=\"a\".\"b\" (geom)"
+        self.cache.get('postgres', uri)
+        self.cache.get('postgres', uri)
+        self.assertEqual(len(self.query.calls), 1)
+        expired = MetadataCache(os.path.join(self.tmp_dir.name, 'cache'), ttl=0, query=self.query)
+        expired.get('postgres', uri)
+        self.assertEqual(len(self.query.calls), 2)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.cache.get('postgres', 'broken').error, 'RuntimeError: cannot open')
+        self.cache.get('postgres', 'broken')
+        self.assertEqual(len(self.query.calls), 2)
+
+    def test_timeout(self):
+        self.query.hang = ('slow',)
+        self.cache = MetadataCache(os.path.join(self.tmp_dir.name, 'cache'), query=self.query, timeout=0.2)
+        start = time.perf_counter()
+        results = self.cache.collect([('wms', 'slow'), ('ogr', self.data_path)], max_workers=1)
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(results[('wms', 'slow')].error, 'timed out after 0.2s')
+        self.assertIsNone(results[('ogr', self.data_path)].error)
+        self.assertEqual(self.cache.abandoned, 1)
+        self.assertEqual(self.cache.join_abandoned(0.05), 1)
+        self.query.release.set()
+        self.assertEqual(self.cache.join_abandoned(), 0)
+
+    def test_abandoned_queries_are_bounded(self):
+        self.query.hang = ('slow_1', 'slow_2', 'slow_3')
+        self.cache = MetadataCache(os.path.join(self.tmp_dir.name, 'cache'), query=self.query, timeout=0.1,
+                                   max_abandoned=2)
+        results = self.cache.collect([('wms', 'slow_1'), ('wms', 'slow_2'), ('wms', 'slow_3')], max_workers=1)
+        self.assertEqual(len(self.query.calls), 2)
+        self.assertEqual(results[('wms', 'slow_3')].error, 'not queried, 2 sources are not answering')
+
+    def test_cache_entries_are_plain_tuples(self):
+        self.cache.get('ogr', self.data_path)
+        entry = self.cache._store.get(('ogr', self.data_path, source_marker('ogr', self.data_path)))
+        self.assertIs(type(entry[1]), tuple)
+        self.assertIsInstance(self.cache.get('ogr', self.data_path), LayerMetadata)
+
+    def test_collect_is_concurrent_and_bounded(self):
+        sources = [('postgres', 'table_{}'.format(i)) for i in range(12)] * 2
+        results = self.cache.collect(sources, max_workers=4)
+        self.assertEqual(len(results), 12)
+        self.assertEqual(len(self.query.calls), 12)
+        self.assertGreater(self.query.max_running, 1)
+        self.assertLessEqual(self.query.max_running, 4)
+
+
+class TestTreeEnrichment(unittest.TestCase):
+    def test_enrich_tree_dict(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            layer = {'URI': 'table_1', 'NAME': 'a', 'PROVIDER': 'postgres', 'ISVISIBLE': True, 'CRS': 'EPSG:2056',
+                     'JOINS': {}}
+            tree = {'group': {'a': layer, 'b': dict(layer, NAME='b', URI='broken')}, 'deep': 'item'}
+            enriched = enrich_tree_dict(tree, MetadataCache(tmp_dir, query=FakeQuery()))
+        self.assertNotIn('METADATA', layer)
+        self.assertEqual(enriched['group']['a']['METADATA'], {
+            'extent': [0.0, 0.0, 1.0, 1.0], 'feature_count': 3, 'geometry_type': 'Point',
+            'fields': [{'name': 'id', 'type': 'Integer'}], 'spatial_index': True})
+        self.assertEqual(enriched['group']['b']['METADATA'], {'error': 'RuntimeError: cannot open'})
+        self.assertEqual(enriched['deep'], 'item')
+        self.assertTrue(is_layer_dict(enriched['group']['a']))
+        self.assertEqual(validate_tree(enriched), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
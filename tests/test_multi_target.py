@@ -0,0 +1,40 @@
+import unittest
+import copy
+from multi_target import merge_tree
+
+LAYER = {'URI': "dbname='gis' host=db1 table=\"cad\".\"parcels\" (geom)", 'NAME': 'parcels', 'PROVIDER': 'postgres',
+         'ISVISIBLE': True, 'CRS': 'EPSG:2056', 'JOINS': {}}
+
+
+class TestMergeTree(unittest.TestCase):
+    def setUp(self):
+        self.base = {'cadastre': {'parcels': dict(LAYER), 'buildings': dict(LAYER, NAME='buildings')},
+                     'background': {'empty': {}}}
+        self.base_copy = copy.deepcopy(self.base)
+
+    def test_no_override(self):
+        self.assertEqual(merge_tree(self.base), self.base)
+
+    def test_partial_layer_override(self):
+        merged = merge_tree(self.base, {'cadastre': {'parcels': {'ISVISIBLE': False}}})
+        self.assertFalse(merged['cadastre']['parcels']['ISVISIBLE'])
+        self.assertEqual(merged['cadastre']['parcels']['URI'], LAYER['URI'])
+        self.assertEqual(self.base, self.base_copy)
+
+    def test_complete_layer_replaces(self):
+        other = dict(LAYER, URI="dbname='gis' host=db2 table=\"cad\".\"parcels\" (geom)")
+        merged = merge_tree(self.base, {'cadastre': {'parcels': other}})
+        self.assertEqual(merged['cadastre']['parcels'], other)
+
+    def test_none_removes(self):
+        merged = merge_tree(self.base, {'background': None, 'cadastre': {'buildings': None, 'missing': None}})
+        self.assertEqual(merged, {'cadastre': {'parcels': LAYER}})
+
+    def test_overrides_apply_in_order(self):
+        merged = merge_tree(self.base, {'added': {'a': 1}}, {'added': {'a': 2}}, None)
+        self.assertEqual(merged['added'], {'a': 2})
+        self.assertEqual(list(merged), ['cadastre', 'background', 'added'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import sys
+import unittest
+from unittest import mock
+from postgres_preflight import group_postgres_layers, check_postgres_layers
+from tree_fixtures import layer
+
+DB1 = "host=db1 dbname='gis' user='reader' table=\"cad\".\"{}\""
+
+
+class FakeDriver:
+    """
+    Stand-in for a DB-API driver answering the catalog query from a dictionary of {(host, dbname): {(schema, table):
+    [columns]}} and recording the connections it opens.
+    """
+    def __init__(self, catalogs):
+        self.catalogs = catalogs
+        self.connections = []
+        self.queries = []
+
+    def connect(self, **params):
+        if (params.get('host'), params.get('dbname')) not in self.catalogs:
+            raise ConnectionError('could not connect to {}'.format(params.get('host')))
+        self.connections.append(params)
+        return FakeConnection(self, self.catalogs[(params.get('host'), params.get('dbname'))])
+
+
+class FakeConnection:
+    def __init__(self, driver, catalog):
+        self.driver = driver
+        self.catalog = catalog
+        self.rows = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, params):
+        self.driver.queries.append(query)
+        tables = set(zip(params[::2], params[1::2]))
+        self.rows = [(s, t, c) for (s, t), columns in self.catalog.items() if (s, t) in tables for c in columns]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class TestPostgresPreflight(unittest.TestCase):
+    def setUp(self):
+        self.tree_dict = {
+            'cadastre': {
+                'parcels': layer('parcels', 'postgres', DB1.format('parcels') + ' (geom)'),
+                'buildings': layer('buildings', 'postgres', DB1.format('buildings') + ' (geom)'),
+                'owners': layer('owners', 'postgres', DB1.format('owners')),
+            },
+            'network': {
+                'pipes': layer('pipes', 'postgres', "host=db2 dbname='water' table=\"net\".\"pipes\" (the_geom)"),
+                'roads': layer('roads', uri='/data/roads.gpkg|layername=roads'),
+            },
+        }
+        self.driver = FakeDriver({('db1', 'gis'): {('cad', 'parcels'): ['id', 'geom'],
+                                                   ('cad', 'owners'): ['id', 'name'],
+                                                   ('cad', 'buildings'): ['id', 'geometry']},
+                                  ('db2', 'water'): {}})
+
+    def test_group_by_connection(self):
+        groups = group_postgres_layers(self.tree_dict)
+        self.assertEqual(len(groups), 2)
+        db1 = groups[(('host', 'db1'), ('dbname', 'gis'), ('user', 'reader'))]
+        self.assertEqual([c['NAME'] for c in db1], ['parcels', 'buildings', 'owners'])
+        self.assertEqual(db1[0]['schema'], 'cad')
+        self.assertEqual(db1[0]['geometry_column'], 'geom')
+        self.assertIsNone(db1[2]['geometry_column'])
+
+    def test_one_connection_and_query_per_database(self):
+        check_postgres_layers(self.tree_dict, self.driver.connect)
+        self.assertEqual(len(self.driver.connections), 2)
+        self.assertEqual(len(self.driver.queries), 2)
+
+    def test_problems(self):
+        problems = check_postgres_layers(self.tree_dict, self.driver.connect)
+        self.assertEqual([(p['NAME'], p['error']) for p in problems],
+                         [('buildings', 'missing geometry column geom in cad.buildings'),
+                          ('pipes', 'missing table net.pipes')])
+
+    def test_connection_failure(self):
+        del self.driver.catalogs[('db2', 'water')]
+        problems = check_postgres_layers(self.tree_dict, self.driver.connect)
+        self.assertEqual(problems[-1]['NAME'], 'pipes')
+        self.assertTrue(problems[-1]['error'].startswith('connection failed'))
+
+    def test_missing_driver(self):
+        with mock.patch.dict(sys.modules, {'psycopg2': None}):
+            with self.assertRaisesRegex(ImportError, 'psycopg2 is needed'):
+                check_postgres_layers(self.tree_dict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import json
+import pstats
+import tempfile
+import profiling
+from profiling import Profiler, phase, layer_phase, source_host, active_profiler
+
+
+class TestProfiler(unittest.TestCase):
+    def test_phases_are_recorded(self):
+        profiler = Profiler()
+        with profiler.phase('build', count=2):
+            with profiler.phase('layer a', 'layer', provider='ogr') as args:
+                args['host'] = 'file.gpkg'
+            with profiler.phase('layer b', 'layer'):
+                pass
+        events = profiler.events
+        self.assertEqual([e['name'] for e in events], ['layer a', 'layer b', 'build'])
+        self.assertEqual(events[0]['args'], {'provider': 'ogr', 'host': 'file.gpkg'})
+        self.assertGreaterEqual(events[2]['duration'], events[0]['duration'] + events[1]['duration'])
+        self.assertEqual(profiler.summary(), {'build': {'count': 1, 'duration': events[2]['duration']}})
+
+    def test_chrome_trace(self):
+        profiler = Profiler()
+        with profiler.phase('outer'):
+            with profiler.phase('inner'):
+                pass
+        trace = profiler.to_chrome_trace()['traceEvents']
+        self.assertEqual([e['name'] for e in trace], ['outer', 'inner'])
+        self.assertEqual({e['ph'] for e in trace}, {'X'})
+        self.assertEqual(trace[0]['pid'], os.getpid())
+        self.assertLessEqual(trace[0]['ts'], trace[1]['ts'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            Profiler().write(os.devnull, 'xml')
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_off_by_default(self):
+        self.assertIsNone(active_profiler())
+        with phase('nothing', a=1) as args:
+            self.assertIsNone(args)
+        with layer_phase('layer', 'postgres', "host=db dbname='gis'") as args:
+            self.assertIsNone(args)
+
+    def test_profiling_writes_timings(self):
+        output_path = os.path.join(self.tmp_dir.name, 'timings.json')
+        with profiling.profiling(output_path) as profiler:
+            self.assertIs(active_profiler(), profiler)
+            with phase('QgsProject.read', path='a.qgz'):
+                with layer_phase('roads', 'postgres', "dbname='gis' host=db1 table=\"public\".\"roads\" (geom)"):
+                    pass
+        self.assertIsNone(active_profiler())
+        with open(output_path) as timings:
+            document = json.load(timings)
+        self.assertEqual(document['summary']['QgsProject.read']['count'], 1)
+        layer_event = [e for e in document['events'] if e['category'] == 'layer'][0]
+        self.assertEqual(layer_event['args'], {'provider': 'postgres', 'host': 'db1'})
+
+    def test_cprofile_hook(self):
+        stats_path = os.path.join(self.tmp_dir.name, 'build.prof')
+        with profiling.profiling(cprofile_path=stats_path):
+            sorted(range(1000), key=lambda x: -x)
+        self.assertGreater(pstats.Stats(stats_path).total_calls, 0)
+
+    def test_source_host(self):
+        self.assertEqual(source_host("service='cadastre' table=\"a\".\"b\"", 'postgres'), 'cadastre')
+        self.assertEqual(source_host('/data/roads.gpkg|layername=roads', 'ogr'), '/data/roads.gpkg')
+        self.assertEqual(source_host('layers=a&url=https://wms.example.com/wms', 'wms'), 'wms.example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,17 @@
 import unittest
 import os
+import tempfile
 import yaml
 from qgis.core import QgsApplication, QgsProject, QgsLayerTreeGroup, QgsVectorLayer, QgsVectorLayerJoinInfo
 from qgis_config_manager import create_dict_from_project_tree, extract_vector_layer_connection_info, \
-    create_project_tree_from_dict, get_vector_join_info_as_dict, make_join_from_dict
+    create_project_tree_from_dict, get_vector_join_info_as_dict, make_join_from_dict, open_project, \
+    check_layer_sources, update_project_tree_from_dict, iter_layer_tree, LayerCache, save_project_layers_style, \
+    apply_layer_styles, export_style_documents
+from tree_dict import LayerRecord, GroupRecord, iter_layer_dicts
+from qgs_writer import write_project_file, layer_id
+from qgis_session import QgisSession
+from style_store import StyleStore
+from tree_filter import TreeFilter
 
 TEST_PROJECT_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'test_project.qgz')
 TEST_YAML_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'data.yml')
@@ -11,17 +19,8 @@ TEST_YAML_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'data.yml'
 
 class TestConfigValuesExtraction(unittest.TestCase):
     def setUp(self):
-        # Link to the QGIS application
-        qgs = QgsApplication([], False)
-
-        # Supply path to qgis install location
-        qgs.setPrefixPath('/usr', True)
-
-        # Load providers
-        qgs.initQgis()
-
-        # Get the project instances
-        self.test_project = QgsProject.instance()
+        # Get the project instances from the shared QGIS session
+        self.test_project = QgisSession.instance().project()
         self.test_project.read(TEST_PROJECT_PATH)
         self.test_blank_project = QgsProject.instance()
 
@@ -66,6 +65,13 @@ class TestConfigValuesExtraction(unittest.TestCase):
     def test_create_tree_dict_from_project_is_dict(self):
         self.assertEqual(type(create_dict_from_project_tree(self.test_project)), dict)
 
+    def test_iter_layer_tree(self):
+        records = list(iter_layer_tree(self.test_project))
+        self.assertEqual(records[0], ((), GroupRecord('group1', True)))
+        layers = [(path, record.key) for path, record in records if isinstance(record, LayerRecord)]
+        self.assertIn((('group1', 'sub-group1', 'sub-group1'), 'label_part'), layers)
+        self.assertEqual(len(layers), len(self.test_project.mapLayers()))
+
     @unittest.expectedFailure
     def test_create_tree_dict_input_type(self):
         self.assertEqual(create_dict_from_project_tree(0), TypeError)
@@ -122,5 +128,317 @@ class TestConfigValuesExtraction(unittest.TestCase):
         self.assertEqual(join_object.targetFieldName(), 'id')
 
 
+class TestDeferredValidation(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.geojson_path = os.path.join(self.tmp_dir.name, 'points.geojson')
+        with open(self.geojson_path, 'w') as geojson:
+            geojson.write('{"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {"id": 1}, '
+                          '"geometry": {"type": "Point", "coordinates": [2600000, 1200000]}}]}')
+        self.missing_path = os.path.join(self.tmp_dir.name, 'missing.geojson')
+        self.tree_dict = {'group': {
+            'points': {'URI': self.geojson_path, 'NAME': 'points', 'PROVIDER': 'ogr', 'ISVISIBLE': True,
+                       'CRS': 'EPSG:2056', 'JOINS': {}},
+            'missing': {'URI': self.missing_path, 'NAME': 'missing', 'PROVIDER': 'ogr', 'ISVISIBLE': False,
+                        'CRS': 'EPSG:2056', 'JOINS': {}}}}
+        self.project = QgisSession.instance().project()
+
+    def tearDown(self):
+        self.project.clear()
+        self.tmp_dir.cleanup()
+
+    def test_check_layer_sources(self):
+        checked = check_layer_sources([('ogr', self.geojson_path), ('ogr', self.missing_path),
+                                       ('ogr', self.geojson_path)], max_workers=2)
+        self.assertEqual(checked, {('ogr', self.geojson_path): True, ('ogr', self.missing_path): False})
+
+    def test_deferred_build_reports_invalid_layers(self):
+        invalid = create_project_tree_from_dict(self.tree_dict, self.project, deferred_validation=True)
+        self.assertEqual([layer.name() for layer in invalid], ['missing'])
+        self.assertEqual(len(self.project.mapLayers()), 2)
+        self.assertEqual(len(self.project.layerTreeRoot().findGroup('group').children()), 2)
+
+    def test_immediate_build_reports_invalid_layers(self):
+        invalid = create_project_tree_from_dict(self.tree_dict, self.project)
+        self.assertEqual([layer.name() for layer in invalid], ['missing'])
+
+
+class TestLayerCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.geojson_path = os.path.join(self.tmp_dir.name, 'points.geojson')
+        with open(self.geojson_path, 'w') as geojson:
+            geojson.write('{"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {"id": 1}, '
+                          '"geometry": {"type": "Point", "coordinates": [2600000, 1200000]}}]}')
+        self.layer_dict = {'URI': self.geojson_path, 'NAME': 'points', 'PROVIDER': 'ogr', 'ISVISIBLE': True,
+                           'CRS': 'EPSG:2056', 'JOINS': {}}
+        self.project = QgisSession.instance().project()
+        self.cache = LayerCache()
+
+    def tearDown(self):
+        self.cache.release(self.project)
+        self.project.clear()
+        self.tmp_dir.cleanup()
+
+    def test_layers_are_reused_across_builds(self):
+        create_project_tree_from_dict({'points': self.layer_dict}, self.project, layer_cache=self.cache)
+        first = list(self.project.mapLayers().values())[0]
+        self.cache.release(self.project)
+        self.project.clear()
+
+        renamed = dict(self.layer_dict, NAME='renamed')
+        create_project_tree_from_dict({'group': {'points': renamed}}, self.project, layer_cache=self.cache)
+        second = list(self.project.mapLayers().values())[0]
+        self.assertIs(second, first)
+        self.assertEqual(second.name(), 'renamed')
+        self.assertEqual(len(self.cache), 1)
+
+    def test_same_source_twice_in_one_build(self):
+        create_project_tree_from_dict({'a': self.layer_dict, 'b': self.layer_dict}, self.project,
+                                      layer_cache=self.cache)
+        self.assertEqual(len(self.project.mapLayers()), 2)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_style_is_not_reused_by_another_target(self):
+        styled = QgsVectorLayer(self.geojson_path, 'points', 'ogr')
+        styled.setOpacity(0.25)
+        store = StyleStore(os.path.join(self.tmp_dir.name, 'styles'))
+        reference = store.put(export_style_documents([styled])[0])
+
+        create_project_tree_from_dict({'points': dict(self.layer_dict, STYLE=reference)}, self.project,
+                                      layer_cache=self.cache, style_store=store)
+        first = list(self.project.mapLayers().values())[0]
+        self.assertEqual(first.opacity(), 0.25)
+        self.cache.release(self.project)
+        self.project.clear()
+
+        create_project_tree_from_dict({'points': self.layer_dict}, self.project, layer_cache=self.cache,
+                                      style_store=store)
+        second = list(self.project.mapLayers().values())[0]
+        self.assertIsNot(second, first)
+        self.assertEqual(second.opacity(), 1.0)
+
+    def test_sources_are_checked_once(self):
+        self.assertEqual(self.cache.check_sources([('ogr', self.geojson_path)]), {('ogr', self.geojson_path): True})
+        os.remove(self.geojson_path)
+        self.assertTrue(self.cache.check_sources([('ogr', self.geojson_path)])[('ogr', self.geojson_path)])
+
+
+class TestLayerStyles(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = StyleStore(os.path.join(self.tmp_dir.name, 'styles'))
+        self.project = QgisSession.instance().project()
+        self.project.read(TEST_PROJECT_PATH)
+
+    def tearDown(self):
+        self.project.clear()
+        self.tmp_dir.cleanup()
+
+    def test_save_project_layers_style(self):
+        styles = save_project_layers_style(self.project, self.store)
+        self.assertEqual(set(styles), set(self.project.mapLayers()))
+        self.assertEqual(self.store.written, len(set(styles.values())))
+        save_project_layers_style(self.project, self.store)
+        self.assertEqual(self.store.written, len(set(styles.values())))
+
+    def test_styles_round_trip(self):
+        tree_dict = create_dict_from_project_tree(self.project, style_store=self.store)
+        layer_dicts = [layer for _, _, layer in iter_layer_dicts(tree_dict)]
+        self.assertTrue(all(layer['STYLE'] in self.store for layer in layer_dicts))
+
+        project = QgisSession.instance().project()
+        create_project_tree_from_dict(tree_dict, project, style_store=self.store)
+        rebuilt = create_dict_from_project_tree(project, style_store=self.store)
+        self.assertEqual([layer['STYLE'] for _, _, layer in iter_layer_dicts(rebuilt)],
+                         [layer['STYLE'] for layer in layer_dicts])
+
+    def test_missing_style_is_a_failure(self):
+        layers = list(self.project.mapLayers().values())
+        references = save_project_layers_style(self.project, self.store)
+        layer_styles = [(layer, references[layer.id()]) for layer in layers[1:]] + [(layers[0], '0' * 64)]
+        self.assertEqual(apply_layer_styles(layer_styles, self.store), [layers[0]])
+
+
+class TestJoinResolution(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tree_dict = {}
+        for name in ('points', 'labels'):
+            path = os.path.join(self.tmp_dir.name, name + '.geojson')
+            with open(path, 'w') as geojson:
+                geojson.write('{"type": "FeatureCollection", "features": [{"type": "Feature", "properties": '
+                              '{"id": 1, "name": "a"}, '
+                              '"geometry": {"type": "Point", "coordinates": [2600000, 1200000]}}]}')
+            self.tree_dict[name] = {'URI': path, 'NAME': name, 'PROVIDER': 'ogr', 'ISVISIBLE': True,
+                                    'CRS': 'EPSG:2056', 'JOINS': {}}
+        # the join points to the id the labels layer had in the project the tree comes from
+        self.tree_dict['points']['JOINS'][0] = {
+            'join_layer_id': layer_id('labels', ('labels',)), 'join_field_name': 'id', 'target_field_name': 'id',
+            'memory_cache': False, 'prefix': 'label_', 'field_subset': None}
+        self.project = QgisSession.instance().project()
+
+    def tearDown(self):
+        self.project.clear()
+        self.tmp_dir.cleanup()
+
+    def joins(self):
+        points = self.project.mapLayersByName('points')[0]
+        return points, points.vectorJoins()
+
+    def test_joins_are_remapped(self):
+        create_project_tree_from_dict(self.tree_dict, self.project)
+        points, joins = self.joins()
+        labels = self.project.mapLayersByName('labels')[0]
+        self.assertEqual(len(joins), 1)
+        self.assertEqual(joins[0].joinLayerId(), labels.id())
+        self.assertIs(joins[0].joinLayer(), labels)
+        self.assertIn('label_name', points.fields().names())
+
+    def test_unknown_memory_cache_policy(self):
+        with self.assertRaises(ValueError):
+            create_project_tree_from_dict(self.tree_dict, self.project, memory_cache='sometimes')
+        self.assertEqual(len(self.project.mapLayers()), 0)
+
+    def test_extracted_joins_have_hints(self):
+        create_project_tree_from_dict(self.tree_dict, self.project)
+        join_dict = get_vector_join_info_as_dict(self.joins()[0])[0]
+        self.assertEqual((join_dict['join_layer_uri'], join_dict['join_layer_name']),
+                         (self.tree_dict['labels']['URI'], 'labels'))
+
+    def test_joins_without_hints_are_unchanged(self):
+        create_project_tree_from_dict(self.tree_dict, self.project)
+        self.assertTrue(update_project_tree_from_dict(self.tree_dict, self.project).is_empty)
+
+    def test_memory_cache_policy(self):
+        create_project_tree_from_dict(self.tree_dict, self.project, memory_cache='auto')
+        self.assertTrue(self.joins()[1][0].isUsingMemoryCache())
+
+    def test_unresolved_join_is_skipped(self):
+        self.tree_dict['points']['JOINS'][0]['join_layer_id'] = 'unknown'
+        create_project_tree_from_dict(self.tree_dict, self.project)
+        self.assertEqual(self.joins()[1], [])
+
+
+class TestTreeFilter(unittest.TestCase):
+    def setUp(self):
+        self.project = QgisSession.instance().project()
+        memory = {'URI': 'Point?crs=EPSG:2056', 'PROVIDER': 'memory', 'ISVISIBLE': True, 'CRS': 'EPSG:2056',
+                  'JOINS': {}}
+        self.tree = {'keep': {'inner': {'a': dict(memory, NAME='a')}, 'empty': {}},
+                     'drop': {'b': dict(memory, NAME='b')}}
+        create_project_tree_from_dict(self.tree, self.project)
+
+    def tearDown(self):
+        self.project.clear()
+
+    def test_extraction(self):
+        tree = create_dict_from_project_tree(self.project, tree_filter=TreeFilter(include=['keep']))
+        self.assertEqual(list(tree), ['keep'])
+        self.assertEqual(list(tree['keep']), ['inner', 'empty'])
+        tree = create_dict_from_project_tree(self.project, tree_filter=TreeFilter(providers=['memory'],
+                                                                                  exclude=['keep']))
+        self.assertEqual(list(tree), ['drop'])
+
+    def test_iter_layer_tree_skips_emptied_groups(self):
+        records = list(iter_layer_tree(self.project, tree_filter=TreeFilter(predicate=lambda r: r.name == 'a')))
+        self.assertEqual([record.name for _, record in records], ['keep', 'inner', 'a'])
+
+    def test_build(self):
+        self.project.clear()
+        create_project_tree_from_dict(self.tree, self.project, tree_filter=TreeFilter(exclude=['keep']))
+        self.assertEqual([layer.name() for layer in self.project.mapLayers().values()], ['b'])
+
+
+class TestIncrementalUpdate(unittest.TestCase):
+    def setUp(self):
+        self.project = QgisSession.instance().project()
+        self.project.read(TEST_PROJECT_PATH)
+        self.tree_dict = create_dict_from_project_tree(self.project)
+
+    def tearDown(self):
+        self.project.clear()
+
+    def test_unchanged_tree_is_left_alone(self):
+        layers = dict(self.project.mapLayers())
+        diff = update_project_tree_from_dict(self.tree_dict, self.project)
+        self.assertTrue(diff.is_empty)
+        self.assertEqual(self.project.mapLayers(), layers)
+
+    def test_only_changes_are_applied(self):
+        layers = dict(self.project.mapLayers())
+        self.tree_dict['gaznat']['ISVISIBLE'] = False
+        del self.tree_dict['group1']['label_prc_point']
+        self.tree_dict['moved'] = {'label_part': self.tree_dict['group1']['sub-group1']['sub-group1'].pop('label_part')}
+        update_project_tree_from_dict(self.tree_dict, self.project)
+        QgsApplication.processEvents()                  # the layer tree bridge acts on the next event loop turn
+
+        self.assertEqual(create_dict_from_project_tree(self.project), self.tree_dict)
+        self.assertEqual(len(self.project.mapLayers()), len(layers) - 1)
+        for layer_id, layer in self.project.mapLayers().items():
+            self.assertIs(layer, layers[layer_id])
+
+
+    def test_styles_are_compared_without_writing(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = StyleStore(os.path.join(tmp_dir, 'styles'))
+            tree_dict = create_dict_from_project_tree(self.project, style_store=store)
+            store.written = store.skipped = 0
+            self.assertTrue(update_project_tree_from_dict(tree_dict, self.project, style_store=store).is_empty)
+            self.assertEqual((store.written, store.skipped), (0, 0))
+
+
+class TestOfflineProjectWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tree_dict = {'group': {'hidden': {}}}
+        for name, visible in (('points', True), ('others', False)):
+            path = os.path.join(self.tmp_dir.name, name + '.geojson')
+            with open(path, 'w') as geojson:
+                geojson.write('{"type": "FeatureCollection", "features": [{"type": "Feature", "properties": '
+                              '{"id": 1}, "geometry": {"type": "Point", "coordinates": [2600000, 1200000]}}]}')
+            self.tree_dict['group'][name] = {'URI': path, 'NAME': name, 'PROVIDER': 'ogr', 'ISVISIBLE': visible,
+                                             'CRS': 'EPSG:2056', 'JOINS': {}}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        project_path = os.path.join(self.tmp_dir.name, 'offline.qgz')
+        write_project_file(self.tree_dict, project_path, crs='EPSG:2056')
+        with open_project(project_path) as project:
+            self.assertEqual(project.crs().authid(), 'EPSG:2056')
+            self.assertTrue(all(layer.isValid() for layer in project.mapLayers().values()))
+            read_dict = create_dict_from_project_tree(project)
+        for layer_dict in read_dict['group'].values():
+            if layer_dict:
+                layer_dict['URI'] = layer_dict['URI'].split('|')[0]
+        self.assertEqual(read_dict, self.tree_dict)
+
+
+class TestQgisSession(unittest.TestCase):
+    def test_application_is_started_once(self):
+        session = QgisSession.instance()
+        self.assertIs(session, QgisSession.instance())
+        self.assertIs(session.start(), session.start())
+        self.assertIs(session.app, QgsApplication.instance())
+
+    def test_project_is_cleared(self):
+        project = QgisSession.instance().project()
+        project.read(TEST_PROJECT_PATH)
+        self.assertGreater(len(project.mapLayers()), 0)
+        self.assertEqual(len(QgisSession.instance().project().mapLayers()), 0)
+
+    def test_open_project_shares_session(self):
+        app = QgisSession.instance().start()
+        with open_project(TEST_PROJECT_PATH) as project:
+            self.assertIs(QgsApplication.instance(), app)
+            self.assertGreater(len(project.mapLayers()), 0)
+
+
+def tearDownModule():
+    QgisSession.instance().exit()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import zipfile
+import tempfile
+from qgs_writer import write_project_file, build_project_document, layer_id
+from qgz_reader import read_dict_from_project_file
+from style_store import StyleStore
+from tree_fixtures import layer
+
+
+class TestQgsWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tree_dict = {
+            'cadastre': {
+                'parcels': layer('parcels', 'postgres', joins={
+                    0: {'join_layer_id': 'owners_1', 'join_field_name': 'id', 'target_field_name': 'owner_id',
+                        'memory_cache': True, 'prefix': 'o_', 'field_subset': ['name', 'address']},
+                    1: {'join_layer_id': 'zones_2', 'join_field_name': 'id', 'target_field_name': 'zone_id',
+                        'memory_cache': False, 'prefix': '', 'field_subset': None}}),
+                'hidden': {'buildings': layer('buildings', visible=False)},
+                'empty': {},
+            },
+            'ortho': layer('ortho', 'wms'),
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_qgs_round_trip(self):
+        project_path = os.path.join(self.tmp_dir.name, 'project.qgs')
+        write_project_file(self.tree_dict, project_path, crs='EPSG:2056')
+        self.assertEqual(read_dict_from_project_file(project_path), self.tree_dict)
+
+    def test_qgz_round_trip(self):
+        project_path = os.path.join(self.tmp_dir.name, 'project.qgz')
+        write_project_file(self.tree_dict, project_path)
+        with zipfile.ZipFile(project_path) as archive:
+            self.assertEqual(archive.namelist(), ['project.qgs'])
+        self.assertEqual(read_dict_from_project_file(project_path), self.tree_dict)
+
+    def test_joins_point_to_the_new_ids(self):
+        self.tree_dict['cadastre']['owners'] = layer('owners', 'postgres')
+        joins = self.tree_dict['cadastre']['parcels']['JOINS']
+        joins[0]['join_layer_id'] = 'owners_0b0c4f3e_5a1d_4a3f_9d2e_0123456789ab'     # an id of another project
+        project_path = os.path.join(self.tmp_dir.name, 'project.qgs')
+        write_project_file(self.tree_dict, project_path)
+        joins = read_dict_from_project_file(project_path)['cadastre']['parcels']['JOINS']
+        self.assertEqual(joins[0]['join_layer_id'], layer_id('owners', ('cadastre', 'owners')))
+        self.assertEqual(joins[1]['join_layer_id'], 'zones_2')
+
+    def test_styles(self):
+        store = StyleStore(os.path.join(self.tmp_dir.name, 'styles'))
+        self.tree_dict['ortho']['STYLE'] = store.put('<!DOCTYPE qgis PUBLIC \'http://mrcc.com/qgis.dtd\' \'SYSTEM\'>\n'
+                                                     '<qgis version="3.22.0"><pipe><rasterrenderer opacity="0.5"/>'
+                                                     '</pipe><blendMode>0</blendMode></qgis>')
+        document = build_project_document(self.tree_dict, style_store=store)
+        maplayer = document.find('projectlayers/maplayer[id="{}"]'.format(layer_id('ortho', ('ortho',))))
+        self.assertEqual(maplayer.find('pipe/rasterrenderer').get('opacity'), '0.5')
+        self.assertEqual(maplayer.find('blendMode').text, '0')
+        self.assertIsNone(build_project_document(self.tree_dict).find('projectlayers/maplayer/pipe'))
+
+    def test_layer_ids_are_stable(self):
+        self.assertEqual(layer_id('my layer', ('a', 'b')), layer_id('my layer', ('a', 'b')))
+        self.assertNotEqual(layer_id('my layer', ('a', 'b')), layer_id('my layer', ('a', 'c')))
+        self.assertTrue(layer_id('my layer', ('a',)).startswith('my_layer_'))
+        self.assertTrue(layer_id('Gewässer', ('a',)).startswith('Gew_sser_'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import os
+import tempfile
+from qgz_reader import read_dict_from_project_file
+from tree_filter import TreeFilter
+
+TEST_PROJECT_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'test_project.qgz')
+
+TEST_QGS = """<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>
+<qgis version="3.22.0">
+  <layer-tree-group>
+    <layer-tree-group name="hidden" checked="Qt::Unchecked">
+      <layer-tree-layer name="roads" checked="Qt::Checked" providerKey="ogr" source="./roads.gpkg|layername=roads"
+                        id="roads_1"/>
+    </layer-tree-group>
+    <layer-tree-group name="empty" checked="Qt::Checked"/>
+    <layer-tree-layer name="parcels" checked="Qt::Checked" providerKey="postgres" source="" id="parcels_2"/>
+  </layer-tree-group>
+  <projectlayers>
+    <maplayer type="vector">
+      <id>parcels_2</id>
+      <datasource>dbname='cadastre' table="public"."parcels" (geom)</datasource>
+      <layername>parcels</layername>
+      <srs><spatialrefsys><authid>EPSG:2056</authid></spatialrefsys></srs>
+      <provider encoding="">postgres</provider>
+      <vectorjoins>
+        <join joinLayerId="roads_1" joinFieldName="id" targetFieldName="road_id" memoryCache="1"
+              hasCustomPrefix="1" customPrefix="r_">
+          <joinFieldsSubset><field name="width"/><field name="class"/></joinFieldsSubset>
+        </join>
+      </vectorjoins>
+    </maplayer>
+    <maplayer type="vector">
+      <id>roads_1</id>
+      <datasource>./roads.gpkg|layername=roads</datasource>
+      <layername>roads</layername>
+      <srs><spatialrefsys><authid>EPSG:2056</authid></spatialrefsys></srs>
+      <provider encoding="">ogr</provider>
+      <vectorjoins/>
+    </maplayer>
+  </projectlayers>
+  <this-is-not-well-formed>
+</qgis>
+"""
+
+
+class TestProjectFileReading(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.qgs_path = os.path.join(self.tmp_dir.name, 'project.qgs')
+        with open(self.qgs_path, 'w') as qgs:
+            qgs.write(TEST_QGS)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_output_is_dict(self):
+        self.assertEqual(type(read_dict_from_project_file(TEST_PROJECT_PATH)), dict)
+
+    def test_qgz_tree(self):
+        tree = read_dict_from_project_file(TEST_PROJECT_PATH)
+        self.assertEqual(list(tree.keys()), ['group1', 'gaznat'])
+        self.assertEqual(list(tree['group1']['sub-group1'].keys()),
+                         ['installation_chamber_polygon', 'installation_production', 'sub-group1'])
+        layer = tree['group1']['sub-group1']['sub-group1']['label_part']
+        self.assertEqual(layer['PROVIDER'], 'postgres')
+        self.assertEqual(layer['CRS'], 'EPSG:21781')
+        self.assertTrue(layer['ISVISIBLE'])
+        self.assertEqual(layer['JOINS'], {})
+
+    def test_layer_values(self):
+        tree = read_dict_from_project_file(self.qgs_path)
+        self.assertEqual(list(tree['parcels'].keys()), ['URI', 'NAME', 'PROVIDER', 'ISVISIBLE', 'CRS', 'JOINS'])
+        self.assertEqual(tree['parcels']['URI'], 'dbname=\'cadastre\' table="public"."parcels" (geom)')
+        self.assertEqual(tree['parcels']['CRS'], 'EPSG:2056')
+        self.assertEqual(tree['empty'], {})
+
+    def test_visibility_follows_parents(self):
+        tree = read_dict_from_project_file(self.qgs_path)
+        self.assertFalse(tree['hidden']['roads']['ISVISIBLE'])
+        self.assertTrue(tree['parcels']['ISVISIBLE'])
+
+    def test_relative_path_is_resolved(self):
+        tree = read_dict_from_project_file(self.qgs_path)
+        self.assertEqual(tree['hidden']['roads']['URI'],
+                         os.path.join(self.tmp_dir.name, 'roads.gpkg') + '|layername=roads')
+
+    def test_joins(self):
+        tree = read_dict_from_project_file(self.qgs_path)
+        self.assertEqual(tree['parcels']['JOINS'], {0: {'join_layer_id': 'roads_1', 'join_field_name': 'id',
+                                                        'target_field_name': 'road_id', 'memory_cache': True,
+                                                        'prefix': 'r_', 'field_subset': ['width', 'class'],
+                                                        'join_layer_uri': tree['hidden']['roads']['URI'],
+                                                        'join_layer_name': 'roads'}})
+
+    def test_join_hints_of_filtered_layers(self):
+        tree = read_dict_from_project_file(self.qgs_path, TreeFilter(exclude=['hidden']))
+        self.assertEqual(tree['parcels']['JOINS'][0]['join_layer_uri'],
+                         os.path.join(self.tmp_dir.name, 'roads.gpkg') + '|layername=roads')
+
+    def test_filtered_by_path(self):
+        tree = read_dict_from_project_file(self.qgs_path, TreeFilter(include=['hidden'], exclude=['empty']))
+        self.assertEqual(list(tree.keys()), ['hidden'])
+        self.assertEqual(tree['hidden']['roads']['CRS'], 'EPSG:2056')
+
+    def test_filtered_by_provider(self):
+        tree = read_dict_from_project_file(self.qgs_path, TreeFilter(providers=['postgres']))
+        self.assertEqual(list(tree.keys()), ['parcels'])
+
+    def test_fails_on_bad_path(self):
+        with self.assertRaises(FileNotFoundError):
+            read_dict_from_project_file('a-very_b@d-path/project.qgz')
+
+
+if __name__ == '__main__':
+    unittest.main()
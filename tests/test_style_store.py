@@ -0,0 +1,68 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+from style_store import StyleStore, default_style_dir
+
+QML = "<!DOCTYPE qgis PUBLIC 'http://mrcc.com/qgis.dtd' 'SYSTEM'>\n<qgis version=\"3.22.0\"><renderer-v2/></qgis>\n"
+
+
+class TestStyleStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.store = StyleStore(os.path.join(self.tmp_dir.name, 'styles'))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_put_and_get(self):
+        reference = self.store.put(QML)
+        self.assertEqual(reference, StyleStore.reference(QML.encode('utf-8')))
+        self.assertIn(reference, self.store)
+        self.assertEqual(self.store.get(reference), QML)
+        self.assertTrue(self.store.path(reference).startswith(os.path.join(self.store.root, reference[:2])))
+
+    def test_unchanged_style_is_not_written(self):
+        reference = self.store.put(QML)
+        mtime = os.stat(self.store.path(reference)).st_mtime_ns
+        self.assertEqual(self.store.put(QML), reference)
+        self.assertEqual((self.store.written, self.store.skipped), (1, 1))
+        self.assertEqual(os.stat(self.store.path(reference)).st_mtime_ns, mtime)
+
+    def test_failed_write_leaves_no_file(self):
+        reference = StyleStore.reference(QML)
+        with mock.patch('style_store.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.store.put(QML)
+        self.assertEqual(os.listdir(os.path.dirname(self.store.path(reference))), [])
+        self.assertNotIn(reference, self.store)
+        self.assertEqual(self.store.written, 0)
+
+    def test_put_many_deduplicates(self):
+        other = QML.replace('renderer-v2', 'renderer-v3')
+        references = self.store.put_many([QML, other, QML, QML, other], max_workers=4)
+        self.assertEqual(references[0], references[2])
+        self.assertNotEqual(references[0], references[1])
+        self.assertEqual(self.store.written, 2)
+        files = [f for _, _, names in os.walk(self.store.root) for f in names]
+        self.assertEqual(len(files), 2)
+
+    def test_get_many(self):
+        reference = self.store.put(QML)
+        self.assertEqual(self.store.get_many([reference, reference]), {reference: QML})
+        with self.assertRaises(FileNotFoundError):
+            self.store.get('0' * 64)
+        with self.assertRaises(FileNotFoundError):
+            self.store.get_many([reference, '0' * 64])
+        self.assertEqual(self.store.get_many([reference, '0' * 64], missing_ok=True), {reference: QML})
+
+    def test_default_style_dir(self):
+        config_path = os.path.join(self.tmp_dir.name, 'configs', 'tree.yml')
+        with mock.patch.dict(os.environ, {'QGIS_PROJECT_BUILDER_STYLES': ''}):
+            self.assertEqual(default_style_dir(config_path), os.path.join(self.tmp_dir.name, 'configs', 'styles'))
+        with mock.patch.dict(os.environ, {'QGIS_PROJECT_BUILDER_STYLES': '/srv/styles'}):
+            self.assertEqual(default_style_dir(config_path), '/srv/styles')
+
+
+if __name__ == '__main__':
+    unittest.main()
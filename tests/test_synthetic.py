@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+import tempfile
+from tree_dict import iter_layer_dicts
+from qgs_writer import layer_id
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+
+from synthetic import make_tree, parse_providers     # noqa: E402
+
+
+class TestParseProviders(unittest.TestCase):
+    def test_weights(self):
+        self.assertEqual(parse_providers('memory=2, ogr=1,postgres'), {'memory': 2.0, 'ogr': 1.0, 'postgres': 1.0})
+
+    def test_unknown_provider(self):
+        with self.assertRaisesRegex(ValueError, 'shapefile'):
+            parse_providers('memory=1,shapefile=2')
+
+
+class TestMakeTree(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_shape(self):
+        layers = list(iter_layer_dicts(make_tree(25, depth=2, fan_out=3)))
+        self.assertEqual(len(layers), 25)
+        self.assertEqual({len(group_path) for group_path, _, _ in layers}, {2})
+        self.assertEqual(len({group_path for group_path, _, _ in layers}), 9)
+        self.assertEqual({layer['PROVIDER'] for _, _, layer in layers}, {'memory'})
+
+    def test_flat_tree(self):
+        tree_dict = make_tree(5, depth=0)
+        self.assertEqual(list(tree_dict), ['layer_{}'.format(i) for i in range(5)])
+
+    def test_provider_mix(self):
+        providers = {'ogr': 1, 'postgres': 1}
+        tree_dict = make_tree(40, providers=providers, data_dir=self.tmp_dir.name, seed=3)
+        layers = [layer for _, _, layer in iter_layer_dicts(tree_dict)]
+        self.assertEqual({layer['PROVIDER'] for layer in layers}, {'ogr', 'postgres'})
+        self.assertTrue(all(os.path.exists(layer['URI']) for layer in layers if layer['PROVIDER'] == 'ogr'))
+        self.assertEqual(make_tree(40, providers=providers, data_dir=self.tmp_dir.name, seed=3), tree_dict)
+
+    def test_ogr_needs_data_dir(self):
+        with self.assertRaises(ValueError):
+            make_tree(10, providers={'ogr': 1})
+
+    def test_joins(self):
+        layers = list(iter_layer_dicts(make_tree(10, depth=1, fan_out=2, join_count=15)))
+        ids = {layer_id(layer['NAME'], group_path + (key,)) for group_path, key, layer in layers}
+        joins = [join for _, _, layer in layers for join in layer['JOINS'].values()]
+        self.assertEqual(len(joins), 15)
+        self.assertTrue(all(join['join_layer_id'] in ids for join in joins))
+
+
+if __name__ == '__main__':
+    unittest.main()
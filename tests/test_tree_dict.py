@@ -0,0 +1,61 @@
+import unittest
+from tree_dict import is_layer_dict, iter_layer_dicts, iter_tree_dict, tree_dict_from_records, LayerRecord, \
+    GroupRecord
+from tree_fixtures import layer
+
+
+class TestTreeDict(unittest.TestCase):
+    def setUp(self):
+        self.tree_dict = {
+            'cadastre': {'parcels': layer('parcels'), 'empty': {}, 'water': {'pipes': layer('pipes')}},
+            'roads': layer('roads'),
+        }
+
+    def test_is_layer_dict(self):
+        self.assertTrue(is_layer_dict(layer('roads')))
+        self.assertFalse(is_layer_dict({'roads': layer('roads')}))
+        self.assertFalse(is_layer_dict('finalgroup'))
+        self.assertTrue(is_layer_dict(dict(layer('roads'), STYLE='0a1b')))
+        self.assertFalse(is_layer_dict(dict(layer('roads'), COLOR='red')))
+        self.assertFalse(is_layer_dict({'STYLE': '0a1b'}))
+
+    def test_iter_layer_dicts(self):
+        self.assertEqual([(p, k) for p, k, _ in iter_layer_dicts(self.tree_dict)],
+                         [(('cadastre',), 'parcels'), (('cadastre', 'water'), 'pipes'), ((), 'roads')])
+
+    def test_iter_tree_dict(self):
+        records = list(iter_tree_dict(self.tree_dict))
+        self.assertEqual([(p, type(r).__name__, r.key) for p, r in records],
+                         [((), 'GroupRecord', 'cadastre'), (('cadastre',), 'LayerRecord', 'parcels'),
+                          (('cadastre',), 'GroupRecord', 'empty'), (('cadastre',), 'GroupRecord', 'water'),
+                          (('cadastre', 'water'), 'LayerRecord', 'pipes'), ((), 'LayerRecord', 'roads')])
+        self.assertEqual(records[1][1].uri, '/data/parcels.gpkg')
+
+    def test_iter_tree_dict_is_lazy(self):
+        records = iter_tree_dict(self.tree_dict)
+        self.assertEqual(next(records), ((), GroupRecord('cadastre', True)))
+
+    def test_tree_dict_from_records(self):
+        self.assertEqual(tree_dict_from_records(iter_tree_dict(self.tree_dict)), self.tree_dict)
+
+    def test_tree_dict_from_records_keys(self):
+        tree_dict = tree_dict_from_records(iter_tree_dict(self.tree_dict), keys=('NAME', 'CRS'))
+        self.assertEqual(tree_dict['roads'], {'NAME': 'roads', 'CRS': 'EPSG:2056'})
+
+    def test_layer_record(self):
+        record = LayerRecord.from_dict('roads', layer('roads'))
+        self.assertEqual(record.to_dict(), layer('roads'))
+        self.assertEqual(list(record.to_dict()), ['URI', 'NAME', 'PROVIDER', 'ISVISIBLE', 'CRS', 'JOINS'])
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_layer_record_style(self):
+        styled = dict(layer('roads'), STYLE='0a1b')
+        record = LayerRecord.from_dict('roads', styled)
+        self.assertEqual(record.style, '0a1b')
+        self.assertEqual(record.to_dict(), styled)
+        self.assertEqual(record.to_dict(keys=('NAME', 'STYLE')), {'NAME': 'roads', 'STYLE': '0a1b'})
+        self.assertIsNone(LayerRecord.from_dict('roads', layer('roads')).style)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import copy
+from tree_diff import diff_trees, flatten_tree_dict
+from tree_fixtures import layer
+
+
+class TestTreeDiff(unittest.TestCase):
+    def setUp(self):
+        self.old_tree = {
+            'cadastre': {'parcels': layer('parcels'), 'buildings': layer('buildings')},
+            'network': {'water': {'pipes': layer('pipes'), 'valves': layer('valves')}},
+            'roads': layer('roads'),
+        }
+        self.new_tree = copy.deepcopy(self.old_tree)
+
+    def test_flatten(self):
+        groups, layers = flatten_tree_dict({'group': {'subgroup': 'finalgroup'}, 'roads': layer('roads')})
+        self.assertEqual(list(groups), [('group',), ('group', 'subgroup'), ('group', 'finalgroup')])
+        self.assertEqual(list(layers), [('roads',)])
+
+    def test_identical_trees(self):
+        self.assertTrue(diff_trees(self.old_tree, self.new_tree).is_empty)
+
+    def test_added_and_removed(self):
+        del self.new_tree['cadastre']['buildings']
+        self.new_tree['imagery'] = {'ortho': layer('ortho')}
+        diff = diff_trees(self.old_tree, self.new_tree)
+        self.assertEqual(diff.removed_layers, [('cadastre', 'buildings')])
+        self.assertEqual(diff.added_groups, [('imagery',)])
+        self.assertEqual(diff.added_layers, [('imagery', 'ortho')])
+        self.assertEqual(diff.changed_layers, [])
+
+    def test_changed_fields(self):
+        self.new_tree['roads']['ISVISIBLE'] = False
+        self.new_tree['cadastre']['parcels']['CRS'] = 'EPSG:21781'
+        self.new_tree['cadastre']['parcels']['URI'] = '/data/parcels_v2.gpkg'
+        diff = diff_trees(self.old_tree, self.new_tree)
+        self.assertEqual(diff.changed_layers, [(('cadastre', 'parcels'), ['URI', 'CRS']), (('roads',), ['ISVISIBLE'])])
+        self.assertEqual(diff.added_layers, [])
+
+    def test_changed_style(self):
+        self.old_tree['roads']['STYLE'] = 'a' * 64
+        self.new_tree['roads']['STYLE'] = 'b' * 64
+        self.assertEqual(diff_trees(self.old_tree, self.new_tree).changed_layers, [(('roads',), ['STYLE'])])
+        self.assertTrue(diff_trees(self.old_tree, self.new_tree, ('URI', 'NAME')).is_empty)
+
+    def test_joins_are_compared_by_target(self):
+        join = {'join_field_name': 'id', 'target_field_name': 'road_id', 'memory_cache': False, 'prefix': '',
+                'field_subset': None}
+        self.old_tree['cadastre']['parcels']['JOINS'] = {0: dict(join, join_layer_id='roads_in_project',
+                                                                 join_layer_uri='/data/roads.gpkg',
+                                                                 join_layer_name='roads')}
+        old_ids = {('roads',): 'roads_in_project'}
+        self.new_tree['cadastre']['parcels']['JOINS'] = {
+            0: dict(join, join_layer_id='roads_0b0c4f3e_5a1d_4a3f_9d2e_0123456789ab')}
+        self.assertTrue(diff_trees(self.old_tree, self.new_tree, old_ids=old_ids).is_empty)
+        self.new_tree['cadastre']['parcels']['JOINS'][0]['join_layer_id'] = 'pipes_0b0c4f3e_5a1d_4a3f_9d2e_0123456789ab'
+        self.assertEqual(diff_trees(self.old_tree, self.new_tree, old_ids=old_ids).changed_layers,
+                         [(('cadastre', 'parcels'), ['JOINS'])])
+
+    def test_moved_layer(self):
+        self.new_tree['cadastre']['roads'] = self.new_tree.pop('roads')
+        diff = diff_trees(self.old_tree, self.new_tree)
+        self.assertEqual(diff.moved_layers, [(('roads',), ('cadastre', 'roads'))])
+        self.assertEqual(diff.added_layers, [])
+        self.assertEqual(diff.removed_layers, [])
+
+    def test_moved_group(self):
+        self.new_tree['water'] = self.new_tree['network'].pop('water')
+        diff = diff_trees(self.old_tree, self.new_tree)
+        self.assertEqual(diff.moved_groups, [(('network', 'water'), ('water',))])
+        self.assertEqual(sorted(diff.moved_layers), [(('network', 'water', 'pipes'), ('water', 'pipes')),
+                                                     (('network', 'water', 'valves'), ('water', 'valves'))])
+        self.assertEqual(diff.removed_layers, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
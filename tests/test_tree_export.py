@@ -0,0 +1,86 @@
+import unittest
+import os
+import json
+import tempfile
+import importlib.util
+import yaml
+from tree_export import export_tree, iter_tree_entries, tree_dict_from_entries, read_tree_entries
+from tree_fixtures import layer
+
+TEST_YAML_PATH = os.path.join(os.path.dirname(__file__), 'test_data', 'test_yaml.yml')
+
+
+class TestTreeExport(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.tree_dict = {
+            'cadastre': {
+                'parcels': layer('parcels', joins={0: {'join_layer_id': 'owners_1', 'join_field_name': 'id',
+                                                       'target_field_name': 'owner_id', 'memory_cache': True,
+                                                       'prefix': '', 'field_subset': None}}),
+                'empty': {},
+                'subgroup': 'finalgroup',
+            },
+            'roads': layer('roads'),
+            'yes': layer('no'),
+        }
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_yaml_loads_identically(self):
+        output_path = os.path.join(self.tmp_dir.name, 'tree.yml')
+        export_tree(self.tree_dict.items(), output_path)
+        with open(output_path) as yml:
+            self.assertEqual(yaml.safe_load(yml), self.tree_dict)
+
+    def test_yaml_from_lazy_items(self):
+        def lazy(tree):
+            for key, value in tree.items():
+                yield key, lazy(value) if isinstance(value, dict) and 'URI' not in value else value
+        output_path = os.path.join(self.tmp_dir.name, 'tree.yml')
+        export_tree(lazy(self.tree_dict), output_path)
+        with open(output_path) as yml:
+            self.assertEqual(yaml.safe_load(yml), self.tree_dict)
+
+    def test_yaml_of_any_config(self):
+        with open(TEST_YAML_PATH) as yml:
+            conf = yaml.safe_load(yml)
+        output_path = os.path.join(self.tmp_dir.name, 'conf.yml')
+        export_tree(conf.items(), output_path)
+        with open(output_path) as yml:
+            self.assertEqual(yaml.safe_load(yml), conf)
+
+    def test_entries(self):
+        entries = list(iter_tree_entries(self.tree_dict.items()))
+        self.assertEqual([(e['type'], e['path']) for e in entries[:4]],
+                         [('group', ['cadastre']), ('layer', ['cadastre', 'parcels']), ('group', ['cadastre', 'empty']),
+                          ('value', ['cadastre', 'subgroup'])])
+        self.assertEqual(tree_dict_from_entries(entries), self.tree_dict)
+
+    def test_jsonl(self):
+        output_path = os.path.join(self.tmp_dir.name, 'tree.jsonl')
+        export_tree(self.tree_dict.items(), output_path, 'jsonl')
+        with open(output_path) as jsonl:
+            entries = [json.loads(line) for line in jsonl]
+        self.assertEqual(len(entries), 6)
+        self.assertEqual(entries[-1], {'type': 'layer', 'path': ['yes'], 'layer': layer('no')})
+        self.assertEqual(list(read_tree_entries(output_path)), entries)
+        self.assertEqual(tree_dict_from_entries(entries), self.tree_dict)
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack is not installed')
+    def test_msgpack(self):
+        output_path = os.path.join(self.tmp_dir.name, 'tree.msgpack')
+        export_tree(self.tree_dict.items(), output_path, 'msgpack')
+        entries = list(read_tree_entries(output_path, 'msgpack'))
+        self.assertEqual(len(entries), 6)
+        self.assertEqual(entries[1]['layer']['JOINS'], {'0': self.tree_dict['cadastre']['parcels']['JOINS'][0]})
+        self.assertEqual(tree_dict_from_entries(entries), self.tree_dict)
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_tree(self.tree_dict.items(), os.path.join(self.tmp_dir.name, 'tree.xml'), 'xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
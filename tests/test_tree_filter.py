@@ -0,0 +1,96 @@
+import unittest
+import argparse
+from tree_filter import TreeFilter, filter_tree_dict, add_filter_arguments, filter_from_args
+from tree_fixtures import layer
+
+
+TREE = {
+    'Cadastre': {
+        'parcels': layer('parcels', 'postgres'),
+        'archive': {'old_parcels': layer('old_parcels', 'postgres', visible=False)},
+        'buildings': {'footprints': layer('footprints', crs='EPSG:21781')},
+    },
+    'Network': {
+        'water': {'pipes': layer('pipes', 'postgres')},
+        'empty': {},
+    },
+    'background': layer('background', 'wms'),
+    'deep': 'item',
+}
+
+
+class WalkCountingDict(dict):
+    """
+    A dictionary counting the calls to items, to check which branches a filter visits.
+    """
+    visits = 0
+
+    def items(self):
+        WalkCountingDict.visits += 1
+        return super().items()
+
+
+class TestTreeFilter(unittest.TestCase):
+    def test_no_filter_keeps_everything(self):
+        self.assertEqual(filter_tree_dict(TREE, TreeFilter()), TREE)
+
+    def test_include(self):
+        tree = filter_tree_dict(TREE, TreeFilter(include=['Cadastre/*']))
+        self.assertEqual(list(tree), ['Cadastre'])
+        self.assertEqual(list(tree['Cadastre']), ['parcels', 'archive', 'buildings'])
+        self.assertIs(tree['Cadastre']['parcels'], TREE['Cadastre']['parcels'])
+
+    def test_include_deep_glob(self):
+        tree = filter_tree_dict(TREE, TreeFilter(include=['**/pipes', 'back*']))
+        self.assertEqual(tree, {'Network': {'water': {'pipes': TREE['Network']['water']['pipes']}},
+                                'background': TREE['background']})
+
+    def test_exclude_prunes_subtree(self):
+        tree = filter_tree_dict(TREE, TreeFilter(include=['Cadastre'], exclude=['Cadastre/archive']))
+        self.assertEqual(list(tree['Cadastre']), ['parcels', 'buildings'])
+
+    def test_empty_groups(self):
+        self.assertEqual(filter_tree_dict(TREE, TreeFilter(include=['Network/empty'])), {'Network': {'empty': {}}})
+        self.assertEqual(filter_tree_dict(TREE, TreeFilter(include=['deep'])), {'deep': {}})
+        self.assertEqual(filter_tree_dict(TREE, TreeFilter(include=['item'])), {'item': {}})
+        self.assertEqual(filter_tree_dict(TREE, TreeFilter(exclude=['Cadastre', 'Network', 'background'])),
+                         {'deep': 'item'})
+
+    def test_layer_predicates(self):
+        tree = filter_tree_dict(TREE, TreeFilter(providers=['postgres'], visible=True))
+        self.assertEqual(tree, {'Cadastre': {'parcels': TREE['Cadastre']['parcels']},
+                                'Network': {'water': {'pipes': TREE['Network']['water']['pipes']}}})
+        tree = filter_tree_dict(TREE, TreeFilter(crs=['EPSG:21781']))
+        self.assertEqual(list(tree), ['Cadastre'])
+        tree = filter_tree_dict(TREE, TreeFilter(predicate=lambda layer: layer['NAME'].startswith('b')))
+        self.assertEqual(list(tree), ['background'])
+
+    def test_pruned_branches_are_not_visited(self):
+        tree = {'a': WalkCountingDict(b=WalkCountingDict(c=layer('c'))), 'd': WalkCountingDict(e=layer('e'))}
+        WalkCountingDict.visits = 0
+        filter_tree_dict(tree, TreeFilter(include=['d/*']))
+        self.assertEqual(WalkCountingDict.visits, 1)
+        WalkCountingDict.visits = 0
+        filter_tree_dict(tree, TreeFilter(exclude=['a']))
+        self.assertEqual(WalkCountingDict.visits, 1)
+
+    def test_visit_group(self):
+        tree_filter = TreeFilter(include=['a/b*/c'])
+        self.assertTrue(tree_filter.visit_group(('a',)))
+        self.assertTrue(tree_filter.visit_group(('a', 'bar')))
+        self.assertFalse(tree_filter.visit_group(('a', 'x')))
+        self.assertFalse(tree_filter.accepts_path(('a', 'bar')))
+        self.assertTrue(tree_filter.accepts_path(('a', 'bar', 'c', 'd')))
+
+    def test_arguments(self):
+        parser = argparse.ArgumentParser()
+        add_filter_arguments(parser)
+        self.assertIsNone(filter_from_args(parser.parse_args([])))
+        tree_filter = filter_from_args(parser.parse_args(['--include', 'Cadastre', '--provider', 'ogr', '--hidden']))
+        self.assertEqual(filter_tree_dict(TREE, tree_filter), {})
+        tree_filter = filter_from_args(parser.parse_args(['--include', 'Cadastre', '--crs', 'EPSG:21781']))
+        self.assertEqual(list(filter_tree_dict(TREE, tree_filter)['Cadastre']), ['buildings'])
+
+
+if __name__ == '__main__':
+    unittest.main()
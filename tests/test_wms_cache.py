@@ -0,0 +1,125 @@
+import unittest
+import os
+import tempfile
+import threading
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from wms_cache import CapabilitiesCache, capabilities_url, capabilities_key, is_wms_source
+from tree_fixtures import layer
+
+CAPABILITIES = b'<WMS_Capabilities version="1.3.0"/>'
+
+
+class CapabilitiesHandler(BaseHTTPRequestHandler):
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.end_headers()
+        self.wfile.write(CAPABILITIES)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCapabilitiesUrl(unittest.TestCase):
+    def test_url_without_query(self):
+        self.assertEqual(capabilities_url('crs=EPSG:2056&layers=a&url=https://host/wms'),
+                         'https://host/wms?SERVICE=WMS&REQUEST=GetCapabilities')
+
+    def test_url_with_query(self):
+        self.assertEqual(capabilities_url('layers=a&url=https://host/wms?map%3D/a.map'),
+                         'https://host/wms?map=/a.map&SERVICE=WMS&REQUEST=GetCapabilities')
+
+    def test_key_ignores_layer_parameters(self):
+        self.assertEqual(capabilities_key('layers=a&styles=&url=https://host/wms'),
+                         capabilities_key('layers=b&format=image/png&url=https://host/wms'))
+        self.assertNotEqual(capabilities_key('referer=x&url=https://host/wms'),
+                            capabilities_key('url=https://host/wms'))
+
+    def test_uri_without_url(self):
+        self.assertIsNone(capabilities_url('crs=EPSG:2056&layers=a'))
+        self.assertIsNone(capabilities_key('crs=EPSG:2056&layers=a'))
+
+    def test_tile_sources(self):
+        self.assertTrue(is_wms_source('layers=a&url=https://host/wms'))
+        self.assertFalse(is_wms_source('type=xyz&url=https://tiles.example.org/{z}/{x}/{y}.png'))
+        self.assertFalse(is_wms_source('layers=a&tileMatrixSet=2056&url=https://host/wmts'))
+
+
+class TestCapabilitiesCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, 'wms')
+        CapabilitiesHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), CapabilitiesHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.uris = ['layers=a&url={}/wms'.format(base), 'layers=b&url={}/wms'.format(base),
+                     'layers=c&url={}/other'.format(base)]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_one_fetch_per_endpoint(self):
+        cache = CapabilitiesCache(self.root)
+        documents = cache.prefetch(self.uris)
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(set(documents.values()), {CAPABILITIES})
+        self.assertEqual(sorted(CapabilitiesHandler.requests),
+                         ['/other?SERVICE=WMS&REQUEST=GetCapabilities', '/wms?SERVICE=WMS&REQUEST=GetCapabilities'])
+
+    def test_warm_cache_does_not_fetch(self):
+        CapabilitiesCache(self.root).prefetch(self.uris)
+        cache = CapabilitiesCache(self.root)
+        self.assertEqual(len(cache.prefetch(self.uris)), 2)
+        self.assertEqual(cache.fetch_count, 0)
+
+    def test_expired_entries_are_fetched_again(self):
+        CapabilitiesCache(self.root).prefetch(self.uris)
+        cache = CapabilitiesCache(self.root, ttl=0)
+        cache.prefetch(self.uris)
+        self.assertEqual(cache.fetch_count, 2)
+
+    def test_replay_when_server_is_down(self):
+        CapabilitiesCache(self.root).get(self.uris[0])
+        self.server.shutdown()
+        self.server.server_close()
+        with mock.patch('builtins.print'):
+            self.assertEqual(CapabilitiesCache(self.root, ttl=0, timeout=1).get(self.uris[0]), CAPABILITIES)
+            self.assertIsNone(CapabilitiesCache(self.root, timeout=1).get(self.uris[2]))
+
+    def test_offline(self):
+        CapabilitiesCache(self.root).get(self.uris[0])
+        cache = CapabilitiesCache(self.root, ttl=0, offline=True)
+        self.assertEqual(cache.prefetch(self.uris), {capabilities_url(self.uris[0]): CAPABILITIES})
+        self.assertEqual(cache.fetch_count, 0)
+        self.assertEqual(len(CapabilitiesHandler.requests), 1)
+
+    def test_prime_tree_skips_sources_without_capabilities(self):
+        base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        tree_dict = {'ortho': layer('ortho', 'wms', self.uris[0]),
+                     'tiles': layer('tiles', 'wms', 'type=xyz&url={}/tiles/{{z}}/{{x}}/{{y}}.png'.format(base)),
+                     'wmts': layer('wmts', 'wms', 'layers=a&tileMatrixSet=2056&url={}/wmts'.format(base)),
+                     'nourl': layer('nourl', 'wms', 'crs=EPSG:2056&layers=a'),
+                     'roads': layer('roads')}
+        with mock.patch('wms_cache.seed_network_cache') as seed:
+            documents = CapabilitiesCache(self.root).prime_tree(tree_dict)
+        self.assertEqual(documents, {capabilities_url(self.uris[0]): CAPABILITIES})
+        seed.assert_called_once()
+        self.assertEqual(CapabilitiesHandler.requests, ['/wms?SERVICE=WMS&REQUEST=GetCapabilities'])
+
+    def test_uri_without_url_is_not_fetched(self):
+        cache = CapabilitiesCache(self.root)
+        self.assertIsNone(cache.get('crs=EPSG:2056&layers=a'))
+        self.assertEqual(cache.prefetch(['crs=EPSG:2056&layers=a', self.uris[0]]),
+                         {capabilities_url(self.uris[0]): CAPABILITIES})
+        self.assertEqual(cache.fetch_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
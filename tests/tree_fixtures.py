@@ -0,0 +1,19 @@
+"""
+Layer dictionaries shared by the tests of the layer tree modules.
+"""
+
+
+def layer(name, provider='ogr', uri=None, visible=True, crs='EPSG:2056', joins=None, **values):
+    """
+    Create a layer dictionary of the tree. The uri defaults to a source of the provider named after the layer.
+    :param values: other keys of the layer dictionary, e.g. STYLE, replacing the ones above if given
+    """
+    if uri is None:
+        if provider == 'postgres':
+            uri = "dbname='gis' host=db table=\"public\".\"{}\" (geom)".format(name)
+        elif provider == 'wms':
+            uri = 'crs=EPSG:2056&format=image/png&layers={}&styles&url=https://wms.example.org/wms'.format(name)
+        else:
+            uri = '/data/{}.gpkg'.format(name)
+    return dict({'URI': uri, 'NAME': name, 'PROVIDER': provider, 'ISVISIBLE': visible, 'CRS': crs,
+                 'JOINS': joins or {}}, **values)